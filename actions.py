@@ -14,18 +14,34 @@
 # limitations under the License.
 
 import sys
-import datetime
+import math
+import time
+import random
+import subprocess
 from abc import ABCMeta, abstractmethod, abstractproperty
-from collections import deque
-from subprocess import call
-from base import *
+from convergence import SteadyStateDetector
+from clock import monotonic
+from itertools import islice
+from threading import Thread, Condition
+from prefixes import peer_paths, count_paths, ip2int
+from control import ControlChannel, route_command, teardown_command
+from impair import tester_impairments
 
 def rm_line():
     print '\x1b[1A\x1b[2K\x1b[1D\x1b[1A'
 
+# Actions are driven by the Sequencer: every sample of the benchmark is passed to
+# notify() and has_finished() of the actions with samples set, time based actions
+# set timeout (seconds) and expire() is called by the sequencer once it has passed
+# since their start.
 class Action:
     __metaclass__ = ABCMeta
     type = str()
+    timeout = None
+    samples = True
+
+    def expire(self):
+        self.finished.set()
 
     @abstractmethod
     def notify(self, data):    # data is a tuple of elapsed, cpu, mem, recved
@@ -36,140 +52,353 @@ class Action:
         pass
 
 
+# Finishes once the target is in steady state (see convergence.py). cpu_threshold
+# and routes are optional, confidence is the number of samples in the window.
 class WaitConvergentAction(Action):
-    def __init__(self, cpu_threshold, routes, confidence, queue, finished):
+    def __init__(self, cpu_threshold, routes, confidence, queue, finished, tolerance=None, cpu_stdev=None):
         self.type = 'wait_convergent'
         self.cpu_threshold = cpu_threshold
         self.routes = routes
-        self.history = deque(maxlen = confidence)    # create a fixed size queue to store the last confidence entries
+        kwargs = {}
+        if tolerance is not None:
+            kwargs['route_tolerance'] = tolerance
+        if cpu_stdev is not None:
+            kwargs['cpu_stdev'] = cpu_stdev
+        self.detector = SteadyStateDetector(confidence if confidence else 5, cpu_threshold, routes, **kwargs)
         self.queue = queue
         self.finished = finished
-        self.start = datetime.datetime.now()
+        self.start = monotonic()
 
     def notify(self, data):
-        if len(self.history) < self.history.maxlen:
-            self.history.appendleft(data)
-        else:
-            self.history.pop()  # remove one (possibly empty element from the queue)
-            self.history.appendleft(data)
+        elapsed, cpu, mem, recved = data
+        self.detector.add(elapsed.total_seconds(), cpu, recved)
 
     def has_finished(self):
-        if len(self.history) == self.history.maxlen and self.has_converged():  # lazy evaluation: has converged should never be called with less than three entries in history
-            self.finished.set()
-            self.queue.put({"who":"sequencer", "action":"WaitConvergentAction", "message":"Update maximum observed prefixes: {0}".format(self.routes), "prefixes":self.routes})
-            elapsed = datetime.datetime.now() - self.start
-            print >> sys.stderr, "Action \"wait_convergent\" took {0} seconds".format(elapsed.total_seconds())
-            return True
-        else:
+        if self.detector.converged is None:
             return False
-
-    def has_converged(self):
-        matches = 0
-        for entry in self.history:
-            elapsed, cpu, mem, recved = entry
-            # DEBUG           print "Checking history entry {0}, {1}, {2}, {3}".format(elapsed, cpu, mem, recved)
-            # DEBUG           print "Checking history entry {0}, {1}, {2}, {3}".format(type(elapsed), type(cpu), type(mem), type(recved))
-            if cpu <= self.cpu_threshold and recved >= self.routes:
-                matches +=1
-            else:
-                return False
-        rm_line()
-        print "Found {0} entries in history indicating steady state of bgpd under test".format(matches)
-        if matches == self.history.maxlen:
-            # DEBUG print "CONVERGENCE DETECTED"
-            return True
+        routes = self.detector.max_routes
+        self.finished.set()
+        self.queue.put({"who":"sequencer", "action":"WaitConvergentAction", "prefixes":routes, "converged":self.detector.converged,
+                        "message":"Update maximum observed prefixes: {0}, converged at {1:.3f} sec".format(routes, self.detector.converged)})
+        print >> sys.stderr, "Action \"wait_convergent\" took {0:.3f} seconds".format(monotonic() - self.start)
+        return True
 
 
 class SleepAction(Action):
-    def __init__(self, duration, finished):   # duration is the minimum guaranteed time to sleep, can be more depending on timing and measurement interval
+    def __init__(self, duration, finished):   # finishes exactly duration seconds after its start
         self.type = 'sleep'
         self.duration = duration
+        self.timeout = duration
+        self.samples = False
         self.finished = finished
-        self.start = datetime.datetime.now()
+        self.start = monotonic()
 
     def notify(self, data):
-        elapsed, cpu, mem, recved = data
-        self.elapsed = elapsed
+        pass
 
-    def has_finished(self):
-        sleep = datetime.datetime.now() - self.start
-        print "Action \"sleep\": {0} of {1} seconds elapsed".format(sleep.seconds, self.duration)
-        rm_line()
+    def expire(self):   # called by the sequencer's timer at the deadline
+        print "Action \"sleep\": {0:.3f} of {1} seconds elapsed".format(monotonic() - self.start, self.duration)
+        self.finished.set()
 
-        if sleep >= datetime.timedelta(seconds=self.duration):
-            self.finished.set()
-            return True
-        else:
-            return False
+    def has_finished(self):
+        return self.finished.is_set()
 
 
+# Drops loss percent of the traffic of the tester peers given by address (or router-id) with
+# netem (see impair.py), the peers are resumed duration + recovery seconds after the start.
+# Remote peers only lose the traffic towards them, on the host interface routing to them.
 class InterruptPeersAction(Action):
-    def __init__(self, peers, duration, finished, recovery=0, loss=100): # duration is the minimum guaranteed time to sleep, can be more depending on timing and measurement interval
+    def __init__(self, peers, duration, finished, recovery=0, loss=100, testers=()):
         self.type = 'interrupt_peers'
         self.duration = duration
         self.recovery = 0 if recovery == None else recovery
         self.loss = 100 if loss == None else loss
+        self.timeout = self.duration + self.recovery
+        self.samples = False
         self.finished = finished
-        self.start = datetime.datetime.now()
-        self.interrupt(peers, loss)
+        self.start = monotonic()
+        self.impairments = tester_impairments(testers, peers, {'loss': self.loss})
+        if not self.impairments:
+            raise ValueError('no peers to interrupt')
+        self.interrupt()
 
     def notify(self, data):
         pass
 
+    def expire(self):   # called by the sequencer's timer after duration + recovery
+        self.resume()
+        print "Action \"interrupt_peers\": peers resumed after {0:.3f} of {1} seconds".format(monotonic() - self.start, self.timeout)
+        self.finished.set()
+
     def has_finished(self):
-        timespan = datetime.datetime.now() - self.start
-        rm_line()
-        print "Action \"interrupt_peers\": {0} of {1} seconds elapsed".format(timespan.seconds, self.duration + self.recovery)
-
-        if timespan >= datetime.timedelta(seconds=self.duration + self.recovery):
-            self.resume()
-            self.finished.set()
-            return True
-        else:
-            # TODO DEBUG remove print"interrupt not finished: {0}".format(timespan)
-            return False
+        return self.finished.is_set()
 
-    def interrupt(self, peers, loss):
-        comcast = '/home/labadm/go/bin/comcast'
-        try:
-            retcode = call([
-            comcast, "--device=eno2", "--packet-loss={0}%".format(loss), \
-            "--target-addr={0}".format(",".join(peers)), "--target-proto=tcp"
-            ])
-            if retcode < 0:
-                print >> sys.stderr, "Comcast was terminated by signal", -retcode
-            else:
-                print >> sys.stderr, "Comcast returned", retcode
-        except OSError as e:
-            print >>sys.stderr, "Execution failed:", e
+    def interrupt(self):
+        for impairment in self.impairments:
+            impairment.apply()
 
     def resume(self):
-        comcast = 'comcast' # TODO insert path to comcast here if necessary
+        for impairment in self.impairments:
+            impairment.remove()
+
+
+# Impairs links of the benchmark network (see impair.py) for duration seconds, or until
+# the end of the benchmark without duration
+class ImpairAction(Action):
+    def __init__(self, impairments, duration, finished):
+        self.type = 'impair'
+        self.impairments = impairments
+        self.timeout = duration
+        self.samples = False
+        self.finished = finished
+        for impairment in impairments:
+            print 'impairing {0}'.format(impairment)
+            impairment.apply()
+        if duration is None:
+            finished.set()
+
+    def notify(self, data):
+        pass
+
+    def expire(self):
+        for impairment in self.impairments:
+            impairment.remove()
+        self.finished.set()
+
+    def has_finished(self):
+        return self.finished.is_set()
+
+
+# Withdraws and announces again `fraction` of the prefixes of every tester peer (or of
+# the peers given by router-id) at `rate` prefix updates per second (a withdrawal or an
+# announcement of one prefix is one update) for `duration` seconds, through the control
+# channels of the testers (see tester.py). Prefixes still withdrawn at the end are
+# announced again at once. Achieved rate and the cpu load of the target are reported.
+class ChurnAction(Action):
+    TICK = 0.01
+
+    def __init__(self, channels, fraction, rate, duration, queue, finished, peers=None):
+        self.type = 'churn'
+        self.rate = float(rate)
+        self.duration = duration
+        self.queue = queue
+        self.finished = finished
+        self.cpu = []
+
+        self.routes = []    # (channel number, peer, prefixes) of every churned peer
+        for i, (filename, neighbor, group) in enumerate(channels):
+            for p in group:
+                if peers is None or p['router-id'] in peers:
+                    n = int(math.ceil(fraction * count_paths(p)))
+                    self.routes.append((i, neighbor, p, list(islice(peer_paths(p), n))))
+        if not self.routes:
+            raise ValueError('no tester peers to churn')
+        used = set(i for i, neighbor, p, prefixes in self.routes)
+        self.channels = dict((i, ControlChannel(channels[i][0])) for i in used)
+
+        self.start = monotonic()
+        t = Thread(target=self.run)
+        t.daemon = True
+        t.start()
+
+    def updates(self):  # endless (withdraw, route) sequence, withdrawing all routes round-robin over the peers, then announcing them
+        longest = max(len(prefixes) for i, neighbor, p, prefixes in self.routes)
+        while True:
+            for withdraw in (True, False):
+                for j in xrange(longest):
+                    for i, neighbor, p, prefixes in self.routes:
+                        if j < len(prefixes):
+                            yield withdraw, (i, neighbor, p['router-id'], p, prefixes[j])
+
+    def send(self, updates):    # updates: list of (withdraw, route)
+        batches = {}
+        for withdraw, (i, neighbor, router_id, p, prefix) in updates:
+            batches.setdefault(i, []).append(route_command(neighbor, p, prefix, withdraw))
+        for i, commands in batches.items():
+            self.channels[i].send(commands)
+
+    def run(self):
+        sent = 0
+        withdrawn = {}  # (channel number, neighbor, router-id, prefix) -> route
+        updates = self.updates()
+        now = self.start
+        error = None
+        try:
+            while now - self.start < self.duration:
+                due = [next(updates) for k in xrange(int(self.rate * (now - self.start)) - sent)]
+                for withdraw, route in due:
+                    if withdraw:
+                        withdrawn[route[:3] + route[4:]] = route
+                    else:
+                        withdrawn.pop(route[:3] + route[4:], None)
+                self.send(due)
+                sent += len(due)
+                time.sleep(max(0, self.TICK - (monotonic() - now)))
+                now = monotonic()
+            self.send([(False, route) for route in withdrawn.values()])
+        except (IOError, OSError) as e:    # e.g. the tester is gone
+            error = e
+        finally:
+            for channel in self.channels.values():
+                try:
+                    channel.close()
+                except (IOError, OSError):
+                    pass
+        elapsed = min(monotonic() - self.start, self.duration)
+
+        cpu = self.cpu if self.cpu else [0]
+        report = {'requested-rate': self.rate, 'achieved-rate': sent / elapsed if elapsed > 0 else 0, 'updates': sent,
+                  'duration': elapsed, 'cpu-mean': sum(cpu) / len(cpu), 'cpu-max': max(cpu)}
+        self.queue.put({'who': 'sequencer', 'churn': report,
+                        'message': 'Action "churn": {0} updates in {1:.1f} seconds, {2:.0f} of {3:.0f} updates/s, target cpu mean {4:.1f}% max {5:.1f}%{6}'.format(
+                            sent, elapsed, report['achieved-rate'], self.rate, report['cpu-mean'], report['cpu-max'],
+                            ' (stopped: {0})'.format(error) if error else '')})
+        self.finished.set()
+
+    def notify(self, data):
+        elapsed, cpu, mem, recved = data
+        self.cpu.append(cpu)
+
+    def has_finished(self):
+        return self.finished.is_set()
+
+
+# Tears down the sessions of `count` tester peers (all by default, or of the peers given by
+# router-id) in `waves` waves, the testers connect again by themselves. pattern 'all' tears
+# down the sessions of a wave at once, 'staggered' one after another at `rate` sessions per
+# second and 'random' a random choice of the peers at random times (`rate` per second on
+# average). Per wave the time until the route count of the monitor reached its minimum
+# (withdraw) and from there until it is back at its level before the wave (relearn) is
+# reported. The next wave starts `pause` seconds after the previous one has relearned or
+# `timeout` seconds have passed.
+class FlapPeersAction(Action):
+    PATTERNS = ['all', 'staggered', 'random']
+
+    def __init__(self, channels, queue, finished, count=None, pattern='all', rate=10, waves=1, pause=10, timeout=300, peers=None):
+        if pattern not in self.PATTERNS:
+            raise ValueError('unknown flap pattern {0}'.format(pattern))
+        self.type = 'flap_peers'
+        self.queue = queue
+        self.finished = finished
+        self.pattern = pattern
+        self.rate = float(rate)
+        self.waves = int(waves)
+        self.pause = pause
+        self.timeout = None     # not time based, the waves end on the samples
+        self.wave_timeout = timeout
+
+        self.sessions = [(i, neighbor, p) for i, (filename, neighbor, group) in enumerate(channels)
+                         for p in group if peers is None or p['router-id'] in peers]
+        if not self.sessions:
+            raise ValueError('no tester peers to flap')
+        self.sessions.sort(key=lambda s: ip2int(s[2]['router-id']))
+        self.count = min(int(count), len(self.sessions)) if count else len(self.sessions)
+        self.channels = dict((i, ControlChannel(channels[i][0])) for i in set(s[0] for s in self.sessions))
+
+        self.cond = Condition()
+        self.routes = None  # last route count of the monitor
+        self.wave = None    # measurement of the running wave, updated by notify()
+        t = Thread(target=self.run)
+        t.daemon = True
+        t.start()
+
+    def notify(self, data):
+        elapsed, cpu, mem, recved = data
+        with self.cond:
+            self.routes = recved
+            w = self.wave
+            if w is not None and w['end'] is None:
+                now = monotonic()
+                if recved < w['min']:
+                    w['min'] = recved
+                    w['min-time'] = now
+                if w['min'] < w['before'] and recved >= w['before']:
+                    w['end'] = now
+                self.cond.notify_all()
+
+    def has_finished(self):
+        return self.finished.is_set()
+
+    def teardown(self, sessions):   # one write per control channel
+        batches = {}
+        for i, neighbor, p in sessions:
+            batches.setdefault(i, []).append(teardown_command(neighbor, p))
+        for i, commands in batches.items():
+            self.channels[i].send(commands)
+
+    def flap(self, n):  # runs wave n, returns its report
+        with self.cond:
+            while self.routes is None:  # no sample yet
+                self.cond.wait(1)
+            self.wave = w = {'before': self.routes, 'min': self.routes, 'min-time': None, 'end': None}
+        chosen = random.sample(self.sessions, self.count) if self.pattern == 'random' else self.sessions[:self.count]
+        start = monotonic()
+        if self.pattern == 'all':
+            self.teardown(chosen)
+        else:
+            for k, session in enumerate(chosen):
+                if k > 0:
+                    time.sleep(1 / self.rate if self.pattern == 'staggered' else random.expovariate(self.rate))
+                self.teardown([session])
+        with self.cond:
+            while w['end'] is None and monotonic() - start < self.wave_timeout:
+                self.cond.wait(1)
+            self.wave = None
+        return {'wave': n, 'sessions': len(chosen), 'routes-before': w['before'], 'routes-min': w['min'],
+                'withdraw': w['min-time'] - start if w['min-time'] else None,
+                'relearn': w['end'] - w['min-time'] if w['end'] else None,
+                'total': w['end'] - start if w['end'] else None}
+
+    def run(self):
+        reports = []
+        fmt = lambda v: '{0:.3f}s'.format(v) if v is not None else 'timeout'
         try:
-            retcode = call([comcast, "--device=eno2", "--stop"])
-            if retcode < 0:
-                print >> sys.stderr, "Comcast was terminated by signal", -retcode
-            else:
-                print >> sys.stderr, "Comcast returned", retcode
-        except OSError as e:
-            print >>sys.stderr, "Execution failed:", e
+            for n in range(self.waves):
+                if n > 0:
+                    time.sleep(self.pause)
+                r = self.flap(n)
+                reports.append(r)
+                self.queue.put({'who': 'sequencer', 'message': 'Action "flap_peers": wave {0}, {1} sessions, routes {2} -> {3}, withdraw {4}, relearn {5}'.format(
+                    n, r['sessions'], r['routes-before'], r['routes-min'], fmt(r['withdraw']), fmt(r['relearn']))})
+        except (IOError, OSError) as e:    # e.g. the tester is gone
+            self.queue.put({'who': 'sequencer', 'message': 'Action "flap_peers" stopped: {0}'.format(e)})
+        finally:
+            for channel in self.channels.values():
+                try:
+                    channel.close()
+                except (IOError, OSError):
+                    pass
+        self.queue.put({'who': 'sequencer', 'flaps': reports})
+        self.finished.set()
 
+
+# Runs the program path once (a command line, run by the shell), finishes when it exits.
+# With a timeout the program is killed if it is still running timeout seconds after its start.
 class ExecuteProgramAction(Action):
-    def __init__(self,path, finished):
+    def __init__(self, path, finished, timeout=None):
         self.type = 'execute'
+        self.path = path
+        self.timeout = timeout
+        self.samples = False
         self.finished = finished
-        self.start = datetime.datetime.now()
+        self.start = monotonic()
+        self.process = subprocess.Popen(path, shell=True)   # raises OSError if it cannot be started
+        t = Thread(target=self.wait)
+        t.daemon = True
+        t.start()
+
+    def wait(self):
+        ret = self.process.wait()
+        print "Action \"execute\": {0} exited with {1} after {2:.3f} seconds".format(self.path, ret, monotonic() - self.start)
+        self.finished.set()
 
     def notify(self, data):
         pass
 
-    def has_finished(self):
-        sleep = datetime.datetime.now() - self.start
-        print "Action \"execute\": {0} of {1} seconds elapsed".format(sleep.seconds, self.duration)
-        rm_line()
+    def expire(self):   # timeout passed, wait() finishes the action once the program is gone
+        if self.process.poll() is None:
+            print "Action \"execute\": killing {0} after {1} seconds".format(self.path, self.timeout)
+            self.process.kill()
 
-        if getoutput(path):#TBD
-            self.finished.set()
-            return True
-        else:
-            return False
+    def has_finished(self):
+        return self.finished.is_set()
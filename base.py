@@ -17,17 +17,22 @@ from settings import dckr
 import io
 import os
 import yaml
-import sys
 import subprocess
+import time
 import warnings
-import StringIO
-from pyroute2 import IPRoute
 from itertools import chain
-from nsenter import Namespace
 from threading import Thread
 from threading import Event
-from datetime import timedelta
-from actions import WaitConvergentAction, SleepAction, InterruptPeersAction
+from threading import Lock
+import datetime
+from cgroup import CgroupSampler, CgroupError, memory_breakdown
+from clock import monotonic, TimerQueue
+from cpufreq import CPUFreqSampler
+from threadstats import ThreadSampler
+from netsetup import connect_ctn_to_br
+from actions import WaitConvergentAction, SleepAction, InterruptPeersAction, ExecuteProgramAction, ChurnAction, FlapPeersAction, ImpairAction
+from impair import Impairment, tester_impairments
+from control import control_channels
 
 flatten = lambda l: chain.from_iterable(l)
 
@@ -35,6 +40,11 @@ def ctn_exists(name):
     return '/{0}'.format(name) in list(flatten(n['Names'] for n in dckr.containers(all=True)))
 
 
+def parse_cpuset(cpus):    # "0, 2-3" -> [0, 2, 3]
+    ranges = (x.split("-") for x in cpus.split(","))
+    return [i for r in ranges for i in range(int(r[0]), int(r[-1]) + 1)]
+
+
 def img_exists(name):
     return name in [ctn['RepoTags'][0].split(':')[0] for ctn in dckr.images() if ctn['RepoTags'] != None]
 
@@ -51,28 +61,6 @@ def getoutput(cmd, successful_status=(0,), stacklevel=1):
     return False, output
 
 
-# Parses output in this format of cpupower
-#              |Mperf
-#PKG |CORE|CPU | C0   | Cx   | Freq
-#   0|   0|   0|  0.00| 100.0|4400
-#   2|   0|   1|  0.00| 100.0|3874
-
-# TODO Design conflict, the measured values are only valid for global measurement interval = 1 sec.
-def get_turbo_clks():
-    info = []
-    ok, output = getoutput(['cpupower', 'monitor', '-mMperf'])
-    output = StringIO.StringIO(output) # convert to StringIO for later line-based parsing
-    if ok:
-        output.readline() # skip fist line
-        names = tuple(s.strip() for s in output.readline().split('|')) # names tuple
-        for line in output: # read values
-            values = (s.strip() for s in line.split('|'))
-            info.append(dict(zip(names, values)))
-    else:
-        print("Failed to execute \"cpupower\" please install it on your system.")
-        print output
-    return info
-
 # This method is limited to obtain the maximum Base Clk but not the turbo Clk
 def get_cpuinfo():
     info = [{}]
@@ -97,116 +85,232 @@ def get_cpuinfo():
 
 
 
-class docker_netns(object):
-    def __init__(self, name):
-        pid = int(dckr.inspect_container(name)['State']['Pid'])
-        if pid == 0:
-            raise Exception('no container named {0}'.format(name))
-        self.pid = pid
-
-    def __enter__(self):
-        pid = self.pid
-        if not os.path.exists('/var/run/netns'):
-            os.mkdir('/var/run/netns')
-        os.symlink('/proc/{0}/ns/net'.format(pid), '/var/run/netns/{0}'.format(pid))
-        return str(pid)
-
-    def __exit__(self, type, value, traceback):
-        pid = self.pid
-        os.unlink('/var/run/netns/{0}'.format(pid))
-
-
-def connect_ctn_to_br(ctn, brname):
-    print 'connecting container {0} to bridge {1}'.format(ctn, brname)
-    with docker_netns(ctn) as pid:
-        ip = IPRoute()
-        br = ip.link_lookup(ifname=brname)
-        if len(br) == 0:
-            ip.link_create(ifname=brname, kind='bridge', mtu=1446)
-            br = ip.link_lookup(ifname=brname)
-        br = br[0]
-        ip.link('set', index=br, state='up', mtu=1446)
-
-        ifs = ip.link_lookup(ifname=ctn)
-        if len(ifs) > 0:
-           ip.link_remove(ifs[0])
-
-        ip.link_create(ifname=ctn, kind='veth', peer=pid, mtu=1446)
-        host = ip.link_lookup(ifname=ctn)[0]
-        ip.link('set', index=host, master=br)
-        ip.link('set', index=host, state='up')
-        guest = ip.link_lookup(ifname=pid)[0]
-        ip.link('set', index=guest, net_ns_fd=pid)
-        with Namespace(pid, 'net'):
-            ip = IPRoute()
-            ip.link('set', index=guest, ifname='eth1', mtu=1446)
-            ip.link('set', index=guest, state='up')
+# The script is a list of entries, either an action or a parallel group of actions:
+#   - action: {type: wait_convergent, name: converge}
+#   - action: {type: interrupt_peers, ..., with: converge}   # starts together with converge
+#   - parallel:                                              # the actions start together
+#       - action: {type: sleep, duration: 10}
+#       - action: {type: ...}
+#     name: both
+#   - action: {type: sleep, duration: 5, after: [converge, both]}
+# An entry starts after the previous entry has finished unless it names the entries it
+# starts after (after:) and/or together with (with:). Actions are named action-N by
+# default, N counting all actions of the script from 0; a group stands for all its actions.
+# Returns the actions as list of dicts with number, name, action, after and with (sets of numbers).
+def script_graph(script):
+    nodes = []
+    names = {}      # name -> set of action numbers
+    entries = []    # (numbers of the actions of the entry, entry)
+    for entry in script:
+        members = entry['parallel'] if 'parallel' in entry else [entry]
+        numbers = set()
+        for member in members:
+            a = member['action']
+            n = len(nodes)
+            nodes.append({'number': n, 'name': a['name'] if 'name' in a and a['name'] else 'action-{0}'.format(n), 'action': a})
+            numbers.add(n)
+        for n in numbers:
+            names.setdefault(nodes[n]['name'], set()).add(n)
+        if 'name' in entry and entry['name']:
+            names.setdefault(entry['name'], set()).update(numbers)
+        entries.append((numbers, entry))
+
+    def refs(value):
+        refs = set()
+        for name in (value if isinstance(value, list) else [value]):
+            if name not in names:
+                raise ValueError('script refers to unknown action {0}'.format(name))
+            refs |= names[name]
+        return refs
+
+    prev = set()
+    for numbers, entry in entries:
+        for n in numbers:
+            a = nodes[n]['action']
+            after = refs(entry['after']) if 'after' in entry else set()
+            after |= refs(a['after']) if 'after' in a else set()
+            along = refs(entry['with']) if 'with' in entry else set()
+            along |= refs(a['with']) if 'with' in a else set()
+            if not any(key in d for d in (entry, a) for key in ('after', 'with')):
+                after = set(prev)
+            nodes[n]['after'] = after - numbers
+            nodes[n]['with'] = along - numbers
+        prev = numbers
+    return nodes
+
+
+class ActionDone(object):   # like an Event, set by an action when it has finished, wakes up the sequencer
+    def __init__(self, wakeup):
+        self.done = False
+        self.wakeup = wakeup
+
+    def set(self):
+        self.done = True
+        self.wakeup.set()
+
+    def is_set(self):
+        return self.done
+
 
 class Sequencer(Thread):
-    # script: the script to execute
+    # script: the script to execute (see script_graph())
     # benchmark_start: start time of the benchmark this sequencer is part of
     # queue: the "main" queue of the benchmark which is responsible for logging and output of measured data to STDOUT
-    def __init__(self, script, benchmark_start, queue):
+    # testers: the local testers, controlled by churn, flap_peers, impair and interrupt_peers actions
+    # profiler: Profiler of the target, actions with "profile: true" are profiled while they run
+    # Any number of actions can be active. Time based actions end at their deadline on the
+    # monotonic clock (TimerQueue), the samples passed to notify() only go to the active
+    # actions using them. Start and end of every action are put into queue as
+    # 'action-start': (number, type, elapsed) and 'action-end': (number, type, elapsed, success).
+    def __init__(self, script, benchmark_start, queue, testers=(), profiler=None):
         Thread.__init__(self)
         self.daemon = True
         self.name = 'sequencer'
+        self.testers = testers
+        self.profiler = profiler
+        self.profiles = {}              # number of the action -> its profiling window
 
         self.script = script            # the script is a list of benchmark actions
         self.benchmark_start = benchmark_start    # start time of the benchmark run
+        self.start_time = monotonic() - (datetime.datetime.now() - benchmark_start).total_seconds()
         self.queue = queue
 
-        self.elapsed = timedelta(0)
-        self.action = None              # the currently running action
+        self.timers = TimerQueue()
+        self.wakeup = Event()           # set when an action has finished
+        self.lock = Lock()              # actions are started here and notified from the benchmark loop
+        self.subscribers = []           # active actions that get the samples
+
+    def elapsed(self):  # seconds since the start of the benchmark
+        return monotonic() - self.start_time
 
     def run(self):
         print "\033[1;32;47mstarting Sequenecer\033[1;30;47m"
-        while len(self.script) > 0:     # simple sequencer, execute actions one at a time
-            action = self.script.pop(0)['action']
-            info = {}
-            info['who'] = self.name
-            info['message'] = "\nAction \"{0}\" started at {1}".format(action['type'], self.elapsed.total_seconds())
-            # DEBUG           print "Action \"{0}\" started at {1}".format(action['type'], self.elapsed.total_seconds()) # FIXME Debug remove
-            self.queue.put(info)
-            if self.execute_action(action):
-                info['message'] = "\033[1;32;47mAction \"{0}\" finished at {1}\033[1;30;47m".format(action['type'], self.elapsed.total_seconds())
-            else:
-                info['message'] = "\033[1;31;47mAction \"{0}\" FAILED at {1}\033[1;30;47m".format(action['type'], self.elapsed.total_seconds())
-            self.queue.put(info)
+        try:
+            nodes = script_graph(self.script)
+        except (ValueError, KeyError, TypeError) as e:
+            print "ERROR: invalid action script: {0}".format(e)
+            return
+        started = set()
+        done = set()
+        active = {}     # number -> action
+        while len(done) < len(nodes):
+            self.wakeup.clear()
+            for n, action in active.items():
+                if action.finished.is_set():
+                    del active[n]
+                    self.end_action(nodes[n], True)
+                    done.add(n)
+            with self.lock:
+                self.subscribers = [a for a in self.subscribers if not a.finished.is_set()]
+
+            progress = True
+            while progress:     # started and failed actions can make further actions startable
+                progress = False
+                for node in nodes:
+                    if node['number'] not in started and node['after'] <= done and node['with'] <= started:
+                        started.add(node['number'])
+                        progress = True
+                        action = self.start_action(node)
+                        if action is None:
+                            done.add(node['number'])
+                        else:
+                            active[node['number']] = action
+            if len(done) == len(nodes):
+                break
+            if not active:
+                print "ERROR: action script has a dependency cycle"
+                break
+            self.timers.run(self.wakeup)
+        self.timers.clear()
         print "Sequencer: script finished!"
 
-
-    # halts until action is finished and returns True when execution finished successfullly.
-    def execute_action(self, a):
-        finished = Event()
-        while True:
-            if a['type'] == 'wait_convergent':
-                self.action = WaitConvergentAction(a['cpu_below'], a['routes'], a['confidence'], self.queue, finished)
-            elif a['type'] == 'interrupt_peers':
-                recovery = a['recovery'] if 'recovery' in a and a['recovery'] else None
-                loss = a['loss'] if 'loss' in a and a['loss'] else None
-                self.action = InterruptPeersAction(a['peers'], a['duration'], finished, recovery, loss)
-            elif a['type'] == 'sleep':
-                self.action = SleepAction(a['duration'], finished)
-            elif a['type'] =='execute':
-                self.action = ExecuteProgramAction(a['path'],finished)
-            else:
-                print "ERROR: unrecognized action of type {0}".format(a['type'])
-                return False # return error here
-
-            finished.wait()
-            finished.clear()
-            break
-
-        return True
-
-    def notify(self, data):    # elapsed is the ammount of time since the beginning of the action
-        elapsed, cpu, mem, recved = data
-        self.elapsed = elapsed
-        if self.action:
-            self.action.notify(data)
-            self.action.has_finished()
+    def start_action(self, node):  # starts the action of node, returns None if it failed
+        a = node['action']
+        start = self.elapsed()
+        self.queue.put({'who': self.name, 'phase': a['type'], 'action-start': (node['number'], a['type'], start),
+                        'message': "\nAction \"{0}\" ({1}) started at {2:.3f}".format(a['type'], node['name'], start)})
+        if self.profiler and 'profile' in a and a['profile']:
+            self.profiles[node['number']] = self.profiler.begin('{0} ({1})'.format(a['type'], node['name']))
+        action = self.new_action(a, ActionDone(self.wakeup))
+        if action is None:
+            self.end_action(node, False)
+            return None
+        if action.timeout is not None:
+            self.timers.add(action.timeout, action.expire)
+        if action.samples:
+            with self.lock:
+                self.subscribers.append(action)
+        return action
+
+    def end_action(self, node, ok):
+        a = node['action']
+        end = self.elapsed()
+        info = {'who': self.name, 'action-end': (node['number'], a['type'], end, ok)}
+        if node['number'] in self.profiles:
+            self.profiler.end(self.profiles.pop(node['number']))
+        if ok:
+            info['message'] = "\033[1;32;47mAction \"{0}\" ({1}) finished at {2:.3f}\033[1;30;47m".format(a['type'], node['name'], end)
         else:
-            print >>sys.stderr, "Call .notify() on None object"
+            info['message'] = "\033[1;31;47mAction \"{0}\" ({1}) FAILED at {2:.3f}\033[1;30;47m".format(a['type'], node['name'], end)
+        self.queue.put(info)
+
+    # creates the action of the script entry a, None if it is not known
+    def new_action(self, a, finished):
+        if a['type'] == 'wait_convergent':
+            opt = lambda key: a[key] if key in a and a[key] is not None else None  # every parameter is optional
+            return WaitConvergentAction(opt('cpu_below'), opt('routes'), opt('confidence'), self.queue, finished,
+                                        opt('tolerance'), opt('cpu_stdev'))
+        elif a['type'] == 'interrupt_peers':
+            recovery = a['recovery'] if 'recovery' in a and a['recovery'] else None
+            loss = a['loss'] if 'loss' in a and a['loss'] else None
+            try:
+                return InterruptPeersAction(a['peers'], a['duration'], finished, recovery, loss, self.testers)
+            except Exception as e:
+                print "ERROR: cannot interrupt peers: {0}".format(e)
+                return None
+        elif a['type'] == 'impair':
+            direction = a['direction'] if 'direction' in a and a['direction'] else 'both'
+            try:
+                impairments = [Impairment(ctn, a, direction) for ctn in (a['containers'] if 'containers' in a and a['containers'] else [])]
+                impairments += tester_impairments(self.testers, a['peers'], a, direction) if 'peers' in a and a['peers'] else []
+                if not impairments:
+                    raise ValueError('no containers or peers to impair')
+                return ImpairAction(impairments, a['duration'] if 'duration' in a else None, finished)
+            except Exception as e:
+                print "ERROR: cannot impair links: {0}".format(e)
+                return None
+        elif a['type'] == 'sleep':
+            return SleepAction(a['duration'], finished)
+        elif a['type'] == 'execute':
+            try:
+                return ExecuteProgramAction(a['path'], finished, a['timeout'] if 'timeout' in a and a['timeout'] else None)
+            except (KeyError, OSError) as e:
+                print "ERROR: cannot execute program: {0}".format(e)
+                return None
+        elif a['type'] == 'churn':
+            try:
+                return ChurnAction(control_channels(self.testers), float(a['fraction']) if 'fraction' in a else 0.1, a['rate'], a['duration'],
+                                   self.queue, finished, a['peers'] if 'peers' in a and a['peers'] else None)
+            except (ValueError, IOError, OSError) as e:
+                print "ERROR: cannot start churn: {0}".format(e)
+                return None
+        elif a['type'] == 'flap_peers':
+            opt = lambda key, default=None: a[key] if key in a and a[key] is not None else default
+            try:
+                return FlapPeersAction(control_channels(self.testers), self.queue, finished, opt('count'), opt('pattern', 'all'),
+                                       opt('rate', 10), opt('waves', 1), opt('pause', 10), opt('timeout', 300), opt('peers'))
+            except (ValueError, IOError, OSError) as e:
+                print "ERROR: cannot start flap_peers: {0}".format(e)
+                return None
+        print "ERROR: unrecognized action of type {0}".format(a['type'])
+        return None
+
+    def notify(self, data):    # called with every sample (elapsed, cpu, mem, recved) of the benchmark
+        with self.lock:
+            for action in self.subscribers:
+                if not action.finished.is_set():
+                    action.notify(data)
+                    action.has_finished()
 
 
 class Container(object):
@@ -221,6 +325,7 @@ class Container(object):
             os.chmod(host_dir, 0777)
         self.cpuset_cpus = None
         self.cpus = None # list of integers containing every core id
+        self.freq_sampler = None # CPUFreqSampler for the cpus, created with the first sample
 
 
     @classmethod
@@ -249,7 +354,13 @@ class Container(object):
                     print line['stream'].strip()
 
 
+    # run() = create() + launch(), the steps can be scheduled separately (see pipeline.py)
     def run(self, brname='', rm=True, cpus=''):
+        ctn = self.create(rm, cpus)
+        self.launch(brname)
+        return ctn
+
+    def create(self, rm=True, cpus=''):
         if rm and ctn_exists(self.name):
             print 'remove container:', self.name
             dckr.remove_container(self.name, force=True)
@@ -262,19 +373,53 @@ class Container(object):
             print('running container {0} with non-default cpuset: {1}'.format(self.name, cpus))
             dckr.update_container(container=self.name, cpuset_cpus=cpus)
             self.cpuset_cpus = cpus
-            # parse into list of integers for later use
-            ranges = (x.split("-") for x in cpus.split(","))
-            self.cpus = [i for r in ranges for i in range(int(r[0]), int(r[-1]) + 1)]
+            self.cpus = parse_cpuset(cpus) # list of integers for later use
+        self.ctn_id = ctn['Id']
+        return ctn
+
+    def launch(self, brname=''):    # starts the created container and connects it to the bridge
         dckr.start(container=self.name)
         if brname != '':
             connect_ctn_to_br(self.name, brname)
-        self.ctn_id = ctn['Id']
-
-        return ctn
 
-    def stats(self, queue):
+    # collect core speed (MHz) of cpus where the process is running (if cpuset is used)
+    def cpufreqs(self):
+        if self.freq_sampler is None:
+            try:
+                self.freq_sampler = CPUFreqSampler(self.cpus)
+            except (OSError, IOError) as e:
+                print 'cannot read core speeds of cpus {0}: {1}'.format(self.cpuset_cpus, e)
+                self.freq_sampler = False
+        return self.freq_sampler.sample() if self.freq_sampler else [] # list of tuples with cpu_id, speed
+
+    # stop: Event ending the sampling, e.g. before the container is removed
+    def stats(self, queue, interval=1, stop=None):
+        stop = stop if stop else Event()
+
+        # samples the cgroup of the container directly, at any interval
+        def cgroup_stats(sampler):
+            prev = sampler.sample()
+            deadline = prev['time']
+            while not stop.is_set():
+                deadline += interval
+                time.sleep(max(0, deadline - monotonic()))
+                try:
+                    cur = sampler.sample()
+                except (OSError, IOError):  # the cgroup is gone with the container
+                    if stop.is_set():
+                        break
+                    raise
+                info = CgroupSampler.delta(prev, cur)
+                info.update({'who': self.name, 'mem': cur['mem'], 'time': cur['time'], 'memory': cur['memory']})
+                if self.cpus:
+                    info['cpufreqs'] = self.cpufreqs()
+                queue.put(info)
+                prev = cur
+            sampler.close()
 
+        # fallback if the cgroup filesystem is not accessible, reports about once per second
         def stats():
+            peak = 0
             for stat in dckr.stats(self.ctn_id, decode=True):
                 cpu_percentage = 0.0
                 prev_cpu = stat['precpu_stats']['cpu_usage']['total_usage']
@@ -289,19 +434,61 @@ class Container(object):
                 system_delta = float(system) - float(prev_system)
                 if system_delta > 0.0 and cpu_delta > 0.0:
                     cpu_percentage = (cpu_delta / system_delta) * float(cpu_num) * 100.0
-                # collect core speed (MHz) of cpus where the process is running (if cpuset is used)
+                memory = memory_breakdown(stat['memory_stats']['stats'] if 'stats' in stat['memory_stats'] else {})
+                peak = max(peak, stat['memory_stats']['usage'], stat['memory_stats']['max_usage'] if 'max_usage' in stat['memory_stats'] else 0)
+                memory['peak'] = peak
                 if self.cpus:
-                    cpufreqs = [] # put the current corespeeds for all cpus in cpuset in a list
-                    cpuinfo = get_turbo_clks()
-                    #cpuinfo = get_cpuinfo()
-                    for cpu in self.cpus:
-                        speed = cpuinfo[cpu]['Freq']
-                        #speed = cpuinfo[cpu]['cpu MHz']
-                        cpufreqs.append((cpu, speed)) # build a list of tuples with cpu_id, speed
-                    queue.put({'who': self.name, 'cpu': cpu_percentage, 'mem': stat['memory_stats']['usage'], 'cpufreqs': cpufreqs})
+                    queue.put({'who': self.name, 'cpu': cpu_percentage, 'mem': stat['memory_stats']['usage'], 'memory': memory, 'cpufreqs': self.cpufreqs()})
                 else:
-                    queue.put({'who': self.name, 'cpu': cpu_percentage, 'mem': stat['memory_stats']['usage']})
+                    queue.put({'who': self.name, 'cpu': cpu_percentage, 'mem': stat['memory_stats']['usage'], 'memory': memory})
+                if stop.is_set():
+                    return
+
+        if self.cpus:
+            self.cpufreqs()   # the first core speeds are averaged from here on
+        try:
+            sampler = CgroupSampler(dckr.inspect_container(self.ctn_id)['State']['Pid'])
+            t = Thread(target=cgroup_stats, args=(sampler,))
+        except CgroupError as e:
+            print 'cgroup of {0} not accessible ({1}), using docker stats'.format(self.name, e)
+            t = Thread(target=stats)
+        t.daemon = True
+        t.start()
 
-        t = Thread(target=stats)
+    # returns a function listing the (host) pids of the processes in the container
+    def pid_lister(self):
+        try:
+            cgroup = CgroupSampler(dckr.inspect_container(self.ctn_id)['State']['Pid'])
+            cgroup.close()  # only its list of processes is read
+            return cgroup.pids
+        except CgroupError as e:
+            print 'cgroup of {0} not accessible ({1}), using docker top to list its processes'.format(self.name, e)
+            def pids():
+                top = dckr.top(self.ctn_id)
+                return [int(p[top['Titles'].index('PID')]) for p in top['Processes']]
+            return pids
+
+    # samples the cpu usage of every thread of the processes in the container, e.g. to find a saturated thread of a
+    # multithreaded target; puts {'who': 'threads', 'time', 'threads': [(pid, tid, name, cpu, user, system), ..]}
+    def thread_stats(self, queue, interval=1, stop=None):
+        stop = stop if stop else Event()
+        sampler = ThreadSampler(self.pid_lister())
+
+        def thread_stats():
+            sampler.sample()
+            deadline = monotonic()
+            while not stop.is_set():
+                deadline += interval
+                time.sleep(max(0, deadline - monotonic()))
+                try:
+                    threads = sampler.sample()
+                except (OSError, IOError):  # the container is gone
+                    if stop.is_set():
+                        break
+                    raise
+                queue.put({'who': 'threads', 'time': monotonic(), 'threads': threads})
+            sampler.close()
+
+        t = Thread(target=thread_stats)
         t.daemon = True
         t.start()
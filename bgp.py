@@ -0,0 +1,167 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Minimal BGP-4 (RFC 4271) message encoding and decoding for IPv4 unicast.
+# This module has no dependencies besides the standard library because it is
+# also copied into the tester container and used by speaker.py.
+
+import socket
+import struct
+
+OPEN = 1
+UPDATE = 2
+NOTIFICATION = 3
+KEEPALIVE = 4
+
+HEADER_LEN = 19
+MAX_MESSAGE_LEN = 4096
+MARKER = '\xff' * 16
+
+ORIGIN = 1
+AS_PATH = 2
+NEXT_HOP = 3
+AS_SEQUENCE = 2
+
+CAP_MULTIPROTOCOL = 1
+CAP_FOUR_OCTET_AS = 65
+AS_TRANS = 23456
+
+
+def header(typ, length):
+    return MARKER + struct.pack('!HB', length, typ)
+
+
+def message(typ, body=''):
+    return header(typ, HEADER_LEN + len(body)) + body
+
+
+def encode_open(asn, router_id, hold_time=90):
+    caps = struct.pack('!BBHBB', CAP_MULTIPROTOCOL, 4, 1, 0, 1)     # IPv4 unicast
+    caps += struct.pack('!BBI', CAP_FOUR_OCTET_AS, 4, asn)
+    params = struct.pack('!BB', 2, len(caps)) + caps
+    body = struct.pack('!BHH', 4, asn if asn < 65536 else AS_TRANS, hold_time)
+    body += socket.inet_aton(router_id)
+    body += struct.pack('!B', len(params)) + params
+    return message(OPEN, body)
+
+
+def encode_keepalive():
+    return message(KEEPALIVE)
+
+
+def encode_notification(code, subcode=0, data=''):
+    return message(NOTIFICATION, struct.pack('!BB', code, subcode) + data)
+
+
+def encode_prefix(p):   # p is a (address as integer, prefix length) tuple
+    addr, length = p
+    octets = (length + 7) / 8
+    return struct.pack('!B', length) + struct.pack('!I', addr)[:octets]
+
+
+def encode_attributes(asn, next_hop, origin=0):  # ORIGIN, AS_PATH (4 octet ASNs) and NEXT_HOP
+    attrs = struct.pack('!BBBB', 0x40, ORIGIN, 1, origin)
+    segment = struct.pack('!BBI', AS_SEQUENCE, 1, asn)
+    attrs += struct.pack('!BBB', 0x40, AS_PATH, len(segment)) + segment
+    attrs += struct.pack('!BBB', 0x40, NEXT_HOP, 4) + socket.inet_aton(next_hop)
+    return attrs
+
+
+def encode_update(withdrawn='', attrs='', nlri=''):
+    body = struct.pack('!H', len(withdrawn)) + withdrawn + struct.pack('!H', len(attrs)) + attrs + nlri
+    return message(UPDATE, body)
+
+
+def pack_updates(prefixes, attrs, max_len=MAX_MESSAGE_LEN):
+    # yields (UPDATE message, number of prefixes) tuples, packing as many NLRI
+    # as fit into one message sharing the same path attributes
+    room = max_len - HEADER_LEN - 4 - len(attrs)
+    nlri = []
+    size = 0
+    for p in prefixes:
+        e = encode_prefix(p)
+        if size + len(e) > room:
+            yield encode_update(attrs=attrs, nlri=''.join(nlri)), len(nlri)
+            nlri = []
+            size = 0
+        nlri.append(e)
+        size += len(e)
+    if nlri:
+        yield encode_update(attrs=attrs, nlri=''.join(nlri)), len(nlri)
+
+
+def pack_withdrawals(prefixes, max_len=MAX_MESSAGE_LEN):
+    room = max_len - HEADER_LEN - 4
+    withdrawn = []
+    size = 0
+    for p in prefixes:
+        e = encode_prefix(p)
+        if size + len(e) > room:
+            yield encode_update(withdrawn=''.join(withdrawn)), len(withdrawn)
+            withdrawn = []
+            size = 0
+        withdrawn.append(e)
+        size += len(e)
+    if withdrawn:
+        yield encode_update(withdrawn=''.join(withdrawn)), len(withdrawn)
+
+
+def decode_prefixes(data, offset=0, end=None):  # returns a list of (address as integer, prefix length) tuples
+    end = len(data) if end is None else end
+    prefixes = []
+    while offset < end:
+        length = ord(data[offset])
+        octets = (length + 7) / 8
+        addr = struct.unpack('!I', (data[offset + 1:offset + 1 + octets] + '\x00\x00\x00\x00')[:4])[0]
+        prefixes.append((addr, length))
+        offset += 1 + octets
+    return prefixes
+
+
+def decode_update(body):    # returns withdrawn prefixes, raw path attributes and announced prefixes
+    wlen = struct.unpack_from('!H', body, 0)[0]
+    withdrawn = decode_prefixes(body, 2, 2 + wlen)
+    alen = struct.unpack_from('!H', body, 2 + wlen)[0]
+    attrs = body[4 + wlen:4 + wlen + alen]
+    nlri = decode_prefixes(body, 4 + wlen + alen)
+    return withdrawn, attrs, nlri
+
+
+def decode_open(body):
+    version, asn, hold_time = struct.unpack_from('!BHH', body, 0)
+    router_id = socket.inet_ntoa(body[5:9])
+    return {'version': version, 'as': asn, 'hold-time': hold_time, 'router-id': router_id}
+
+
+class MessageReader(object):
+    # incremental parser for a stream of BGP messages, feed() it with whatever
+    # arrives on the socket and it returns the complete (type, body) tuples
+    def __init__(self):
+        self.buf = ''
+
+    def feed(self, data):
+        buf = self.buf + data if self.buf else data
+        messages = []
+        offset = 0
+        while len(buf) - offset >= HEADER_LEN:
+            length, typ = struct.unpack_from('!HB', buf, offset + 16)
+            if length < HEADER_LEN or length > 65535:
+                raise ValueError('bad message length {0}'.format(length))
+            if len(buf) - offset < length:
+                break
+            messages.append((typ, buf[offset + HEADER_LEN:offset + length]))
+            offset += length
+        self.buf = buf[offset:]
+        return messages
@@ -20,17 +20,17 @@ import sys
 import yaml
 import time
 import shutil
-import netaddr
 import signal
 import datetime
 import code
 import glob
 import subprocess
+import copy
+import json
 from docker import Client
 from argparse import ArgumentParser, REMAINDER
-from itertools import chain, islice
+from itertools import chain, product
 from requests.exceptions import ConnectionError
-from pyroute2 import IPRoute
 from socket import AF_INET
 from nsenter import Namespace
 from base import *
@@ -38,12 +38,26 @@ from exabgp import ExaBGP
 from gobgp import GoBGP
 from bird import BIRD
 from quagga import Quagga
-from tester import Tester
+from tester import Tester, run_testers, tester_steps
+from pipeline import Pipeline
+from netsetup import ipr, create_br
+from impair import remove_impairments
+from profiler import Profiler, ProfilerError, parse_windows
+from clock import monotonic
+from nativetester import NativeTester
 from monitor import Monitor
 from birdmonitor import BirdMonitor
+from nativemonitor import NativeMonitor
+from bmp import BMPCollector, BMP_PORT
+from latency import collect_latencies
+from metrics import MetricsRecorder, export_csv
+from results import summarize, write_table, print_table, trial_statistics, SUMMARY_FIELDS, TRIAL_FIELDS
+from results import load_results, result_metrics, align_routes, align_time, relative_change, regressions, COMPARE_METRICS
+from prefixes import path_range, int2ip, ip2int, count_paths
 from settings import dckr
 import settings
 from Queue import Queue
+from threading import Event
 from packaging import version
 
 def rm_line():
@@ -102,29 +116,7 @@ def update(args):
         BirdMonitor.build_image(True, checkout=args.checkout, nocache=args.no_cache)
 
 
-def bench(args):
-    config_dir = '{0}/{1}'.format(args.dir, args.bench_name)
-    brname = args.bench_name + '-br'
-
-    ip = IPRoute()
-    ctn_intfs = flatten((l.get_attr('IFLA_IFNAME') for l in ip.get_links() if l.get_attr('IFLA_MASTER') == br) for br in ip.link_lookup(ifname=brname))
-
-    if not args.repeat:
-        # currently ctn name is same as ctn intf
-        # TODO support proper mapping between ctn name and intf name
-        for ctn in ctn_intfs:   # remove all existing containers with a matching name (initial run)
-            dckr.remove_container(ctn, force=True) if ctn_exists(ctn) else None
-
-        if os.path.exists(config_dir):  # ensure configuration dir is empty
-            shutil.rmtree(config_dir)
-    else:   # repetition of a prior benchmark: remove all containers but tester
-        for ctn in ctn_intfs:
-            if ctn != 'tester':
-                dckr.remove_container(ctn, force=True) if ctn_exists(ctn) else None
-
-    if not os.path.exists(config_dir): # ensure config dir exists
-        os.makedirs(config_dir)
-
+def load_conf(args, config_dir):
     if args.file:
         with open(args.file) as f:
             conf = yaml.load(f)
@@ -139,7 +131,24 @@ def bench(args):
         print 'gc_thresh3({0}) is lower than the number of peer({1})'.format(gc_thresh3(), len(conf['tester']['peers']))
         print 'type next to increase the value'
         print '$ echo 16384 | sudo tee /proc/sys/net/ipv4/neigh/default/gc_thresh3'
+    return conf
+
 
+def monitor_kind(args, conf):   # 'bird', 'native', 'bmp' or 'gobgp'
+    if args.bird_monitor or conf['monitor']['implementation'] == 'bird':
+        return 'bird'
+    if args.native_monitor or conf['monitor']['implementation'] == 'native':
+        return 'native'
+    if args.bmp_monitor or conf['monitor']['implementation'] == 'bmp':
+        if 'bmp' not in conf['target'] or not conf['target']['bmp']:    # point the BMP client of the target to the collector
+            conf['target']['bmp'] = {'address': conf['monitor']['local-address'].split('/')[0], 'port': BMP_PORT}
+        if args.target != 'gobgp':
+            print 'WARNING: BMP is only configured for target gobgp, {0} will not report any routes'.format(args.target)
+        return 'bmp'
+    return 'gobgp'
+
+
+def new_target(args, host_dir):
     if args.target == 'gobgp':
         target = GoBGP
     elif args.target == 'bird':
@@ -147,7 +156,117 @@ def bench(args):
     elif args.target == 'quagga':
         target = Quagga
 
-    bird_monitor = args.bird_monitor or conf['monitor']['implementation'] == 'bird'
+    if args.image:
+        return target(args.target, host_dir, image=args.image)
+    return target(args.target, host_dir)
+
+
+def run_target(args, conf, host_dir, brname):
+    print 'run', args.target
+    target = new_target(args, host_dir)
+    target.run(conf, brname)
+    return target
+
+
+def tester_class(args, conf):
+    if args.native_tester or ('implementation' in conf['tester'] and conf['tester']['implementation'] == 'native'):
+        return NativeTester
+    return Tester
+
+
+# replaces a local target and restarts the testers from their cache, the monitor drops its
+# session to the old target, so the next measurement starts from scratch (trials, sweep points)
+def reset_scenario(args, conf, kind, target_dir, config_dir, brname, m, target, testers):
+    for t in testers:   # the testers must not talk to the target before the next measurement starts
+        t.stop()
+    if target:
+        dckr.remove_container(target.name, force=True)
+    m.reset(conf)
+    if target:
+        target = run_target(args, conf, target_dir, brname)
+
+    time.sleep(1)
+
+    print 'waiting bgp connection between {0} and monitor'.format(args.target)
+    if kind != 'gobgp':
+        m.wait_established(conf['target']['as'])
+
+    print 'restart tester'
+    testers = run_testers(tester_class(args, conf), conf, config_dir, brname, args.tester_cpus, restart=True)
+    return target, testers
+
+
+def new_monitor(kind, config_dir):
+    if kind == 'bird':
+        print 'run Bird monitor'
+        return BirdMonitor('birdmonitor', config_dir+'/monitor')
+    elif kind == 'native':
+        print 'run native monitor'
+        return NativeMonitor('monitor', config_dir+'/monitor')
+    elif kind == 'bmp':
+        print 'run BMP collector'
+        return BMPCollector('monitor', config_dir+'/monitor')
+    print 'run monitor'
+    return Monitor('monitor', config_dir+'/monitor')
+
+
+# Boots target (unless remote), monitor and testers (unless remote) concurrently: the bridge
+# first, then all containers and the tester configs, the tester daemons once the monitor
+# is established with the target. restart keeps running tester containers (bench --repeat).
+def setup_scenario(args, conf, kind, config_dir, target_dir, brname, remote_target=False, remote_tester=False, restart=False):
+    pipeline = Pipeline('setup')
+    pipeline.add('bridge', lambda: create_br(brname))
+
+    target = None
+    if not remote_target:
+        print 'run', args.target
+        target = new_target(args, target_dir)
+        pipeline.add('target', lambda: target.run(conf, brname), after=['bridge'])
+
+    m = new_monitor(kind, config_dir)
+    pipeline.add('monitor', lambda: m.run(conf, brname), after=['bridge'])
+
+    def established():
+        time.sleep(1)
+        print 'waiting bgp connection between {0} and monitor'.format(args.target)
+        if kind != 'gobgp':
+            m.wait_established(conf['target']['as'])
+    pipeline.add('established', established, after=['monitor'] + ([] if remote_target else ['target']))
+
+    testers = []
+    if not remote_tester:
+        print 'restart tester' if restart else 'run tester'
+        testers = tester_steps(pipeline, tester_class(args, conf), conf, config_dir, brname, args.tester_cpus, restart,
+                               containers_after=['bridge'], daemons_after=['established'])
+    pipeline.run()
+    return target, m, testers
+
+
+def bench(args):
+    config_dir = '{0}/{1}'.format(args.dir, args.bench_name)
+    brname = args.bench_name + '-br'
+
+    ip = ipr()
+    ctn_intfs = flatten((l.get_attr('IFLA_IFNAME') for l in ip.get_links() if l.get_attr('IFLA_MASTER') == br) for br in ip.link_lookup(ifname=brname))
+
+    if not args.repeat:
+        # currently ctn name is same as ctn intf
+        # TODO support proper mapping between ctn name and intf name
+        for ctn in ctn_intfs:   # remove all existing containers with a matching name (initial run)
+            dckr.remove_container(ctn, force=True) if ctn_exists(ctn) else None
+
+        if os.path.exists(config_dir):  # ensure configuration dir is empty
+            shutil.rmtree(config_dir)
+    else:   # repetition of a prior benchmark: remove all containers but tester(s)
+        for ctn in ctn_intfs:
+            if not ctn.startswith('tester'):
+                dckr.remove_container(ctn, force=True) if ctn_exists(ctn) else None
+
+    if not os.path.exists(config_dir): # ensure config dir exists
+        os.makedirs(config_dir)
+
+    conf = load_conf(args, config_dir)
+    kind = monitor_kind(args, conf)
     is_target_remote = True if 'remote' in conf['target'] and conf['target']['remote'] == 'true' else False
 
     if is_target_remote:
@@ -166,36 +285,20 @@ def bench(args):
                 br = ip.link_lookup(ifname=brname)
             br = br[0]
             ip.link('set', index=idx, master=br)
-    else:
-        print 'run', args.target
-        if args.image:
-            target = target(args.target, '{0}/{1}'.format(config_dir, args.target), image=args.image)
-        else:
-            target = target(args.target, '{0}/{1}'.format(config_dir, args.target))
-        target.run(conf, brname)
 
-    if args.bird_monitor or conf['monitor']['implementation'] == 'bird':
-        print 'run Bird monitor'
-        m = BirdMonitor('birdmonitor', config_dir+'/monitor')
-    else:
-        print 'run monitor'
-        m = Monitor('monitor', config_dir+'/monitor')
-    m.run(conf, brname)
+    is_tester_remote = True if 'remote-address' in conf['tester'] and conf['tester']['remote-address'] else False
 
-    time.sleep(1)
+    if args.trials > 1 and is_tester_remote:
+        print 'repeated trials require local testers'
+        sys.exit(1)
 
-    print 'waiting bgp connection between {0} and monitor'.format(args.target)
+    if 'latency' in conf['monitor'] and conf['monitor']['latency'] and not (tester_class(args, conf) == NativeTester and kind in ['native', 'bmp']):
+        print 'WARNING: per-prefix latencies can only be measured with the native tester and the native or BMP monitor'
 
-    if args.bird_monitor or conf['monitor']['implementation'] == 'bird':
-        m.wait_established(conf['target']['as'])
-
-    is_tester_remote = True if 'remote-address' in conf['tester'] and conf['tester']['remote-address'] else False
-
-    if not args.repeat:
-        print 'run tester'
-        t = Tester('tester', config_dir+'/tester')
-        t.run(conf, brname)
-    else:
+    # with --repeat the tester container(s) are reused and restarted from their cached routes
+    target, m, testers = setup_scenario(args, conf, kind, config_dir, '{0}/{1}'.format(config_dir, args.target), brname,
+                                        remote_target=is_target_remote, remote_tester=args.repeat and is_tester_remote, restart=args.repeat)
+    if args.repeat and is_tester_remote:
         print 'Not (re-)starting local tester container'
         print 'Launching AWS/Docker based external tester with fixed number of peers' # TODO make number of peers configurable
         #call(["php", "bgpdocker/test.php"]) # launch peers while not connected to benchmark network
@@ -219,18 +322,84 @@ def bench(args):
             br = br[0]
             ip.link('set', index=idx, master=br, mtu=1446) # setting master attribute
 
+    if args.trials <= 1:
+        if args.output == 'config_dir':
+            csvfile = '{0}/output_{1}.csv'.format(config_dir, args.bench_name)
+        else:
+            csvfile = args.output
+
+        s = summarize(measure(args, conf, config_dir, args.bench_name, csvfile, target, m, testers), announced_paths(conf))
+        if target:
+            print 'memory of the target: rss {0}, anon {1}, page cache {2}, kernel {3}, peak {4}; {5:.1f} bytes per route, {6:.1f} bytes per path'.format(
+                s['rss-end'], s['anon-end'], s['file-end'], s['kernel-end'], s['mem-peak'], s['bytes-per-route'], s['bytes-per-path'])
+        return
+
+    # repeated trials, every trial has its CSV output_BENCH_NAME-trial-N.csv in the config dir,
+    # the statistics over all trials but the outliers are written to trials_BENCH_NAME.json
+    trials = []
+    for i in range(args.trials):
+        name = '{0}-trial-{1}'.format(args.bench_name, i)
+        if i > 0:
+            print 'reset for trial {0}/{1}'.format(i + 1, args.trials)
+            target, testers = reset_scenario(args, conf, kind, '{0}/{1}'.format(config_dir, args.target), config_dir, brname, m, target, testers)
+        csvfile = '{0}/output_{1}.csv'.format(config_dir, name)
+        trial = summarize(measure(args, conf, config_dir, name, csvfile, target, m, testers), announced_paths(conf))
+        trial.update({'trial': i, 'csv': csvfile})
+        trials.append(trial)
+
+    excluded, stats = trial_statistics(trials)
+    for i in excluded:
+        trials[i]['outlier'] = True
+    with open('{0}/trials_{1}.json'.format(config_dir, args.bench_name), 'w') as f:
+        json.dump({'trials': trials, 'excluded': excluded, 'statistics': stats}, f, indent=2)
+
+    print
+    print 'trials: {0}, excluded as outliers: {1}'.format(len(trials), ', '.join(str(i) for i in excluded) if excluded else 'none')
+    for field in TRIAL_FIELDS:
+        st = stats[field]
+        print '{0:>16}: mean {1:.3f}, stdev {2:.3f}, median {3:.3f}, 95% CI [{4:.3f}, {5:.3f}]'.format(field, st['mean'], st['stdev'], st['median'], st['ci95'][0], st['ci95'][1])
+
+
+def announced_paths(conf):   # number of paths the local tester peers announce to the target, None if unknown (remote testers)
+    peers = conf['tester']['peers'] if 'peers' in conf['tester'] and conf['tester']['peers'] else {}
+    return sum(count_paths(p) for p in peers.values()) if peers else None
+
+
+# Runs the measurement of a scenario whose target, monitor and testers are up,
+# until the monitor reached its check-points and the cooling period is over.
+# target is None if the target is remote. Returns the name of the metrics file.
+def measure(args, conf, config_dir, name, csvfile, target, m, testers):
+    bird_monitor = isinstance(m, BirdMonitor)
     start = datetime.datetime.now()
+    phases = [(time.time(), 'initial')] # start of every benchmark phase, used to break down latencies
 
     q = Queue()
+    stop = Event()  # ends the statistics threads of this measurement
+
+    # --profile: "all" the whole measurement, "actions" only script actions with "profile: true", or time windows "10-40,60-90"
+    profiler = None
+    if target and 'profile' in conf['target'] and conf['target']['profile']:
+        try:
+            profiler = Profiler(target.pid_lister(), config_dir, name, monotonic() - (datetime.datetime.now() - start).total_seconds(),
+                                conf['target']['profile-frequency'] if 'profile-frequency' in conf['target'] else 99)
+            if conf['target']['profile'] == 'all':
+                profiler.begin('benchmark')
+            elif conf['target']['profile'] != 'actions':
+                profiler.schedule(parse_windows(conf['target']['profile']))
+        except (ProfilerError, ValueError) as e:
+            print 'ERROR: cannot profile the target: {0}'.format(e)
+            profiler = None
 
     if 'script' in conf and len(conf['script']) > 0:
-        sequencer = Sequencer(conf['script'],start, q)
+        sequencer = Sequencer(conf['script'],start, q, testers, profiler)
     else:
         sequencer = None
 
-    m.stats(q)
-    if not is_target_remote:
-        target.stats(q)
+    m.stats(q, stop)
+    if target:
+        target.stats(q, max(0.1, float(conf['target']['stats-interval'])) if 'stats-interval' in conf['target'] else 1, stop)
+        if 'thread-stats' in conf['target'] and conf['target']['thread-stats']:
+            target.thread_stats(q, max(0.05, float(conf['target']['thread-stats'])), stop)
 
     def mem_human(v):
         if v > 1000 * 1000 * 1000:
@@ -242,20 +411,49 @@ def bench(args):
         else:
             return '{0:.2f}B'.format(float(v))
 
-    if args.output == 'config_dir':
-        f = open('{0}/output_{1}.csv'.format(config_dir, args.bench_name), 'w')
-    else:
-        f = open(args.output, 'w') if args.output else None
-
-    if f:    # add header to CSV file : "elapsed time (s.mmm), cpu, mem, recvd, prefix_delta"
-        f.write('elapsed, cpu, mem, nets, recvd, delta, time')
-        if target.cpus:
-            for cpu in target.cpus: f.write(", cpufreq_{0}".format(cpu))
-        f.write('\n')
-        f.flush()
+    # samples are recorded in metrics_<name>.bin, the CSV "elapsed time (s.mmm), cpu, mem, nets, recvd, prefix_delta, time, cpufreqs"
+    # is exported from it at the end of the benchmark
+    columns = [('elapsed', 'd'), ('cpu', 'd'), ('mem', 'L'), ('nets', 'L'), ('recvd', 'L'), ('delta', 'l'), ('time', 'd')]
+    columns += [('cpufreq_{0}'.format(c), 'L') for c in (target.cpus if target and target.cpus else [])]
+    columns += [('cpu_user', 'd'), ('cpu_system', 'd'), ('action', 'l')]   # action: bit N is set while script action N runs (N < 62)
+    columns += [('mem_rss', 'L'), ('mem_anon', 'L'), ('mem_file', 'L'), ('mem_kernel', 'L'), ('mem_peak', 'L')]  # breakdown of mem (bytes)
+    metricsfile = '{0}/metrics_{1}.bin'.format(config_dir, name)
+    recorder = MetricsRecorder(metricsfile, columns)
+    actions = []    # start and end of every script action, written to actions_<name>.csv
+    action = 0
+    churns = []     # reports of the churn actions, written to churn_<name>.json
+    flaps = []      # reports of the waves of the flap_peers actions, written to flaps_<name>.json
+    threads = {}    # (tid, name) -> [samples, sum, max] of the cpu usage of the threads of the target
+    threadfile = [None]   # threads_<name>.csv, written while sampling
+
+    def finish_metrics():
+        stop.set()
+        remove_impairments()    # left in place by impair actions without duration
+        recorder.close()
+        if profiler:
+            print 'profile of the target written to {0}'.format(profiler.close())
+        if threadfile[0]:
+            threadfile[0].close()
+            busiest = sorted(threads.items(), key=lambda (k, v): -v[2])[:5]
+            if busiest:
+                print 'busiest threads of the target: ' + ', '.join('{0} ({1}) max {2:.1f}% mean {3:.1f}%'.format(
+                    thread, tid, v[2], v[1] / v[0]) for (tid, thread), v in busiest)
+        if actions:
+            write_table('{0}/actions_{1}.csv'.format(config_dir, name), actions, ['action', 'type', 'start', 'end', 'success'])
+        if churns:
+            with open('{0}/churn_{1}.json'.format(config_dir, name), 'w') as f:
+                json.dump(churns, f, indent=2)
+        if flaps:
+            with open('{0}/flaps_{1}.json'.format(config_dir, name), 'w') as f:
+                json.dump(flaps, f, indent=2)
+        if csvfile:
+            export_csv(metricsfile, csvfile, formats={'time': lambda t: '{:%Y-%m-%d %H:%M:%S}'.format(datetime.datetime.fromtimestamp(t))})
 
     cpu = 0
     mem = 0
+    memory = {}     # rss, anon, file, kernel and peak memory of the target
+    cpu_user = 0
+    cpu_system = 0
     cpufreqs = []
     prefix_delta = 0
     max_prefixes = 0
@@ -264,6 +462,7 @@ def bench(args):
     if sequencer: sequencer.start()
 
     def sigint_handler(signum, frame):
+        finish_metrics()
         teardown()
         sys.exit(130) # int 0 as return code means successfull termination. int 130 see http://www.tldp.org/LDP/abs/html/exitcodes.html#EXITCODESREF
 
@@ -272,10 +471,13 @@ def bench(args):
     while True:
         info = q.get()
 
-        if not is_target_remote and info['who'] == target.name:
+        if target and info['who'] == target.name:
             cpu = info['cpu']
             mem = info['mem']
+            memory = info['memory'] if 'memory' in info else {}
             cpufreqs = info['cpufreqs'] if 'cpufreqs' in info and len(info['cpufreqs']) > 0 else []
+            cpu_user = info['user'] if 'user' in info else 0
+            cpu_system = info['system'] if 'system' in info else 0
 
 
         if info['who'] == m.name:
@@ -298,20 +500,25 @@ def bench(args):
             if expected_prefixes > 0:
                 prefix_delta = expected_prefixes - recved
 
-            print 'now: {0}, elapsed: {1} sec, cpu: {2:>4.2f}%, mem: {3}, routes: {4}, max_prefixes: {5}, delta: {6}'.format(nowstring, elapsed.total_seconds(), cpu, mem_human(mem), recved, max_prefixes, prefix_delta)
+            print 'now: {0}, elapsed: {1} sec, cpu: {2:>4.2f}%, mem: {3} (anon {7}), routes: {4}, max_prefixes: {5}, delta: {6}'.format(nowstring, elapsed.total_seconds(), cpu, mem_human(mem), recved, max_prefixes, prefix_delta, mem_human(memory['anon'] if 'anon' in memory else 0))
             if prefix_delta < 0:
                 print "WARNING: negative prefix delta indicating inaccurate (e.g. too low) number of routes given in WaitConvergentAction!"
             if sequencer: sequencer.notify((elapsed, cpu, mem, recved)) # TODO pass delta to sequencer?
 
-            if f:# write statistics
-                f.write('{0}, {1}, {2}, {3}, {4}, {5}, {6}'.format(elapsed.total_seconds(), cpu, mem, networks, recved, prefix_delta, nowstring))
-                for freq in cpufreqs: f.write(", {0}".format(freq[1]))
-                f.write('\n')
-                f.flush()
+            values = {'elapsed': elapsed.total_seconds(), 'cpu': cpu, 'mem': mem, 'nets': networks, 'recvd': recved,
+                      'delta': prefix_delta, 'time': time.mktime(now.timetuple()) + now.microsecond / 1e6, 'cpu_user': cpu_user, 'cpu_system': cpu_system,
+                      'action': action}
+            for freq in cpufreqs: values['cpufreq_{0}'.format(freq[0])] = freq[1]
+            for k, v in memory.items(): values['mem_' + k] = v
+            recorder.record(values)
 
             if cooling == args.cooling:
-                f.close() if f else None
-                return
+                finish_metrics()
+                if isinstance(m, (NativeMonitor, BMPCollector)) and m.arrivals is not None:
+                    latencies = collect_latencies(testers, m.arrivals, phases)
+                    latencies.report()
+                    latencies.write('{0}/latency_{1}.json'.format(config_dir, name))
+                return metricsfile
 
             if cooling >= 0:
                 cooling += 1
@@ -319,11 +526,171 @@ def bench(args):
             if info['checked']:
                 cooling = 0
 
+        if info['who'] == 'threads':   # "elapsed, pid, tid, name, cpu, user, system" per thread and sample
+            if threadfile[0] is None:
+                threadfile[0] = open('{0}/threads_{1}.csv'.format(config_dir, name), 'w')
+                threadfile[0].write('elapsed, pid, tid, name, cpu, user, system\n')
+            t = (datetime.datetime.now() - start).total_seconds()
+            for pid, tid, thread, tcpu, tuser, tsystem in info['threads']:
+                threadfile[0].write('{0:.3f}, {1}, {2}, {3}, {4:.2f}, {5:.2f}, {6:.2f}\n'.format(
+                    t, pid, tid, thread.replace(',', '_'), tcpu, tuser, tsystem))
+                v = threads.setdefault((tid, thread), [0, 0.0, 0.0])
+                v[0] += 1
+                v[1] += tcpu
+                v[2] = max(v[2], tcpu)
+
         if info['who'] == 'sequencer': # accept input from sequencer
-            print info['message']
+            if 'message' in info:
+                print info['message']
+            if 'phase' in info:
+                phases.append((time.time(), info['phase']))
+            if 'churn' in info:
+                churns.append(info['churn'])
+            if 'flaps' in info:
+                flaps.extend(info['flaps'])
+            if 'action-start' in info:
+                i, kind, t = info['action-start']
+                actions.append({'action': i, 'type': kind, 'start': '{0:.6f}'.format(t), 'end': '', 'success': ''})
+                action |= 1 << i if i < 62 else 0
+            if 'action-end' in info:
+                i, kind, t, ok = info['action-end']
+                for a in actions:
+                    if a['action'] == i:
+                        a.update({'end': '{0:.6f}'.format(t), 'success': ok})
+                action &= ~(1 << i)
             if 'action' in info and info['action'] == 'WaitConvergentAction':
                 expected_prefixes = info['prefixes'] # update the expected number of prefixes
 
+def sweep_values(parser, param):  # "name=v1,v2,.." -> (dest, list of values converted like the command line argument --name)
+    name, values = param.split('=', 1)
+    name = name.strip().lstrip('-')
+    values = values.split(',')
+    if values in [['true'], ['false'], ['true', 'false'], ['false', 'true']]:    # flag
+        return name.replace('-', '_'), [getattr(parser.parse_args(['--' + name] if v == 'true' else []), name.replace('-', '_')) for v in values]
+    return name.replace('-', '_'), [getattr(parser.parse_args(['--' + name, v]), name.replace('-', '_')) for v in values]
+
+
+# Runs a benchmark for every point of the matrix targets x swept gen_conf arguments.
+# The bridge and the monitor are set up once, the tester containers are kept
+# and restarted from their route cache for every point (shards whose peers did
+# not change are not encoded again), only the target is replaced per point.
+# Every point gets a directory point-N in the config dir with its scenario,
+# metrics and CSV output, the summaries of all points are written to
+# sweep_BENCH_NAME.csv.
+def sweep(args):
+    config_dir = '{0}/{1}'.format(args.dir, args.bench_name)
+    brname = args.bench_name + '-br'
+
+    if args.target_remote or args.tester_remote_address:
+        print 'sweep requires a local target and local testers'
+        sys.exit(1)
+
+    params = [sweep_values(args.parent_parser, p) for p in args.param]    # unknown arguments end bgperf with a usage message
+    points = list(product(args.targets, *[values for dest, values in params]))
+
+    ip = ipr()
+    ctn_intfs = flatten((l.get_attr('IFLA_IFNAME') for l in ip.get_links() if l.get_attr('IFLA_MASTER') == br) for br in ip.link_lookup(ifname=brname))
+    for ctn in ctn_intfs:   # start from scratch, like bench without --repeat
+        dckr.remove_container(ctn, force=True) if ctn_exists(ctn) else None
+    if os.path.exists(config_dir):
+        shutil.rmtree(config_dir)
+    os.makedirs(config_dir)
+
+    columns = ['point', 'target'] + [dest.replace('_', '-') for dest, values in params] + SUMMARY_FIELDS
+    m = None
+    kind = None
+    target = None
+    testers = []
+    rows = []
+    for i, point in enumerate(points):
+        point_args = copy.copy(args)
+        point_args.target = point[0]
+        for (dest, values), v in zip(params, point[1:]):
+            setattr(point_args, dest, v)
+        name = 'point-{0}'.format(i)
+        point_dir = '{0}/{1}'.format(config_dir, name)
+        os.makedirs(point_dir)
+        print 'sweep {0} ({1}/{2}): target {3} {4}'.format(name, i + 1, len(points), point_args.target,
+                                                          ' '.join('{0}={1}'.format(dest.replace('_', '-'), v) for (dest, values), v in zip(params, point[1:])))
+
+        conf = load_conf(point_args, point_dir)
+        if kind is not None and monitor_kind(point_args, conf) != kind:
+            print 'the monitor implementation cannot change between the points of a sweep'
+            sys.exit(1)
+        kind = monitor_kind(point_args, conf)
+
+        if m is None:
+            target, m, testers = setup_scenario(point_args, conf, kind, config_dir, '{0}/{1}'.format(point_dir, point_args.target), brname, restart=True)
+        else:
+            target, testers = reset_scenario(point_args, conf, kind, '{0}/{1}'.format(point_dir, point_args.target), config_dir, brname, m, target, testers)
+
+        metricsfile = measure(point_args, conf, point_dir, name, '{0}/output_{1}.csv'.format(point_dir, name), target, m, testers)
+
+        row = summarize(metricsfile, announced_paths(conf))
+        row.update({'point': name, 'target': point_args.target})
+        row.update(dict((dest.replace('_', '-'), v) for (dest, values), v in zip(params, point[1:])))
+        rows.append(row)
+        write_table('{0}/sweep_{1}.csv'.format(config_dir, args.bench_name), rows, columns)   # after every point, partial sweeps keep their results
+
+    print
+    print_table(rows, columns)
+
+# Compares result sets (CSV output of bench or metrics files) against the first one,
+# the baseline. Exits with 1 if any metric of a result set is worse than the baseline
+# by more than its threshold.
+def compare(args):
+    thresholds = dict((name, args.threshold) for name in COMPARE_METRICS)
+    for t in args.metric_threshold:
+        metric, value = t.split('=', 1)
+        if metric not in thresholds:
+            print 'unknown metric {0}, choose from {1}'.format(metric, ', '.join(COMPARE_METRICS))
+            sys.exit(2)
+        thresholds[metric] = float(value)
+
+    if len(args.results) < 2:
+        print 'compare needs a baseline and at least one result set'
+        sys.exit(2)
+    results = [load_results(f) for f in args.results]
+    empty = [f for f, r in zip(args.results, results) if not r.get('elapsed')]
+    if empty:
+        print 'no samples in {0}'.format(', '.join(empty))
+        sys.exit(2)
+    metrics = [result_metrics(r) for r in results]
+    names = [os.path.basename(f) for f in args.results]
+
+    # alignment of the samples on route count (elapsed time at 1/N .. N/N of the final routes) or on elapsed time
+    n = args.points
+    if args.align == 'routes':
+        fractions = [(i + 1.0) / n for i in range(n)]
+        print 'elapsed time (s) when the share of the final routes was reached'
+        aligned = [align_routes(r, fractions) for r in results]
+        rows = [dict([('routes', '{0:.0f}%'.format(100 * f))] + [(name, a[i]) for name, a in zip(names, aligned)]) for i, f in enumerate(fractions)]
+        print_table(rows, ['routes'] + names)
+    else:
+        end = min(r['elapsed'][-1] for r in results)
+        times = [end * (i + 1) / n for i in range(n)]
+        print 'routes received at elapsed time'
+        aligned = [align_time(r, times) for r in results]
+        rows = [dict([('elapsed', '{0:.1f}'.format(t))] + [(name, int(a[i]) if a[i] is not None else None) for name, a in zip(names, aligned)]) for i, t in enumerate(times)]
+        print_table(rows, ['elapsed'] + names)
+
+    print
+    rows = []
+    failed = False
+    for i, (name, m) in enumerate(zip(names, metrics)):
+        row = {'result': name}
+        for metric in COMPARE_METRICS:
+            row[metric] = '{0:.1f}'.format(m[metric]) if i == 0 else '{0:.1f} ({1:+.1f}%)'.format(m[metric], relative_change(metrics[0][metric], m[metric]))
+        worse = regressions(metrics[0], m, thresholds) if i > 0 else []
+        row['regressions'] = ', '.join(worse) if worse else '-'
+        failed = failed or len(worse) > 0
+        rows.append(row)
+    print_table(rows, ['result'] + COMPARE_METRICS + ['regressions'])
+    if failed:
+        print 'regression beyond threshold against baseline {0}'.format(names[0])
+        sys.exit(1)
+
+
 def gen_conf(args):
     neighbor = args.neighbor_num
     prefix = args.prefix_num
@@ -339,25 +706,34 @@ def gen_conf(args):
         'local-address': '10.10.0.1/16',
         'remote': 'true' if args.target_remote else '', # only empty strings evaluate to false!
         'custom-config': args.target_custom_konfig if args.target_custom_konfig else '',
+        'stats-interval': args.stats_interval,
+        'thread-stats': args.thread_stats,
+        'profile': args.profile,
+        'profile-frequency': args.profile_frequency,
     }
+    if args.bmp_monitor:
+        conf['target']['bmp'] = {'address': '10.10.0.2', 'port': BMP_PORT}
 
     conf['monitor'] = {
-        'implementation': 'bird' if args.bird_monitor else 'gobgp',
+        'implementation': 'bird' if args.bird_monitor else 'native' if args.native_monitor else 'bmp' if args.bmp_monitor else 'gobgp',
         'as': 1001,
         'router-id': '10.10.0.2',
         'local-address': '10.10.0.2/16',
         'check-points': [prefix * neighbor],
+        'measurement-interval': args.measurement_interval,
+        'latency': args.latency,
     }
 
     conf['tester'] = {
+        'implementation': 'native' if args.native_tester else 'exabgp',
+        'shards': args.tester_shards,
+        'shard-mode': args.tester_shard_mode,
         'remote-address': args.tester_remote_address,
         'peers': {},
         #FIXME remove 'remote': 'true' if args.remote_tester else '',
     }
     offset = 0  #FIXME unused -> git blame
 
-    it = netaddr.iter_iprange('90.0.0.0', '100.0.0.0')
-
     conf['policy'] = {}
 
     assignment = []
@@ -367,7 +743,7 @@ def gen_conf(args):
         conf['policy'][name] = {
             'match': [{
                 'type': 'prefix',
-                'value': list('{0}/32'.format(ip) for ip in islice(it, prefix_list)),
+                'ranges': [path_range('90.0.0.0', prefix_list)],
             }],
         }
         assignment.append(name)
@@ -403,7 +779,8 @@ def gen_conf(args):
         assignment.append(name)
 
     # generate neighbors for tester section, skip if all neighbors are remote
-    it = netaddr.iter_iprange('100.0.0.0','160.0.0.0')
+    # paths are described as compact ranges, see prefixes.py
+    base = ip2int('100.0.0.0')
     if args.tester_remote_address:
         #print 'EXPERIMENTAL expecting remote tester with bgp neighbors at IPv4 addresses:' #FIXME remove EXPERIMENTAL tag
         #asns = [9063, 34966, 50469, 37468, 39090, 5539]
@@ -429,7 +806,7 @@ def gen_conf(args):
                 'as': 1000 + i,
                 'router-id': router_id,
                 'local-address': router_id + '/20',
-                'paths': list('{0}/32'.format(ip) for ip in islice(it, prefix)),
+                'path-ranges': [path_range(int2ip(base + (i - 3) * prefix), prefix)],
                 'filter': {
                     args.filter_type: assignment,
                 },
@@ -464,19 +841,18 @@ def teardown():
         c.stop('monitor') #stop the monitor container
         #c.remove_container('monitor')#remove the monitor container
         #print([x.get_attr('IFLA_IFNAME') for x in ip.get_links()])
-        ipr = IPRoute()
+        ip = ipr()
         # lookup the index
-        dev = ipr.link_lookup(ifname='bgperf-br')[0]
+        dev = ip.link_lookup(ifname='bgperf-br')[0]
         # bring it down
-        ipr.link('set', index=dev, state='down')
+        ip.link('set', index=dev, state='down')
         #print (os.listdir("/tmp"))
         print 'removing temp files...'
         #for fl in glob.glob("/tmp/*.tmp"):
         #        os.remove(fl)
         #print (os.listdir("/tmp"))
 
-        #TODO uncomment if necessary ok, output = getoutput(['comcast', '--device=eno2', '--stop'])
-        print (ok,output)
+        remove_impairments()
 
 def cleanup(args): # remove possibly every trace of bgperf from the system
         teardown(args) # start by calling cleanup
@@ -523,26 +899,53 @@ if __name__ == '__main__':
     parser_parent_bench_config.add_argument('--target-remote', action='store_true', help='generate a config with remote target (bgpd) as described in docs/benchmark_remote_target.md')
     parser_parent_bench_config.add_argument('--target-ASN', default=1000, type=int, help='the Autonomous System Number (ASN) to be used for the target bgpd implementation')
     parser_parent_bench_config.add_argument('-k', '--target-custom-konfig', metavar='TARGET_CONFIG_FILE', help='override the configuration file of the target bgpd. Use this instead of the generated one. EXPERIMENTAL currently supported for target=bird/bird_mt') # misspelling of config as konfig is intendet to give a hint to the user for single letter parameter -k
-    parser_parent_bench_config.add_argument('-m', '--measurement-interval', default=1, type=int, help='reporting interval (in seconds) of the statistics collected by monitor (stdout and file)')
+    parser_parent_bench_config.add_argument('-m', '--measurement-interval', default=1, type=float, help='reporting interval (in seconds) of the statistics collected by monitor (stdout and file)')
+    parser_parent_bench_config.add_argument('--stats-interval', default=1, type=float, help='sampling interval (in seconds, down to 0.1) of cpu and memory usage of the target, read from its cgroup')
+    parser_parent_bench_config.add_argument('--thread-stats', metavar='INTERVAL', type=float, help='sample the cpu usage of every thread of the target every INTERVAL seconds (down to 0.05) from /proc, written to threads_<name>.csv')
+    parser_parent_bench_config.add_argument('--profile', metavar='WINDOWS', nargs='?', const='all', help='profile the target with perf record during the whole measurement, only during script actions with "profile: true" ("actions") or in time windows of the benchmark (e.g. "10-40,60-90" seconds), folded stacks are written to profile_<name>.folded')
+    parser_parent_bench_config.add_argument('--profile-frequency', default=99, type=int, help='sampling frequency (Hz) of --profile')
     parser_parent_bench_config.add_argument('-s', '--script', metavar='ACTION SCRIPT_FILE', help='action script file is included scenario.yaml and saved to output folder. The contents of ACTION SCRIPT FILE take precedence over any script present in CONFIG FILE.')
     parser_parent_bench_config.add_argument('-y', '--bird-monitor', action='store_true', help='use alternative BIRD monitor implementation for satistics collection')
+    parser_parent_bench_config.add_argument('--native-monitor', action='store_true', help='use the monitor built into bgperf that peers with the target directly instead of a monitor container')
+    parser_parent_bench_config.add_argument('--bmp-monitor', action='store_true', help='collect the routes with the BMP collector built into bgperf, the target streams them via BMP (gobgp only)')
+    parser_parent_bench_config.add_argument('--latency', action='store_true', help='measure the propagation latency of every prefix, requires --native-tester and --native-monitor or --bmp-monitor')
+    parser_parent_bench_config.add_argument('--native-tester', action='store_true', help='use the built-in BGP speaker (speaker.py) instead of one ExaBGP daemon per peer as tester')
+    parser_parent_bench_config.add_argument('--tester-shards', default=1, type=int, help='spread the tester peers over this number of shards, each with its own part of the tester cpuset')
+    parser_parent_bench_config.add_argument('--tester-shard-mode', choices=['container', 'process'], default='container', help='run every shard in a tester container of its own or as a multi-neighbor process in a single tester container')
 
     parser_bench = s.add_parser('bench', parents=[parser_parent_bench_config], help='run benchmarks')
     parser_bench.add_argument('-t', '--target', choices=['gobgp', 'bird', 'quagga'], default='gobgp')
     parser_bench.add_argument('-i', '--image', help='specify custom docker image')
-    parser_bench.add_argument('-r', '--repeat', action='store_true', help='use existing tester/monitor container')
+    parser_bench.add_argument('-r', '--repeat', action='store_true', help='use existing tester container(s), their daemons are restarted from the cached routes in the config dir')
     parser_bench.add_argument('-f', '--file', metavar='CONFIG_FILE')
     parser_bench.add_argument('-g', '--cooling', default=0, type=int)
+    parser_bench.add_argument('--trials', default=1, type=int, help='run the scenario this number of times, resetting target, monitor session and testers in between, and report mean, stdev, median and 95%% confidence interval of convergence time, peak memory and peak cpu')
     parser_bench.add_argument('-o', '--output', metavar='STAT_FILE', help='special value \"config_dir\" generates output to the config directory in a file named output_BENCH_NAME.csv')
     parser_bench.add_argument('--tester-cpus', type=str, default=settings.cpuset_tester, help='Override cpuset-cpus of tester container, default \"{0}\" (from settings.py)'.format(settings.cpuset_tester))
     parser_bench.add_argument('--target-cpus', type=str, default=settings.cpuset_target, help='Override cpuset-cpus of target container, default \"{0}\" (from settings.py)'.format(settings.cpuset_target))
     parser_bench.add_argument('--monitor-cpus', type=str, default=settings.cpuset_monitor, help='Override cpuset-cpus of monitor container, default \"{0}\" (from settings.py)'.format(settings.cpuset_monitor))
     parser_bench.set_defaults(func=bench)
 
+    parser_sweep = s.add_parser('sweep', parents=[parser_parent_bench_config], help='run a benchmark for every point of a parameter matrix, reusing bridge, monitor and testers')
+    parser_sweep.add_argument('-t', '--targets', nargs='+', choices=['gobgp', 'bird', 'quagga'], default=['gobgp'])
+    parser_sweep.add_argument('-P', '--param', action='append', default=[], metavar='NAME=V1,V2,..', help='sweep the benchmark argument --NAME over the given values, e.g. neighbor-num=10,100,1000 (repeatable, the points are all combinations)')
+    parser_sweep.add_argument('-i', '--image', help='specify custom docker image')
+    parser_sweep.add_argument('-g', '--cooling', default=0, type=int)
+    parser_sweep.add_argument('--tester-cpus', type=str, default=settings.cpuset_tester, help='Override cpuset-cpus of tester container, default \"{0}\" (from settings.py)'.format(settings.cpuset_tester))
+    parser_sweep.set_defaults(func=sweep, parent_parser=parser_parent_bench_config, file=None)
+
     parser_config = s.add_parser('config', parents=[parser_parent_bench_config], help='generate config')
     parser_config.add_argument('-o', '--output', default='bgperf.yml', type=str)
     parser_config.set_defaults(func=config)
 
+    parser_compare = s.add_parser('compare', help='compare result sets (CSV output of bench or metrics files) against a baseline')
+    parser_compare.add_argument('results', nargs='+', metavar='RESULT', help='the first result set is the baseline')
+    parser_compare.add_argument('--align', choices=['routes', 'time'], default='routes', help='align the samples on the share of received routes or on elapsed time')
+    parser_compare.add_argument('--points', default=10, type=int, help='number of alignment points')
+    parser_compare.add_argument('-T', '--threshold', default=10.0, type=float, help='tolerated regression of every metric in percent of the baseline, exit code 1 beyond')
+    parser_compare.add_argument('--metric-threshold', action='append', default=[], metavar='METRIC=PERCENT', help='tolerated regression of a single metric ({0})'.format(', '.join(COMPARE_METRICS)))
+    parser_compare.set_defaults(func=compare)
+
     parser_teardown = s.add_parser('teardown', help='teardown of benchmark run')
     parser_config.set_defaults(func=teardown)
 
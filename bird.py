@@ -16,10 +16,13 @@
 from base import *
 from shutil import copyfile
 from settings import cpuset_target
+from prefixes import match_values
+from birdctl import BirdControl
 
 class BIRD(Container):
     def __init__(self, name, host_dir, guest_dir='/root/config', image='bgperf/bird'):
         super(BIRD, self).__init__(name, image, host_dir, guest_dir)
+        self.ctl = BirdControl('{0}/bird.ctl'.format(host_dir))   # persistent connection to the control socket in host_dir
 
     @classmethod
     def build_image(cls, force=False, tag='bgperf/bird', checkout='HEAD', nocache=False):
@@ -106,7 +109,7 @@ prefixes = [
 if net ~ prefixes then return false;
 return true;
 }}
-'''.format(name, ',\n'.join(match['value']))
+'''.format(name, ',\n'.join(match_values(match)))
 
         def gen_aspath_filter(name, match):
             c = '''function {0}()
@@ -209,7 +212,7 @@ return true;
 ulimit -n 65536
 mkdir -p /var/log/bird
 ip a add {0} dev eth1
-bird -c {1}/{2}
+bird -c {1}/{2} -s {1}/bird.ctl
 '''.format(conf['target']['local-address'], self.guest_dir, self.config_name)
         filename = '{0}/start.sh'.format(self.host_dir)
         with open(filename, 'w') as f:
@@ -217,4 +220,10 @@ bird -c {1}/{2}
         os.chmod(filename, 0777)
         i = dckr.exec_create(container=self.name, cmd='{0}/start.sh'.format(self.guest_dir))
         dckr.exec_start(i['Id'], detach=True, socket=True)
+        self.wait_ready()
         return ctn
+
+    def wait_ready(self):   # BIRD has read its config and is up once its control socket greets us
+        self.ctl.close()
+        self.ctl.connect()
+        print 'BIRD target is up: {0}'.format(self.ctl.command('show status')[0][1])
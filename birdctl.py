@@ -0,0 +1,119 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Client for the BIRD control socket (the protocol spoken by birdc).
+#
+# BIRD is started with its control socket in the bind-mounted config dir, so
+# bgperf can keep one connection open for the whole benchmark instead of
+# spawning birdc with docker exec for every command.
+#
+# Every reply consists of lines "DDDD-text" (more lines follow), " text"
+# (continuation of the previous code) and is terminated by a line "DDDD text".
+# Codes 8000-9999 are errors. Commands can be pipelined: all of them are sent
+# at once and the replies are read back in order.
+
+import time
+import socket
+from threading import Lock
+
+
+class BirdControlError(Exception):
+    pass
+
+
+class BirdControl(object):
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+        self.buf = ''
+        self.lock = Lock()
+
+    def connect(self):  # waits until BIRD has created its control socket
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+                break
+            except socket.error:
+                sock.close()
+                if time.time() > deadline:
+                    raise BirdControlError('no BIRD control socket at {0}'.format(self.path))
+                time.sleep(0.1)
+        self.sock = sock
+        self.buf = ''
+        self.read_reply()   # greeting, similar to "0001 BIRD 1.6.3 ready."
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def readline(self):
+        while '\n' not in self.buf:
+            data = self.sock.recv(1 << 16)
+            if not data:
+                raise BirdControlError('BIRD closed the control socket')
+            self.buf += data
+        line, self.buf = self.buf.split('\n', 1)
+        return line
+
+    def read_reply(self):   # returns a list of (code, text) tuples
+        reply = []
+        code = None
+        while True:
+            line = self.readline()
+            if line.startswith(' '):    # continuation of the previous code
+                reply.append((code, line[1:]))
+                continue
+            code = int(line[:4])
+            reply.append((code, line[5:]))
+            if line[4:5] != '-':
+                return reply
+
+    def commands(self, cmds):   # pipelined: send all commands, read all replies, then raise on an error reply
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+            try:
+                self.sock.sendall(''.join(c + '\n' for c in cmds))
+                replies = [self.read_reply() for c in cmds]
+            except (socket.error, BirdControlError, ValueError) as e:   # reconnect on the next call
+                self.close()
+                raise BirdControlError(str(e))
+        for cmd, reply in zip(cmds, replies):
+            if reply[-1][0] >= 8000:
+                raise BirdControlError('{0}: {1}'.format(cmd, reply[-1][1]))
+        return replies
+
+    def command(self, cmd):
+        return self.commands([cmd])[0]
+
+    # helpers for the replies used by bgperf
+
+    def route_count(self):  # "0 of 0 routes for 0 networks"
+        for code, text in self.command('show route count'):
+            elements = text.split()
+            if len(elements) >= 6 and elements[1] == 'of':
+                return {'routes-matching': elements[0], 'routes-all': elements[2], 'unique-networks': elements[5]}
+        return {}
+
+    def protocol_established(self, name):
+        for code, text in self.command('show protocols {0}'.format(name)):
+            elements = text.split()
+            if len(elements) > 0 and elements[0] == name:
+                return 'Established' in elements
+        return False
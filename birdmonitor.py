@@ -14,13 +14,13 @@
 # limitations under the License.
 
 from base import *
+from birdctl import BirdControl
 import os
 from  settings import dckr
 import yaml
 import json
-from threading import Thread
+from threading import Thread, Event
 import time
-import StringIO
 import itertools
 import code
 
@@ -28,6 +28,7 @@ class BirdMonitor(Container):
     def __init__(self, name, host_dir, guest_dir='/root/config', image='bgperf/monitorbird'):
         super(BirdMonitor, self).__init__(name, image, host_dir, guest_dir)
         self.config = None
+        self.ctl = BirdControl('{0}/bird.ctl'.format(host_dir))   # persistent connection to the control socket in host_dir
 
     @classmethod
     def build_image(cls, force=False, tag='bgperf/monitorbird', checkout='v1.6.3', nocache=False): # Use v1.6.3 as the latest stable version
@@ -93,7 +94,7 @@ protocol bgp bgp_{2} {{
 ulimit -n 65536
 ip a add {0} dev eth1
 mkdir -p /var/log/bird
-bird -c {1}/{2}
+bird -c {1}/{2} -s {1}/bird.ctl
 '''.format(conf['monitor']['local-address'], self.guest_dir, self.config_name)
 
         filename = '{0}/start.sh'.format(self.host_dir)
@@ -110,33 +111,22 @@ bird -c {1}/{2}
         return dckr.exec_start(i['Id'], stream=stream)
 
     def wait_established(self, target_as): # poll monitor bird if the session to the bgpd under test is established
-        while True:
-            stream = self.local('birdc show protocol bgp_{0}'.format(target_as))
-            #print stream # TODO extract to method
-            buf = StringIO.StringIO(stream)
-            buf.readline() # Skip first line similar to "BIRD 1.6.3 ready."
-            header = buf.readline().split() # read line simlar to "name     proto    table    state  since       info"
-            elements = buf.readline().split() # read line similar to "bgp_65534 BGP      table_65534 up     2017-03-01 16:00:30  Established"
-            neigh = dict(zip(header, elements))
-            if neigh['info'] == 'Established':
-                return
-            time.sleep(1)
-
-    def stats(self, queue):
+        while not self.ctl.protocol_established('bgp_{0}'.format(target_as)):
+            time.sleep(0.1)
+
+    def reset(self, conf): # drops the session to the target, e.g. when the target is replaced between the points of a sweep
+        self.config = conf
+        self.ctl.command('restart bgp_{0}'.format(conf['target']['as']))
+
+    def stats(self, queue, stop=None):
+        stop = stop if stop else Event()
+
         def stats():
-            cps = self.config['monitor']['check-points'] if 'check-points' in self.config['monitor'] else []
-            while True:
+            cps = list(self.config['monitor']['check-points']) if 'check-points' in self.config['monitor'] else []  # consumed, conf is reused by every trial
+            interval = self.config['monitor']['measurement-interval'] if 'measurement-interval' in self.config['monitor'] else 1
+            while not stop.is_set():
                 info = {}
-                info ['who'] = self.name
-
-                stream = self.local('birdc show route count')
-                buf = StringIO.StringIO(stream)
-                buf.readline() # Skip first line similar to "BIRD 1.6.3 ready."
-                elements = buf.readline().split() # read line similar to "0 of 0 routes for 0 networks"
-                info ['state'] = {}
-                info ['state'] ['routes-matching'] = elements[0]
-                info ['state'] ['routes-all'] = elements[2]
-                info ['state'] ['unique-networks'] = elements[5]
+                info ['state'] = self.ctl.route_count()   # "0 of 0 routes for 0 networks"
 
                 info['who'] = self.name
                 state = info['state']
@@ -148,7 +138,7 @@ bird -c {1}/{2}
                     info['checked'] = False
 
                 queue.put(info)
-                time.sleep(1)
+                time.sleep(interval)
 
         t = Thread(target=stats)
         t.daemon = True
@@ -0,0 +1,229 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# BGP Monitoring Protocol (RFC 7854) collector.
+#
+# Instead of peering with the target, the target streams its adj-rib-in of
+# every tester peer to bgperf via BMP. The collector parses Route Monitoring,
+# Peer Up and Peer Down messages as they arrive and keeps the adj-rib-in of
+# every monitored neighbor. Its samples have the same layout as the ones of
+# Monitor (GoBGP), 'accepted' being the sum of all adj-rib-in counts, plus
+# the count of every neighbor in 'neighbors'.
+#
+# Everything received is also written to bmp.dump in the monitor directory,
+# such a capture can be fed through the collector again with replay().
+
+import os
+import time
+import socket
+import struct
+from threading import Thread, Event
+from bgp import HEADER_LEN, UPDATE, decode_update
+
+BMP_PORT = 11019
+
+ROUTE_MONITORING = 0
+STATISTICS_REPORT = 1
+PEER_DOWN = 2
+PEER_UP = 3
+INITIATION = 4
+TERMINATION = 5
+
+COMMON_HEADER_LEN = 6
+PEER_HEADER_LEN = 42
+PEER_FLAG_IPV6 = 0x80
+PEER_FLAG_POST_POLICY = 0x40
+
+
+def decode_peer_header(data, offset):
+    typ, flags = struct.unpack_from('!BB', data, offset)
+    if flags & PEER_FLAG_IPV6:
+        address = socket.inet_ntop(socket.AF_INET6, data[offset + 10:offset + 26])
+    else:
+        address = socket.inet_ntoa(data[offset + 22:offset + 26])
+    asn, = struct.unpack_from('!I', data, offset + 26)
+    sec, usec = struct.unpack_from('!II', data, offset + 34)
+    return {'type': typ, 'flags': flags, 'address': address, 'as': asn,
+            'post-policy': bool(flags & PEER_FLAG_POST_POLICY), 'timestamp': sec + usec / 1000000.0}
+
+
+class BMPReader(object):
+    # incremental parser for a stream of BMP messages, returns (type, message) tuples
+    def __init__(self):
+        self.buf = ''
+
+    def feed(self, data):
+        buf = self.buf + data if self.buf else data
+        messages = []
+        offset = 0
+        while len(buf) - offset >= COMMON_HEADER_LEN:
+            version, length, typ = struct.unpack_from('!BIB', buf, offset)
+            if version != 3 or length < COMMON_HEADER_LEN:
+                raise ValueError('bad BMP message (version {0}, length {1})'.format(version, length))
+            if len(buf) - offset < length:
+                break
+            messages.append((typ, buf[offset:offset + length]))
+            offset += length
+        self.buf = buf[offset:]
+        return messages
+
+
+class BMPCollector(object):
+    def __init__(self, name, host_dir):
+        self.name = name
+        self.host_dir = host_dir
+        if not os.path.exists(host_dir):
+            os.makedirs(host_dir)
+        self.config = None
+        self.sock = None
+        self.conn = None            # current BMP session of the target
+        self.established = Event()  # set once the target has connected
+        self.neighbors = {}     # (neighbor address, post-policy) -> set of prefixes
+        self.up = set()         # neighbors with an established session
+        self.received = 0
+        self.withdrawn = 0
+        self.updates = 0
+        self.arrivals = None    # prefix -> first timestamp reported by the target, only kept if latencies are measured
+
+    def run(self, conf, brname=''):
+        self.config = conf
+        if 'latency' in conf['monitor'] and conf['monitor']['latency']:
+            self.arrivals = {}
+        if brname != '':
+            from netsetup import add_br_addr   # needs docker, not imported with the module
+            add_br_addr(brname, conf['monitor']['local-address'])
+        address = conf['monitor']['local-address'].split('/')[0]
+        port = int(conf['target']['bmp']['port']) if 'bmp' in conf['target'] and 'port' in conf['target']['bmp'] else BMP_PORT
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((address, port))
+        self.sock.listen(1)
+
+        t = Thread(target=self.listen)
+        t.daemon = True
+        t.start()
+
+    def listen(self):
+        while True:
+            conn, addr = self.sock.accept()
+            self.conn = conn
+            self.established.set()
+            try:
+                with open('{0}/bmp.dump'.format(self.host_dir), 'ab') as dump:
+                    reader = BMPReader()
+                    while True:
+                        data = conn.recv(1 << 16)
+                        if not data:
+                            break
+                        dump.write(data)
+                        for typ, msg in reader.feed(data):
+                            self.handle(typ, msg)
+            except (socket.error, ValueError) as e:
+                print 'BMP collector: session with {0} failed: {1}'.format(addr[0], e)
+            finally:
+                conn.close()
+                self.conn = None
+
+    def replay(self, filename):    # feed captured BMP bytes through the collector
+        reader = BMPReader()
+        with open(filename, 'rb') as f:
+            while True:
+                data = f.read(1 << 16)
+                if not data:
+                    break
+                for typ, msg in reader.feed(data):
+                    self.handle(typ, msg)
+
+    def handle(self, typ, msg):
+        if typ not in (ROUTE_MONITORING, PEER_UP, PEER_DOWN):
+            return
+        peer = decode_peer_header(msg, COMMON_HEADER_LEN)
+        key = (peer['address'], peer['post-policy'])
+        if typ == ROUTE_MONITORING:
+            offset = COMMON_HEADER_LEN + PEER_HEADER_LEN
+            length, bgp_type = struct.unpack_from('!HB', msg, offset + 16)
+            if bgp_type != UPDATE:
+                return
+            withdrawn, attrs, nlri = decode_update(msg[offset + HEADER_LEN:offset + length])
+            rib = self.neighbors.setdefault(key, set())
+            self.updates += 1
+            for p in withdrawn:
+                rib.discard(p)
+            self.withdrawn += len(withdrawn)
+            rib.update(nlri)
+            self.received += len(nlri)
+            if self.arrivals is not None:
+                ts = peer['timestamp'] if peer['timestamp'] else time.time()
+                for p in nlri:
+                    if p not in self.arrivals:
+                        self.arrivals[p] = ts
+        elif typ == PEER_UP:
+            self.up.add(peer['address'])
+            self.neighbors.setdefault(key, set())
+        elif typ == PEER_DOWN:  # the adj-rib-in of a neighbor is gone with its session
+            self.up.discard(peer['address'])
+            for k in [k for k in self.neighbors if k[0] == peer['address']]:
+                self.neighbors[k] = set()
+
+    def reset(self, conf):  # drops the session and all counters, e.g. when the target is replaced between the points of a sweep
+        self.config = conf
+        self.established.clear()
+        conn = self.conn
+        if conn:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self.neighbors = {}
+        self.up = set()
+        self.received = 0
+        self.withdrawn = 0
+        self.updates = 0
+        self.arrivals = {} if 'latency' in conf['monitor'] and conf['monitor']['latency'] else None
+
+    def wait_established(self, neighbor=None):
+        self.established.wait()
+
+    def sample(self):
+        neighbors = dict(('{0}{1}'.format(k[0], ' (post-policy)' if k[1] else ''), len(v)) for k, v in self.neighbors.items())
+        return {'who': self.name, 'state': {
+            'session-state': 'established' if self.established.is_set() else 'idle',
+            'adj-table': {'accepted': sum(neighbors.values()), 'received': self.received, 'withdrawn': self.withdrawn},
+            'updates': self.updates,
+            'neighbors-up': len(self.up),
+            'neighbors': neighbors,
+        }}
+
+    def stats(self, queue, stop=None):
+        stop = stop if stop else Event()
+
+        def stats():
+            cps = list(self.config['monitor']['check-points']) if 'check-points' in self.config['monitor'] else []  # consumed, conf is reused by every trial
+            interval = self.config['monitor']['measurement-interval'] if 'measurement-interval' in self.config['monitor'] else 1
+            while not stop.is_set():
+                info = self.sample()
+                accepted = info['state']['adj-table']['accepted']
+                if len(cps) > 0 and int(cps[0]) == accepted:
+                    cps.pop(0)
+                    info['checked'] = True
+                else:
+                    info['checked'] = False
+                queue.put(info)
+                time.sleep(interval)
+
+        t = Thread(target=stats)
+        t.daemon = True
+        t.start()
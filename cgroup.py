@@ -0,0 +1,160 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Resource sampler reading the cgroup files of a container directly.
+#
+# Supports cgroup v1 (cpuacct.usage, cpuacct.stat, memory.usage_in_bytes,
+# memory.stat) and the unified hierarchy v2 (cpu.stat, memory.current,
+# memory.stat). The cgroup of the container is looked up once from
+# /proc/<pid>/cgroup and the files are kept open, every sample is just a
+# seek and read of a few small files. root and proc can point to a fake tree.
+#
+# The memory usage includes the page cache, memory.stat breaks it down
+# (memory_breakdown()): anon (heap, stacks, anonymous mappings: what the
+# processes allocate), file (page cache, including files the container only
+# read or wrote), rss (anon and mapped files, as resident in the processes),
+# kernel (slab, kernel stacks, page tables, socket buffers) and the peak
+# usage recorded by the kernel (memory.peak, memory.max_usage_in_bytes) or,
+# without it, the maximum of the samples.
+
+import os
+from clock import monotonic
+
+USER_HZ = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+class CgroupError(Exception):
+    pass
+
+
+def read_fd(fd, size=4096):    # cgroup files are regenerated on every read from offset 0
+    os.lseek(fd, 0, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def parse_keyed(data):    # "key value" lines as in cpu.stat, cpuacct.stat and memory.stat
+    values = {}
+    for line in data.splitlines():
+        kv = line.split()
+        if len(kv) == 2:
+            values[kv[0]] = int(kv[1])
+    return values
+
+
+# rss, anon, file and kernel memory (bytes) from the values of memory.stat of cgroup v1 or v2 (also found in
+# the memory_stats of docker stats), kmem: kernel memory usage of v1 (memory.kmem.usage_in_bytes) if known
+def memory_breakdown(stat, kmem=None):
+    if 'anon' in stat:      # v2
+        kernel = stat['kernel'] if 'kernel' in stat else sum(stat[k] for k in [
+            'kernel_stack', 'pagetables', 'sec_pagetables', 'percpu', 'sock', 'vmalloc'] if k in stat) + (
+            stat['slab'] if 'slab' in stat else stat.get('slab_reclaimable', 0) + stat.get('slab_unreclaimable', 0))
+        return {'anon': stat['anon'], 'file': stat.get('file', 0), 'rss': stat['anon'] + stat.get('file_mapped', 0),
+                'kernel': kernel}
+    # v1, hierarchical totals include child cgroups
+    v = lambda key: stat['total_' + key] if 'total_' + key in stat else stat.get(key, 0)
+    return {'anon': v('rss'), 'file': v('cache'), 'rss': v('rss') + v('mapped_file'), 'kernel': kmem if kmem else 0}
+
+
+class CgroupSampler(object):
+    def __init__(self, pid, root='/sys/fs/cgroup', proc='/proc'):
+        self.pid = pid
+        self.root = root
+        self.fds = {}
+        self.peak = 0       # maximum memory usage of the samples, if the kernel does not record it
+        controllers = {}    # controller -> path of the cgroup of pid
+        try:
+            with open('{0}/{1}/cgroup'.format(proc, pid)) as f:
+                for line in f:
+                    hid, names, path = line.strip().split(':', 2)
+                    for name in (names.split(',') if names else ['']):
+                        controllers[name] = path
+        except IOError as e:
+            raise CgroupError('cannot read cgroup of pid {0}: {1}'.format(pid, e))
+
+        self.version = 2 if os.path.exists('{0}/cgroup.controllers'.format(root)) else 1
+        if self.version == 2:
+            if '' not in controllers:
+                raise CgroupError('pid {0} is not in the unified hierarchy'.format(pid))
+            d = root + controllers['']
+            self.procs = '{0}/cgroup.procs'.format(d)
+            self.open('cpu.stat', d)
+            self.open('memory.current', d)
+            self.open('memory.stat', d)
+            self.open('memory.peak', d, optional=True)     # since linux 5.19
+        else:
+            if 'cpuacct' not in controllers or 'memory' not in controllers:
+                raise CgroupError('no cpuacct or memory cgroup for pid {0}'.format(pid))
+            cpuacct = self.mountpoint(['cpuacct', 'cpu,cpuacct', 'cpuacct,cpu']) + controllers['cpuacct']
+            memory = self.mountpoint(['memory']) + controllers['memory']
+            self.procs = '{0}/cgroup.procs'.format(cpuacct)
+            self.open('cpuacct.usage', cpuacct)
+            self.open('cpuacct.stat', cpuacct)
+            self.open('memory.usage_in_bytes', memory)
+            self.open('memory.stat', memory)
+            self.open('memory.max_usage_in_bytes', memory, optional=True)
+            self.open('memory.kmem.usage_in_bytes', memory, optional=True)
+
+    def mountpoint(self, names):
+        for name in names:
+            if os.path.isdir('{0}/{1}'.format(self.root, name)):
+                return '{0}/{1}'.format(self.root, name)
+        raise CgroupError('none of the cgroup hierarchies {0} is mounted at {1}'.format(names, self.root))
+
+    def open(self, name, directory, optional=False):
+        try:
+            self.fds[name] = os.open('{0}/{1}'.format(directory, name), os.O_RDONLY)
+        except OSError as e:
+            if optional:
+                return
+            raise CgroupError('cannot open {0}/{1}: {2}'.format(directory, name, e))
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+    def read(self, name):
+        return read_fd(self.fds[name])
+
+    def pids(self):     # processes in the cgroup, e.g. to sample their threads
+        with open(self.procs) as f:
+            return [int(line) for line in f if line.strip()]
+
+    # returns monotonic timestamp (s), cpu time total/user/system (ns), memory usage (bytes) and
+    # its breakdown 'memory': rss, anon, file, kernel and peak (bytes)
+    def sample(self):
+        t = monotonic()
+        if self.version == 2:
+            cpu = parse_keyed(self.read('cpu.stat'))
+            s = {'time': t, 'cpu': cpu['usage_usec'] * 1000, 'user': cpu['user_usec'] * 1000,
+                 'system': cpu['system_usec'] * 1000, 'mem': int(self.read('memory.current'))}
+        else:
+            cpu = parse_keyed(self.read('cpuacct.stat'))
+            s = {'time': t, 'cpu': int(self.read('cpuacct.usage')), 'user': cpu['user'] * 1000000000 / USER_HZ,
+                 'system': cpu['system'] * 1000000000 / USER_HZ, 'mem': int(self.read('memory.usage_in_bytes'))}
+        kmem = int(self.read('memory.kmem.usage_in_bytes')) if 'memory.kmem.usage_in_bytes' in self.fds else None
+        s['memory'] = memory_breakdown(parse_keyed(read_fd(self.fds['memory.stat'], 65536)), kmem)
+        self.peak = max(self.peak, s['mem'])
+        peak = 'memory.peak' if 'memory.peak' in self.fds else 'memory.max_usage_in_bytes'
+        s['memory']['peak'] = max(self.peak, int(self.read(peak))) if peak in self.fds else self.peak
+        return s
+
+    # cpu usage between two samples in percent of one cpu
+    @staticmethod
+    def delta(prev, cur):
+        dt = cur['time'] - prev['time']
+        if dt <= 0:
+            return {'cpu': 0.0, 'user': 0.0, 'system': 0.0}
+        return dict((k, (cur[k] - prev[k]) / (dt * 1e9) * 100.0) for k in ['cpu', 'user', 'system'])
@@ -0,0 +1,80 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Monotonic clock for python 2 (time.monotonic() only exists in python 3).
+# monotonic() returns seconds as float from CLOCK_MONOTONIC, which is not
+# affected by changes of the wall clock and is shared by all containers.
+# TimerQueue runs functions at deadlines on this clock.
+
+import os
+import time
+import heapq
+import ctypes
+import ctypes.util
+from itertools import count
+from threading import Lock
+
+CLOCK_MONOTONIC = 1
+
+
+class timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+try:
+    _clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True).clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+except (OSError, AttributeError):
+    _clock_gettime = None
+
+
+def monotonic():
+    if _clock_gettime is None:  # no clock_gettime() available, fall back to the wall clock
+        return time.time()
+    t = timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return t.tv_sec + t.tv_nsec * 1e-9
+
+
+class TimerQueue(object):
+    def __init__(self):
+        self.heap = []      # (deadline, sequence number, function), the sequence number keeps the order of equal deadlines
+        self.seq = count()
+        self.lock = Lock()
+
+    def add(self, delay, func):     # runs func delay seconds from now, returns the deadline
+        deadline = monotonic() + delay
+        with self.lock:
+            heapq.heappush(self.heap, (deadline, next(self.seq), func))
+        return deadline
+
+    def clear(self):
+        with self.lock:
+            self.heap = []
+
+    # runs the functions that are due in the calling thread until the Event until is set
+    def run(self, until):
+        while not until.is_set():
+            due = []
+            with self.lock:
+                now = monotonic()
+                while self.heap and self.heap[0][0] <= now:
+                    due.append(heapq.heappop(self.heap)[2])
+                deadline = self.heap[0][0] if self.heap else None
+            for func in due:
+                func()
+            if not due:
+                until.wait(max(0, deadline - monotonic()) if deadline is not None else None)
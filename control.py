@@ -0,0 +1,59 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Control channel of a running tester: a FIFO in its directory that takes ExaBGP API text
+# commands, e.g. "neighbor 10.10.0.1 local-ip 10.10.0.3 withdraw route 100.0.0.0/24".
+# ExaBGP reads it with an API process, the native speaker polls it. Every tester keeps
+# the channels of its running daemons in controls as (FIFO, target address, peers).
+
+import os
+import fcntl
+
+
+def make_control(host_dir, name):
+    filename = '{0}/{1}.control'.format(host_dir, name)
+    if not os.path.exists(filename):
+        os.mkfifo(filename)
+        os.chmod(filename, 0666)
+    return filename
+
+
+def control_channels(testers):
+    return [c for t in testers for c in (t.controls if hasattr(t, 'controls') else [])]
+
+
+def route_command(neighbor, peer, path, withdraw=False):
+    local_address = peer['local-address'].split('/')[0]
+    if withdraw:
+        return 'neighbor {0} local-ip {1} withdraw route {2}'.format(neighbor, local_address, path)
+    return 'neighbor {0} local-ip {1} announce route {2} next-hop {1}'.format(neighbor, local_address, path)
+
+
+def teardown_command(neighbor, peer, subcode=2):   # closes the session with a Cease NOTIFICATION, the tester connects again
+    return 'neighbor {0} local-ip {1} teardown {2}'.format(neighbor, peer['local-address'].split('/')[0], subcode)
+
+
+class ControlChannel(object):
+    def __init__(self, filename):
+        fd = os.open(filename, os.O_WRONLY | os.O_NONBLOCK)   # fails with ENXIO unless the tester reads the FIFO
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+        self.f = os.fdopen(fd, 'w')
+
+    def send(self, commands):   # blocks while the tester is behind
+        self.f.write(''.join(c + '\n' for c in commands))
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
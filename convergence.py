@@ -0,0 +1,113 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Steady state detection on the samples of a benchmark in constant time per sample.
+#
+# Over a sliding window of the last `window` samples running sums are kept, so
+# the least squares slope of the route count and the variance of the cpu load
+# are updated by adding the new sample and subtracting the one leaving the
+# window. The target is considered converged once the window is full and
+# - the route count does not change by more than `route_tolerance` (fraction of
+#   the routes) over the window, extrapolated from its slope,
+# - the standard deviation of the cpu load in the window is at most `cpu_stdev`
+#   percent and its EWMA is below `cpu_below` (if given),
+# - at least `routes` routes were received (if given).
+# Neither the final number of routes nor a cpu threshold have to be known.
+#
+# The convergence instant is estimated from the last increase of the route
+# count: the routes between the two samples are assumed to arrive at the rate
+# of the preceding interval, so the last one arrived before the later sample.
+
+from collections import deque
+
+
+class SteadyStateDetector(object):
+    def __init__(self, window=5, cpu_below=None, routes=None, route_tolerance=0.001, cpu_stdev=5.0, alpha=0.3):
+        self.window = max(2, int(window))
+        self.cpu_below = cpu_below
+        self.routes = routes
+        self.route_tolerance = route_tolerance
+        self.cpu_stdev = cpu_stdev
+        self.alpha = alpha
+
+        self.samples = deque()  # (t, cpu, routes) of the window
+        self.st = self.sr = self.stt = self.str = 0.0   # sums of t, routes, t^2, t * routes
+        self.sc = self.scc = 0.0                        # sums of cpu, cpu^2
+        self.t0 = None          # times are taken relative to the first sample, keeps the sums small
+        self.ewma = None
+        self.max_routes = 0
+        self.prev = None        # previous sample (t, routes)
+        self.rate = 0.0         # routes per second between the two samples before prev
+        self.instant = None     # estimated time the last route arrived
+        self.converged = None   # instant of convergence once detected
+
+    def _window(self, sample, sign):
+        t, cpu, routes = sample
+        self.st += sign * t
+        self.sr += sign * routes
+        self.stt += sign * t * t
+        self.str += sign * t * routes
+        self.sc += sign * cpu
+        self.scc += sign * cpu * cpu
+
+    def add(self, t, cpu, routes):  # t: elapsed seconds, returns True once steady state is reached
+        if self.t0 is None:
+            self.t0 = t
+        sample = (t - self.t0, float(cpu), float(routes))
+        self.samples.append(sample)
+        self._window(sample, 1)
+        if len(self.samples) > self.window:
+            self._window(self.samples.popleft(), -1)
+
+        self.ewma = cpu if self.ewma is None else self.alpha * cpu + (1 - self.alpha) * self.ewma
+
+        if routes > self.max_routes:
+            if self.prev is not None:
+                pt, pr = self.prev
+                # time the remaining routes took at the rate of the preceding interval, at most the sampling interval
+                self.instant = min(t, pt + (routes - pr) / self.rate) if self.rate > 0 else t
+            else:
+                self.instant = t
+            self.max_routes = routes
+        if self.prev is not None and t > self.prev[0]:
+            self.rate = (routes - self.prev[1]) / float(t - self.prev[0])
+        self.prev = (t, routes)
+
+        if self.converged is None and self.steady():
+            self.converged = self.instant if self.instant is not None else t
+        return self.converged is not None
+
+    def slope(self):    # least squares slope of the route count in the window, routes per second
+        n = len(self.samples)
+        d = n * self.stt - self.st * self.st
+        return (n * self.str - self.st * self.sr) / d if d > 0 else 0.0
+
+    def cpu_deviation(self):  # standard deviation of the cpu load in the window
+        n = len(self.samples)
+        return max(0.0, self.scc / n - (self.sc / n) ** 2) ** 0.5 if n else 0.0
+
+    def steady(self):
+        if len(self.samples) < self.window or self.max_routes == 0:
+            return False
+        if self.routes is not None and self.prev[1] < self.routes:
+            return False
+        span = self.samples[-1][0] - self.samples[0][0]
+        if abs(self.slope()) * span > self.route_tolerance * self.max_routes:
+            return False
+        if self.cpu_deviation() > self.cpu_stdev:
+            return False
+        if self.cpu_below is not None and self.ewma > self.cpu_below:
+            return False
+        return True
@@ -0,0 +1,101 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Core speed sampler for the cpus of a cpuset, replacing a fork of
+# "cpupower monitor -mMperf" per sample.
+#
+# If the msr driver is loaded (modprobe msr) the effective frequency is
+# computed from the APERF/MPERF deltas since the previous sample, exactly
+# like cpupower does, so the value is the average over the whole sampling
+# interval whatever its length: MPERF counts at the base frequency while the
+# core is in C0, APERF at the actual frequency.
+# Otherwise scaling_cur_freq of cpufreq in sysfs is read, which is the
+# frequency of the last cpufreq update (on recent kernels itself an
+# APERF/MPERF average over a few ms).
+# All files are opened once and reread on every sample.
+
+import os
+import struct
+
+MSR_MPERF = 0xE7
+MSR_APERF = 0xE8
+MSR_PLATFORM_INFO = 0xCE    # bits 15:8 maximum non-turbo ratio (Intel), in units of 100 MHz
+
+
+class CPUFreqSampler(object):
+    def __init__(self, cpus, sysfs='/sys/devices/system/cpu', dev='/dev/cpu'):
+        self.cpus = list(cpus)
+        self.sysfs = sysfs
+        self.fds = {}
+        self.prev = {}      # cpu -> (aperf, mperf) of the previous sample
+        self.base = None    # cpu -> base frequency in MHz
+        try:
+            for cpu in self.cpus:
+                self.fds[cpu] = os.open('{0}/{1}/msr'.format(dev, cpu), os.O_RDONLY)
+            self.base = dict((cpu, self.base_freq(cpu)) for cpu in self.cpus)
+            self.prev = dict((cpu, self.counters(cpu)) for cpu in self.cpus)
+            self.mode = 'msr'
+        except (OSError, IOError, ValueError):
+            self.close()
+            self.base = None
+            for cpu in self.cpus:
+                self.fds[cpu] = os.open('{0}/cpu{1}/cpufreq/scaling_cur_freq'.format(sysfs, cpu), os.O_RDONLY)
+            self.mode = 'sysfs'
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+    def read_msr(self, cpu, reg):
+        os.lseek(self.fds[cpu], reg, os.SEEK_SET)
+        data = os.read(self.fds[cpu], 8)
+        if len(data) != 8:
+            raise IOError('short read of msr {0:#x} on cpu {1}'.format(reg, cpu))
+        return struct.unpack('<Q', data)[0]
+
+    def counters(self, cpu):
+        return self.read_msr(cpu, MSR_APERF), self.read_msr(cpu, MSR_MPERF)
+
+    def base_freq(self, cpu):   # MHz
+        try:
+            with open('{0}/cpu{1}/cpufreq/base_frequency'.format(self.sysfs, cpu)) as f:
+                return int(f.read()) / 1000.0
+        except (IOError, ValueError):
+            pass
+        try:
+            ratio = (self.read_msr(cpu, MSR_PLATFORM_INFO) >> 8) & 0xff
+            if ratio:
+                return ratio * 100.0
+        except (OSError, IOError):
+            pass
+        with open('{0}/cpu{1}/cpufreq/cpuinfo_max_freq'.format(self.sysfs, cpu)) as f:
+            return int(f.read()) / 1000.0
+
+    # returns a list of (cpu, MHz) tuples
+    def sample(self):
+        freqs = []
+        for cpu in self.cpus:
+            if self.mode == 'msr':
+                aperf, mperf = self.counters(cpu)
+                prev_aperf, prev_mperf = self.prev[cpu]
+                self.prev[cpu] = (aperf, mperf)
+                daperf = (aperf - prev_aperf) % (1 << 64)   # the counters may wrap
+                dmperf = (mperf - prev_mperf) % (1 << 64)
+                freqs.append((cpu, int(round(self.base[cpu] * daperf / dmperf)) if dmperf else 0))
+            else:
+                os.lseek(self.fds[cpu], 0, os.SEEK_SET)
+                freqs.append((cpu, int(os.read(self.fds[cpu], 64)) / 1000))
+        return freqs
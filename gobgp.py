@@ -14,6 +14,7 @@
 # limitations under the License.
 
 from base import *
+from prefixes import match_values
 
 class GoBGP(Container):
     def __init__(self, name, host_dir, guest_dir='/root/config', image='bgperf/gobgp'):
@@ -60,7 +61,7 @@ RUN go install github.com/osrg/gobgp/gobgp
                     if match['type'] == 'prefix':
                         config['defined-sets']['prefix-sets'].append({
                             'prefix-set-name': n,
-                            'prefix-list': [{'ip-prefix': p} for p in match['value']]
+                            'prefix-list': [{'ip-prefix': p} for p in match_values(match)]
                         })
                         conditions['match-prefix-set'] = {'prefix-set': n}
                     elif match['type'] == 'as-path':
@@ -104,6 +105,13 @@ RUN go install github.com/osrg/gobgp/gobgp
             return c
 
         config['neighbors'] = [gen_neighbor_config(n) for n in conf['tester']['peers'].values() + [conf['monitor']]]
+
+        if 'bmp' in conf['target'] and conf['target']['bmp']:    # stream the adj-rib-in of all neighbors to the BMP collector
+            config['bmp-servers'] = [{'config': {
+                'address': conf['target']['bmp']['address'],
+                'port': conf['target']['bmp']['port'] if 'port' in conf['target']['bmp'] else 11019,
+                'route-monitoring-policy': 'pre-policy',
+            }}]
         with open('{0}/{1}'.format(self.host_dir, name), 'w') as f:
             f.write(yaml.dump(config, default_flow_style=False))
         self.config_name = name
@@ -0,0 +1,82 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# HDR style histogram of non-negative integer values (e.g. latencies in microseconds).
+#
+# Values below 2^bits are counted exactly, larger values are counted in
+# log-linear buckets with 2^(bits-1) buckets per power of two, i.e. the
+# relative error of a reported value is below 2^-(bits-1) (< 1.6% for bits=7).
+# Buckets are kept in a dict, so the memory used only depends on the number of
+# distinct buckets, not on the number or the range of the recorded values.
+
+class Histogram(object):
+    def __init__(self, bits=7):
+        self.bits = bits
+        self.half = 1 << (bits - 1)
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def index(self, v):
+        shift = v.bit_length() - self.bits
+        if shift <= 0:
+            return v
+        return shift * self.half + (v >> shift)
+
+    def value(self, idx):   # lowest value counted in bucket idx
+        if idx < 2 * self.half:
+            return idx
+        shift = idx / self.half - 1
+        return (idx - shift * self.half) << shift
+
+    def record(self, v, n=1):
+        v = int(v)
+        idx = self.index(v)
+        self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.count += n
+        self.total += v * n
+        self.min = v if self.min is None else min(self.min, v)
+        self.max = v if self.max is None else max(self.max, v)
+
+    def merge(self, other):
+        for idx, n in other.buckets.iteritems():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, p):    # p in percent
+        if self.count == 0:
+            return None
+        rank = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                return min(self.value(idx), self.max)
+        return self.max
+
+    def mean(self):
+        return float(self.total) / self.count if self.count else None
+
+    def summary(self, percentiles=(50, 90, 99)):
+        s = {'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.mean()}
+        for p in percentiles:
+            s['p{0}'.format(p)] = self.percentile(p)
+        return s
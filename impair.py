@@ -0,0 +1,168 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Link impairment of the benchmark network with netem qdiscs, set up over netlink.
+#
+# An impairment (delay and jitter in ms, loss in percent, rate like '10mbit',
+# limit in packets) is applied to the links of a container (see netsetup.py):
+# to its veth on the host for the traffic towards the container ('in') and to
+# eth1 inside its network namespace for the traffic from it ('out').
+# With addresses (e.g. those of tester peers) only their traffic is impaired:
+# an htb root qdisc gets a class with a netem qdisc per address and u32 filters
+# on the destination ('in') or source ('out') address, other traffic passes
+# unshaped. remove() deletes the root qdiscs again, remove_impairments() does
+# this for every impairment still in place, e.g. when the benchmark ends.
+# Peers that are not local testers (--tester-remote-address) are impaired on
+# the host interface routing to them, only for the traffic towards them.
+
+import socket
+import struct
+from socket import AF_INET
+from threading import Lock
+from pyroute2 import IPRoute
+from pyroute2.protocols import ETH_P_IP
+from nsenter import Namespace
+from netsetup import ipr, ctn_pid
+
+ROOT = 0x10000  # 1:0
+DIRECTIONS = ['in', 'out', 'both']
+
+_active = set()
+_lock = Lock()
+
+
+def netem_parameters(spec):    # tc-netem keyword arguments of pyroute2 from an impairment
+    kwargs = {}
+    if 'delay' in spec and spec['delay']:
+        kwargs['delay'] = int(float(spec['delay']) * 1000)     # microseconds
+    if 'jitter' in spec and spec['jitter']:
+        kwargs['jitter'] = int(float(spec['jitter']) * 1000)
+    if 'loss' in spec and spec['loss']:
+        kwargs['loss'] = float(spec['loss'])
+    if 'rate' in spec and spec['rate']:
+        kwargs['rate'] = spec['rate']
+    if 'limit' in spec and spec['limit']:
+        kwargs['limit'] = int(spec['limit'])
+    return kwargs
+
+
+class Impairment(object):
+    # ctn: name of the container, spec: dict with delay, jitter, loss, rate, limit
+    # direction: 'in', 'out' or 'both', addresses: only impair the traffic of these addresses
+    def __init__(self, ctn, spec, direction='both', addresses=None):
+        if direction not in DIRECTIONS:
+            raise ValueError('unknown direction {0}'.format(direction))
+        self.ctn = ctn
+        self.netem = netem_parameters(spec)
+        self.direction = direction
+        self.addresses = [a.split('/')[0] for a in addresses] if addresses else None
+
+    def links(self):    # (function running f(ip, index) on the link, u32 offset of the address to match)
+        links = []
+        if self.direction in ['in', 'both']:
+            def host(f):
+                ip = ipr()
+                f(ip, ip.link_lookup(ifname=self.ctn)[0])
+            links.append((host, 16))
+        if self.direction in ['out', 'both']:
+            def guest(f):
+                with Namespace(ctn_pid(self.ctn), 'net'):
+                    ip = IPRoute()
+                    try:
+                        f(ip, ip.link_lookup(ifname='eth1')[0])
+                    finally:
+                        ip.close()
+            links.append((guest, 12))
+        return links
+
+    def apply(self):
+        for run, offset in self.links():
+            run(lambda ip, index: self.setup(ip, index, offset))
+        with _lock:
+            _active.add(self)
+
+    def setup(self, ip, index, offset):
+        if self.addresses is None:
+            ip.tc('replace', 'netem', index, ROOT, **self.netem)
+            return
+        ip.tc('replace', 'htb', index, ROOT, default=0)    # unclassified traffic is not shaped
+        for i, address in enumerate(self.addresses):
+            cls = ROOT + i + 1
+            ip.tc('add-class', 'htb', index, cls, parent=ROOT, rate='10gbit')
+            ip.tc('add', 'netem', index, (i + 2) << 16, parent=cls, **self.netem)
+            key = '0x{0:08x}/0xffffffff+{1}'.format(struct.unpack('!I', socket.inet_aton(address))[0], offset)
+            ip.tc('add-filter', 'u32', index, parent=ROOT, prio=10, protocol=ETH_P_IP, target=cls, keys=[key])
+
+    def remove(self):   # the container may be gone already
+        for run, offset in self.links():
+            try:
+                run(lambda ip, index: ip.tc('del', 'htb' if self.addresses is not None else 'netem', index, ROOT))
+            except Exception as e:
+                print 'cannot remove impairment of {0}: {1}'.format(self.ctn, e)
+        with _lock:
+            _active.discard(self)
+
+    def __str__(self):
+        return '{0} ({1}{2}): {3}'.format(self.ctn, self.direction, ', ' + ', '.join(self.addresses) if self.addresses else '',
+                                          ', '.join('{0} {1}'.format(k, v) for k, v in sorted(self.netem.items())))
+
+
+# impairments of the tester peers given by router-id or address, one per tester container
+def peer_impairments(testers, peers, spec, direction='both'):
+    impairments = []
+    for t in testers:
+        addresses = [p['local-address'] for filename, neighbor, group in t.controls for p in group
+                     if p['router-id'] in peers or p['local-address'].split('/')[0] in peers]
+        if addresses:
+            impairments.append(Impairment(t.name, spec, direction, addresses))
+    return impairments
+
+
+# impairments of the traffic towards remote peers (addresses), on the host interfaces routing to them
+def remote_impairments(peers, spec):
+    links = {}  # interface -> addresses
+    for peer in peers:
+        address = peer.split('/')[0]
+        try:
+            socket.inet_aton(address)
+        except socket.error:
+            raise ValueError('peer {0} is neither a local tester nor an address'.format(peer))
+        routes = ipr().get_routes(dst=address, family=AF_INET)
+        if not routes:
+            raise ValueError('no route to peer {0}'.format(peer))
+        ifname = ipr().get_links(routes[0].get_attr('RTA_OIF'))[0].get_attr('IFLA_IFNAME')
+        links.setdefault(ifname, []).append(address)
+    return [Impairment(link, spec, 'in', addresses) for link, addresses in sorted(links.items())]
+
+
+# impairments of the peers given by router-id or address: of the local testers on their links,
+# of remote peers on the host (see remote_impairments())
+def tester_impairments(testers, peers, spec, direction='both'):
+    local = set()
+    for t in testers:
+        for filename, neighbor, group in t.controls:
+            local.update(p['router-id'] for p in group)
+            local.update(p['local-address'].split('/')[0] for p in group)
+    remote = [p for p in peers if p.split('/')[0] not in local]
+    if remote and direction == 'out':
+        raise ValueError('only the traffic towards remote peers {0} can be impaired'.format(', '.join(remote)))
+    return peer_impairments(testers, peers, spec, direction) + (remote_impairments(remote, spec) if remote else [])
+
+
+def remove_impairments():
+    with _lock:
+        active = list(_active)
+    for impairment in active:
+        impairment.remove()
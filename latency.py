@@ -0,0 +1,109 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# End-to-end propagation latency per prefix: the time between the native
+# tester sending a route (speaker send timestamps) and the native monitor
+# receiving it from the target (first arrival timestamps).
+# Latencies are recorded in microseconds in histograms for all prefixes, per
+# tester peer and per phase, where the phase is the action of the sequencer
+# that was running when the route was sent ('initial' before the first action).
+
+import json
+from bisect import bisect_right
+from histogram import Histogram
+from prefixes import peer_prefixes
+
+
+class LatencyTracker(object):
+    def __init__(self, phases):
+        self.phase_starts = [p[0] for p in phases]  # phases: sorted list of (start timestamp, name)
+        self.phase_names = [p[1] for p in phases]
+        self.all = Histogram()
+        self.peers = {}
+        self.phases = {}
+        self.missing = 0    # prefixes that were never sent or never received
+
+    def phase(self, ts):
+        i = bisect_right(self.phase_starts, ts) - 1
+        return self.phase_names[i] if i >= 0 else self.phase_names[0]
+
+    def record(self, peer, sent, received):
+        latency = max(0, int((received - sent) * 1000000))
+        self.all.record(latency)
+        if peer not in self.peers:
+            self.peers[peer] = Histogram()
+        self.peers[peer].record(latency)
+        phase = self.phase(sent)
+        if phase not in self.phases:
+            self.phases[phase] = Histogram()
+        self.phases[phase].record(latency)
+
+    def summary(self):
+        return {
+            'unit': 'us',
+            'missing': self.missing,
+            'all': self.all.summary(),
+            'peers': dict((k, v.summary()) for k, v in self.peers.iteritems()),
+            'phases': dict((k, v.summary()) for k, v in self.phases.iteritems()),
+        }
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
+
+    def report(self):
+        def ms(v):
+            return '{0:.3f}'.format(v / 1000.0) if v is not None else '-'
+
+        print 'propagation latency [ms]  {0:>10} {1:>10} {2:>10} {3:>10} {4:>10}'.format('count', 'p50', 'p90', 'p99', 'max')
+        rows = [('all', self.all)] + sorted(('phase ' + k, v) for k, v in self.phases.iteritems())
+        for name, h in rows:
+            s = h.summary()
+            print '{0:<25} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10}'.format(name, s['count'], ms(s['p50']), ms(s['p90']), ms(s['p99']), ms(s['max']))
+        if self.missing:
+            print '{0} prefixes were not sent or not received'.format(self.missing)
+
+
+# Joins the send timestamps of the native testers with the arrival timestamps
+# of the native monitor. Only the first announcement of every prefix is
+# taken into account, resends after a session reset are ignored.
+def collect_latencies(testers, arrivals, phases):
+    tracker = LatencyTracker(phases)
+    for t in testers:
+        if not hasattr(t, 'sent'):  # only the native tester reports send timestamps
+            continue
+        sent = {}   # router-id -> [(end offset, timestamp)] with increasing offsets
+        for router_id, offset, ts in t.sent():
+            records = sent.setdefault(router_id, [])
+            if not records or offset > records[-1][0]:
+                records.append((offset, ts))
+        for p in t.peers:
+            records = sent.get(p['router-id'], [])
+            prefixes = peer_prefixes(p)
+            r = 0
+            k = 0
+            for end, count in t.index(p):
+                while r < len(records) and records[r][0] < end:
+                    r += 1
+                ts = records[r][1] if r < len(records) else None
+                while k < count:
+                    prefix = next(prefixes)
+                    k += 1
+                    received = arrivals.get(prefix)
+                    if ts is None or received is None:
+                        tracker.missing += 1
+                    else:
+                        tracker.record(p['router-id'], ts, received)
+    return tracker
@@ -0,0 +1,124 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Columnar recorder for the samples of a benchmark.
+#
+# Every column is a typed array (see the typecodes of the array module).
+# Rows are appended to the arrays and spilled as one chunk to a binary file
+# once spill_rows rows are buffered or spill_interval seconds have passed,
+# so memory use stays flat however long the benchmark runs.
+#
+# File layout: magic, version, length of a JSON header describing the
+# columns and byte order, the header, then chunks consisting of the number of
+# rows followed by the raw array of every column.
+
+import sys
+import json
+import time
+import struct
+from array import array
+
+MAGIC = 'BGPM'
+VERSION = 1
+
+
+class MetricsRecorder(object):
+    def __init__(self, filename, columns, spill_rows=4096, spill_interval=10):
+        self.filename = filename
+        self.columns = columns  # list of (name, typecode)
+        self.names = [name for name, typecode in columns]
+        self.spill_rows = spill_rows
+        self.spill_interval = spill_interval
+        self.buffers = [array(typecode) for name, typecode in columns]
+        self.rows = 0
+        self.last_spill = time.time()
+        self.f = open(filename, 'wb')
+        header = json.dumps({'columns': columns, 'byteorder': sys.byteorder})
+        self.f.write(struct.pack('!4sBI', MAGIC, VERSION, len(header)))
+        self.f.write(header)
+
+    def record(self, values):  # values: dict column name -> value, missing columns are recorded as 0
+        for name, buf in zip(self.names, self.buffers):
+            buf.append(values[name] if name in values else 0)
+        self.rows += 1
+        if self.rows >= self.spill_rows or time.time() - self.last_spill >= self.spill_interval:
+            self.spill()
+
+    def spill(self):
+        if self.rows > 0:
+            self.f.write(struct.pack('!I', self.rows))
+            for buf in self.buffers:
+                buf.tofile(self.f)
+                del buf[:]
+            self.rows = 0
+        self.f.flush()
+        self.last_spill = time.time()
+
+    def close(self):
+        if not self.f.closed:
+            self.spill()
+            self.f.close()
+
+
+def read_header(f):
+    magic, version, length = struct.unpack('!4sBI', f.read(struct.calcsize('!4sBI')))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{0} is not a bgperf metrics file'.format(f.name))
+    header = json.loads(f.read(length))
+    return [(str(name), str(typecode)) for name, typecode in header['columns']], header['byteorder']
+
+
+def read_chunks(filename):  # yields one dict column name -> array per spilled chunk
+    with open(filename, 'rb') as f:
+        columns, byteorder = read_header(f)
+        while True:
+            data = f.read(4)
+            if len(data) < 4:   # end of file or chunk of an interrupted spill
+                return
+            rows, = struct.unpack('!I', data)
+            chunk = {}
+            for name, typecode in columns:
+                a = array(typecode)
+                try:
+                    a.fromfile(f, rows)
+                except EOFError:
+                    return
+                if byteorder != sys.byteorder:
+                    a.byteswap()
+                chunk[name] = a
+            yield chunk
+
+
+def read_metrics(filename):    # the complete columns of a metrics file, only for analysis of finished runs
+    with open(filename, 'rb') as f:
+        columns, byteorder = read_header(f)
+    metrics = dict((name, array(typecode)) for name, typecode in columns)
+    for chunk in read_chunks(filename):
+        for name in chunk:
+            metrics[name].extend(chunk[name])
+    return metrics
+
+
+def export_csv(filename, csvfile, names=None, formats={}):
+    # names: columns to export (default all), formats: column name -> function formatting a value
+    with open(filename, 'rb') as f:
+        columns, byteorder = read_header(f)
+    names = names or [name for name, typecode in columns]
+    with open(csvfile, 'w') as out:
+        out.write(', '.join(names) + '\n')
+        for chunk in read_chunks(filename):
+            for row in zip(*[chunk[name] for name in names]):
+                out.write(', '.join(formats[name](v) if name in formats else '{0}'.format(v) for name, v in zip(names, row)))
+                out.write('\n')
@@ -18,7 +18,7 @@ import os
 from  settings import dckr
 import yaml
 import json
-from threading import Thread
+from threading import Thread, Event
 import time
 
 class Monitor(GoBGP):
@@ -66,11 +66,18 @@ gobgpd -t yaml -f {1}/{2} -l {3} > {1}/gobgpd.log 2>&1
                 return
             time.sleep(1)
 
-    def stats(self, queue):
+    # drops the session to the target, e.g. when the target is replaced between the points of a sweep
+    def reset(self, conf):
+        self.config = conf
+        self.local('gobgp neighbor {0} reset'.format(conf['target']['local-address'].split('/')[0]))
+
+    def stats(self, queue, stop=None):
+        stop = stop if stop else Event()
+
         def stats():
-            cps = self.config['monitor']['check-points'] if 'check-points' in self.config['monitor'] else []
+            cps = list(self.config['monitor']['check-points']) if 'check-points' in self.config['monitor'] else []  # consumed, conf is reused by every trial
             interval = self.config['monitor']['measurement-interval'] if 'measurement-interval' in self.config['monitor'] else 1
-            while True:
+            while not stop.is_set():
                 info = json.loads(self.local('gobgp neighbor -j'))[0]
                 info['who'] = self.name
                 state = info['state']
@@ -0,0 +1,164 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import socket
+from threading import Thread, Event
+from bgp import *
+
+
+# Monitor implementation running inside bgperf itself. Instead of polling a
+# monitor container with docker exec, it adds the monitor address to the
+# benchmark bridge, waits for the target to connect and decodes the UPDATE
+# stream as it arrives, keeping running counters of the received and
+# withdrawn prefixes. Samples can be taken at any interval.
+# The queue entries have the same layout as the ones of Monitor (GoBGP).
+class NativeMonitor(object):
+    def __init__(self, name, host_dir):
+        self.name = name
+        self.host_dir = host_dir
+        if not os.path.exists(host_dir):
+            os.makedirs(host_dir)
+        self.config = None
+        self.established = Event()
+        self.sock = None
+        self.conn = None        # current session with the target
+        self.rib = set()        # prefixes currently in the adj-rib-in of the session with the target
+        self.received = 0       # number of announced prefixes (including implicit replacements)
+        self.withdrawn = 0      # number of withdrawn prefixes
+        self.updates = 0        # number of UPDATE messages
+        self.arrivals = None    # prefix -> time of first arrival, only kept if latencies are measured
+
+    def run(self, conf, brname=''):
+        self.config = conf
+        if 'latency' in conf['monitor'] and conf['monitor']['latency']:
+            self.arrivals = {}
+        if brname != '':
+            from netsetup import add_br_addr   # needs docker, not imported with the module
+            add_br_addr(brname, conf['monitor']['local-address'])
+        address = conf['monitor']['local-address'].split('/')[0]
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((address, 179))
+        self.sock.listen(1)
+
+        t = Thread(target=self.listen)
+        t.daemon = True
+        t.start()
+
+    def listen(self):   # passive side: wait for the target to connect, one session at a time
+        target = self.config['target']['local-address'].split('/')[0]
+        while True:
+            conn, addr = self.sock.accept()
+            if addr[0] != target:
+                conn.close()
+                continue
+            self.conn = conn
+            try:
+                self.session(conn)
+            except (socket.error, ValueError) as e:
+                print 'native monitor: session with {0} failed: {1}'.format(target, e)
+            finally:
+                conn.close()
+                self.conn = None
+                self.established.clear()
+                self.rib = set()    # the adj-rib-in is gone with the session
+
+    def session(self, conn):
+        hold_time = 90
+        conn.sendall(encode_open(int(self.config['monitor']['as']), self.config['monitor']['router-id'], hold_time))
+        reader = MessageReader()
+        next_keepalive = 0
+        conn.settimeout(1)
+        while True:
+            now = time.time()
+            if self.established.is_set() and hold_time and now >= next_keepalive:
+                conn.sendall(encode_keepalive())
+                next_keepalive = now + hold_time / 3.0
+            try:
+                data = conn.recv(1 << 16)
+            except socket.timeout:
+                continue
+            if not data:
+                return
+            for typ, body in reader.feed(data):
+                if typ == UPDATE:
+                    self.update(body)
+                elif typ == OPEN:
+                    peer_hold_time = decode_open(body)['hold-time']
+                    hold_time = min(hold_time, peer_hold_time)
+                    conn.sendall(encode_keepalive())
+                elif typ == KEEPALIVE and not self.established.is_set():
+                    self.established.set()
+                elif typ == NOTIFICATION:
+                    return
+
+    def update(self, body):
+        withdrawn, attrs, nlri = decode_update(body)
+        self.updates += 1
+        for p in withdrawn:
+            self.rib.discard(p)
+        self.withdrawn += len(withdrawn)
+        self.rib.update(nlri)
+        self.received += len(nlri)
+        if self.arrivals is not None:
+            now = time.time()
+            for p in nlri:
+                if p not in self.arrivals:
+                    self.arrivals[p] = now
+
+    def reset(self, conf):  # drops the session and all counters, e.g. when the target is replaced between the points of a sweep
+        self.config = conf
+        conn = self.conn
+        if conn:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self.rib = set()
+        self.received = 0
+        self.withdrawn = 0
+        self.updates = 0
+        self.arrivals = {} if 'latency' in conf['monitor'] and conf['monitor']['latency'] else None
+
+    def wait_established(self, neighbor=None):
+        self.established.wait()
+
+    def stats(self, queue, stop=None):
+        stop = stop if stop else Event()
+
+        def stats():
+            cps = list(self.config['monitor']['check-points']) if 'check-points' in self.config['monitor'] else []  # consumed, conf is reused by every trial
+            interval = self.config['monitor']['measurement-interval'] if 'measurement-interval' in self.config['monitor'] else 1
+            while not stop.is_set():
+                accepted = len(self.rib)
+                info = {'who': self.name, 'state': {
+                    'session-state': 'established' if self.established.is_set() else 'idle',
+                    'adj-table': {'accepted': accepted, 'received': self.received, 'withdrawn': self.withdrawn},
+                    'updates': self.updates,
+                }}
+                if len(cps) > 0 and int(cps[0]) == accepted:
+                    cps.pop(0)
+                    info['checked'] = True
+                else:
+                    info['checked'] = False
+                queue.put(info)
+                time.sleep(interval)
+
+        t = Thread(target=stats)
+        t.daemon = True
+        t.start()
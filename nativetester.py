@@ -0,0 +1,157 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from exabgp import ExaBGP
+from tester import BootProgress, shard_peers, shard_cpus
+from control import make_control
+from prefixes import peer_prefixes
+from bgp import encode_attributes, pack_updates
+from updatecache import UpdateCache, cache_key
+import os
+import json
+import shutil
+from array import array
+from settings import dckr
+
+
+# Tester implementation based on the native BGP speaker (speaker.py).
+# The UPDATE messages of every peer are encoded here once and written to
+# <router-id>.bin, the speaker inside the container only sends these buffers.
+# The streams are kept in an UpdateCache, a restart (bench --repeat) with an
+# unchanged tester section reuses them without encoding anything.
+# The bgperf/exabgp image is reused because it already provides python.
+class NativeTester(ExaBGP):
+    def __init__(self, name, host_dir):
+        super(NativeTester, self).__init__(name, host_dir)
+        self.cache = None
+        self.peers = []
+        self.logs = []  # speaker logs, holding the send timestamps
+        self.controls = []  # control channels of the speakers, see tester.py
+
+    # yields (router-id, end offset, timestamp) for every chunk of UPDATEs the speakers have sent
+    def sent(self):
+        for log in self.logs:
+            if not os.path.exists(log):
+                continue
+            with open(log) as f:
+                for line in f:
+                    if line.startswith('sent '):
+                        _, router_id, offset, ts = line.split()
+                        yield router_id, int(offset), float(ts)
+
+    def index(self, peer):  # list of (end offset, prefixes sent so far) for every message of a peer
+        index = array('I')
+        filename = self.cache.path('{0}.bin.idx'.format(peer['router-id']))
+        with open(filename, 'rb') as f:
+            index.fromfile(f, os.path.getsize(filename) / index.itemsize)
+        return zip(index[0::2], index[1::2])
+
+    # writes the UPDATE stream of a peer to filename and an index to filename.idx
+    # holding the end offset and the number of prefixes sent so far for every message
+    def write_updates(self, peer, filename):
+        local_address = peer['local-address'].split('/')[0]
+        attrs = encode_attributes(int(peer['as']), local_address)
+        index = array('I')
+        offset = 0
+        prefixes = 0
+        with open(filename, 'wb') as f:
+            for msg, n in pack_updates(peer_prefixes(peer), attrs):
+                f.write(msg)
+                offset += len(msg)
+                prefixes += n
+                index.extend((offset, prefixes))
+        with open(filename + '.idx', 'wb') as f:
+            index.tofile(f)
+
+    def write_config(self, conf, peers, cache, name='speaker.json', control=None):
+        config = []
+        for p in peers:
+            config.append({
+                'router-id': p['router-id'],
+                'as': p['as'],
+                'local-address': p['local-address'].split('/')[0],
+                'neighbor': conf['target']['local-address'].split('/')[0],
+                'updates': cache.guest_path(self.guest_dir, '{0}.bin'.format(p['router-id'])),
+            })
+        with open('{0}/{1}'.format(self.host_dir, name), 'w') as f:
+            json.dump({'peers': config, 'control': control}, f)
+        # the speaker runs inside the container, ship it together with its config
+        for module in ['bgp.py', 'speaker.py']:
+            shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), module), self.host_dir)
+
+    def run(self, conf, brname='', cpus='', peers=None, processes=0, progress=None):
+        super(NativeTester, self).run(brname, cpus=cpus)
+        self.start(conf, cpus, peers, processes, progress)
+
+    # encodes the UPDATE streams of peers unless they are cached, can run before the container exists
+    def prepare(self, conf, peers=None, processes=0):
+        peers = conf['tester']['peers'].values() if peers is None else peers
+        key = cache_key(conf, peers)
+        if self.cache and self.cache.key == key and self.cache.complete():
+            return self.cache
+        cache = UpdateCache(self.host_dir, key)
+        self.cache = cache
+        if cache.complete():
+            print 'reusing cached tester UPDATE streams ({0})'.format(cache.key)
+        else:
+            print 'encoding tester routes..'
+            cache.prepare()
+            for p in peers:
+                self.write_updates(p, cache.path('{0}.bin'.format(p['router-id'])))
+            cache.commit()
+        return cache
+
+    # (re-)starts the speakers in the running container
+    # peers: the peers of this tester, all peers of the scenario by default
+    # processes: number of speaker processes sharing the peers, 0 runs a single one
+    def start(self, conf, cpus='', peers=None, processes=0, progress=None):
+        peers = conf['tester']['peers'].values() if peers is None else peers
+        progress = progress if progress else BootProgress([self.name])
+
+        cache = self.prepare(conf, peers)
+        self.peers = peers
+
+        startup = ['''#!/bin/bash
+ulimit -n 65536
+pkill -f speaker.py
+ip -force -batch {0}/addresses.batch
+cd {0}'''.format(self.guest_dir)]
+        groups = zip(shard_peers(peers, processes), shard_cpus(cpus, processes)) if processes > 0 else [(peers, '')]
+        self.logs = []
+        self.controls = []
+        for i, (group, c) in enumerate(groups):
+            name = 'speaker-{0}'.format(i) if processes > 0 else 'speaker'
+            self.controls.append((make_control(self.host_dir, name), conf['target']['local-address'].split('/')[0], group))
+            self.write_config(conf, group, cache, '{0}.json'.format(name), '{0}/{1}.control'.format(self.guest_dir, name))
+            self.logs.append('{0}/{1}.log'.format(self.host_dir, name))
+            startup.append('nohup {2}python {0}/speaker.py {0}/{1}.json > {0}/{1}.log 2>&1 &'.format(
+                self.guest_dir, name, 'taskset -c {0} '.format(c) if c else ''))
+
+        with open('{0}/addresses.batch'.format(self.host_dir), 'w') as f:
+            for p in peers:
+                f.write('address add {0} dev eth1\n'.format(p['local-address']))
+
+        filename = '{0}/start.sh'.format(self.host_dir)
+        with open(filename, 'w') as f:
+            f.write('\n'.join(startup) + '\n')
+        os.chmod(filename, 0777)
+        i = dckr.exec_create(container=self.name, cmd='{0}/start.sh'.format(self.guest_dir))
+        dckr.exec_start(i['Id'])
+        progress.update(self.name, len(groups), len(groups))
+
+    # stops the speakers and removes the peer addresses, e.g. before the peers change between the points of a sweep
+    def stop(self):
+        i = dckr.exec_create(container=self.name, cmd='bash -c "pkill -f speake[r].py; ip a flush dev eth1"')
+        dckr.exec_start(i['Id'])
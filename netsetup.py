@@ -0,0 +1,96 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Network setup of the benchmark bridge and the containers attached to it.
+#
+# Every thread keeps one netlink socket in the host namespace (ipr()), the
+# sockets are not shared between threads. The veth pair of a container is
+# created with its peer directly inside the network namespace of the
+# container (named eth1, with its MTU) and attached to the bridge in the
+# same pass, so no netns symlink, rename or move of the interface is needed;
+# entering the namespace is only necessary to bring eth1 up.
+# connect_ctns_to_br() does this for many containers at once and reports how
+# long the host side and the namespace side took.
+
+import time
+import threading
+from pyroute2 import IPRoute
+from nsenter import Namespace
+from settings import dckr
+
+MTU = 1446
+
+_local = threading.local()
+
+
+def ipr():  # netlink socket of the calling thread in the host namespace
+    if not hasattr(_local, 'ipr'):
+        _local.ipr = IPRoute()
+    return _local.ipr
+
+
+def create_br(brname):   # creates the bridge unless it exists and brings it up, returns its index
+    ip = ipr()
+    br = ip.link_lookup(ifname=brname)
+    if len(br) == 0:
+        ip.link('add', ifname=brname, kind='bridge', mtu=MTU)
+        br = ip.link_lookup(ifname=brname)
+    br = br[0]
+    ip.link('set', index=br, state='up', mtu=MTU)
+    return br
+
+
+def add_br_addr(brname, address):    # assign an address (CIDR notation) to the bridge, e.g. for monitors running in bgperf itself
+    br = create_br(brname)
+    ip = ipr()
+    addr, prefixlen = address.split('/')
+    if addr not in [a.get_attr('IFA_ADDRESS') for a in ip.get_addr(index=br)]:
+        ip.addr('add', index=br, address=addr, prefixlen=int(prefixlen))
+
+
+def ctn_pid(ctn):
+    pid = int(dckr.inspect_container(ctn)['State']['Pid'])
+    if pid == 0:
+        raise Exception('no container named {0}'.format(ctn))
+    return pid
+
+
+# connects every container in ctns to the bridge with a veth pair, host side named like the container
+def connect_ctns_to_br(ctns, brname):
+    start = time.time()
+    ip = ipr()
+    br = create_br(brname)
+    pids = [ctn_pid(ctn) for ctn in ctns]
+    for ctn, pid in zip(ctns, pids):
+        ifs = ip.link_lookup(ifname=ctn)
+        if len(ifs) > 0:    # left over from a removed container
+            ip.link('del', index=ifs[0])
+        ip.link('add', ifname=ctn, kind='veth', mtu=MTU, peer={'ifname': 'eth1', 'mtu': MTU, 'net_ns_pid': pid})
+        ip.link('set', index=ip.link_lookup(ifname=ctn)[0], master=br, state='up')
+    host = time.time()
+    for pid in pids:
+        with Namespace(pid, 'net'):
+            ns = IPRoute()
+            try:
+                ns.link('set', index=ns.link_lookup(ifname='eth1')[0], state='up')
+            finally:
+                ns.close()
+    end = time.time()
+    print 'connected {0} to bridge {1} in {2:.3f}s (host {3:.3f}s, namespaces {4:.3f}s)'.format(
+        ', '.join(ctns), brname, end - start, host - start, end - host)
+
+
+def connect_ctn_to_br(ctn, brname):
+    connect_ctns_to_br([ctn], brname)
@@ -0,0 +1,113 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Runs the setup steps of a benchmark concurrently on a pool of worker threads.
+#
+# Every step is a named function with the names of the steps it depends on,
+# it is started as soon as all of them have finished. The steps are mostly
+# waiting for docker and the kernel, so threads are good enough. If a step
+# fails no further steps are started and the first error is raised by run()
+# once the running steps have finished. The duration of every step is kept in
+# timings and printed at the end.
+
+import sys
+import time
+from threading import Thread, Lock, Condition
+
+
+class Pipeline(object):
+    def __init__(self, name='setup', workers=16):
+        self.name = name
+        self.workers = workers
+        self.steps = {}     # name -> (function, names of the steps it depends on)
+        self.order = []
+        self.timings = []   # (name, start, end) in seconds since run() was called
+
+    def add(self, name, func, after=()):
+        if name in self.steps:
+            raise ValueError('duplicate step {0}'.format(name))
+        self.steps[name] = (func, list(after))
+        self.order.append(name)
+
+    def __contains__(self, name):
+        return name in self.steps
+
+    def run(self):
+        for name in self.order:
+            for dep in self.steps[name][1]:
+                if dep not in self.steps:
+                    raise ValueError('step {0} depends on unknown step {1}'.format(name, dep))
+
+        start = time.time()
+        done = set()
+        started = set()
+        ready = []
+        running = [0]
+        errors = []
+        cond = Condition(Lock())
+
+        def schedule():     # called with cond held
+            for name in self.order:
+                if name not in started and all(dep in done for dep in self.steps[name][1]):
+                    started.add(name)
+                    ready.append(name)
+            cond.notify_all()
+
+        def worker():
+            while True:
+                with cond:
+                    while not ready and len(started) < len(self.order) and not errors:
+                        if running[0] == 0:     # nothing runs and nothing can start: a dependency cycle
+                            errors.append((ValueError, ValueError('dependency cycle in {0} steps {1}'.format(
+                                self.name, ', '.join(n for n in self.order if n not in started))), None))
+                            cond.notify_all()
+                            break
+                        cond.wait()
+                    if errors or not ready:
+                        return
+                    name = ready.pop(0)
+                    running[0] += 1
+                t = time.time()
+                try:
+                    self.steps[name][0]()
+                except Exception:
+                    with cond:
+                        errors.append(sys.exc_info())
+                with cond:
+                    running[0] -= 1
+                    self.timings.append((name, t - start, time.time() - start))
+                    if not errors:
+                        done.add(name)
+                        schedule()
+                    cond.notify_all()
+
+        with cond:
+            schedule()
+        threads = [Thread(target=worker) for i in range(min(self.workers, len(self.order)))]
+        for th in threads:
+            th.daemon = True
+            th.start()
+        for th in threads:
+            while th.is_alive():
+                th.join(1)  # join() without timeout would block Ctrl-C
+
+        self.report(time.time() - start)
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+
+    def report(self, total):
+        print '{0} took {1:.2f}s:'.format(self.name, total)
+        for name, start, end in sorted(self.timings, key=lambda t: t[1]):
+            print '  {0:<24} {1:>7.2f}s .. {2:>7.2f}s ({3:.2f}s)'.format(name, start, end, end - start)
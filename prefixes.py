@@ -0,0 +1,107 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compact description of prefix sets in scenario.yaml.
+#
+# Instead of listing every prefix, a peer (or a prefix match of a policy) can
+# describe its prefixes as ranges:
+#
+#   path-ranges:
+#   - {start: 100.0.0.0, count: 100000, prefix-len: 32, step: 1}
+#
+# start:      first prefix of the range
+# count:      number of prefixes in the range
+# prefix-len: length of every prefix in the range (default 32)
+# step:       address increment between two prefixes (default: size of one prefix)
+#
+# Ranges are only expanded on demand by the config writers that need the
+# individual routes. Explicit 'paths' lists are still supported and are
+# emitted before the ranges.
+
+import socket
+import struct
+
+
+def ip2int(addr):
+    return struct.unpack('!I', socket.inet_aton(addr))[0]
+
+
+def int2ip(value):
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+
+def path_range(start, count, prefix_len=32, step=None):
+    r = {'start': start, 'count': count, 'prefix-len': prefix_len}
+    if step is not None:
+        r['step'] = step
+    return r
+
+
+def range_step(r):
+    if 'step' in r and r['step']:
+        return int(r['step'])
+    return 1 << (32 - int(r['prefix-len'] if 'prefix-len' in r else 32))
+
+
+def iter_range(r):  # yields (address as integer, prefix length) tuples
+    length = int(r['prefix-len']) if 'prefix-len' in r else 32
+    start = ip2int(r['start'])
+    step = range_step(r)
+    for i in xrange(int(r['count'])):
+        yield (start + i * step, length)
+
+
+def iter_ranges(ranges):
+    for r in ranges:
+        for p in iter_range(r):
+            yield p
+
+
+def format_prefix(p):
+    return '{0}/{1}'.format(int2ip(p[0]), p[1])
+
+
+def parse_prefix(s):
+    addr, length = s.split('/') if '/' in s else (s, 32)
+    return (ip2int(addr), int(length))
+
+
+def peer_prefixes(peer):  # yields (address as integer, prefix length) for every path of a tester peer
+    for path in (peer['paths'] if 'paths' in peer and peer['paths'] else []):
+        yield parse_prefix(path)
+    for p in iter_ranges(peer['path-ranges'] if 'path-ranges' in peer and peer['path-ranges'] else []):
+        yield p
+
+
+def peer_paths(peer):   # yields every path of a tester peer in 'x.x.x.x/len' notation
+    for path in (peer['paths'] if 'paths' in peer and peer['paths'] else []):
+        yield path
+    for p in iter_ranges(peer['path-ranges'] if 'path-ranges' in peer and peer['path-ranges'] else []):
+        yield format_prefix(p)
+
+
+def count_paths(peer):
+    n = len(peer['paths']) if 'paths' in peer and peer['paths'] else 0
+    for r in (peer['path-ranges'] if 'path-ranges' in peer and peer['path-ranges'] else []):
+        n += int(r['count'])
+    return n
+
+
+def match_values(match):    # values of a policy match, prefix matches may use 'ranges' as well
+    for v in (match['value'] if 'value' in match and match['value'] else []):
+        yield v
+    if match['type'] == 'prefix' and 'ranges' in match:
+        for p in iter_ranges(match['ranges']):
+            yield format_prefix(p)
@@ -0,0 +1,140 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Sampling profiler of the target with perf, aligned with the benchmark timeline.
+#
+# Every profiling window (a time range of the benchmark or a script action)
+# runs its own "perf record -g" on the processes of the target container,
+# with the timestamps taken from CLOCK_MONOTONIC like monotonic() of bgperf.
+# At the end the samples of all windows are folded into one file of stacks
+# (the input format of flamegraph.pl) with two extra root frames: the label
+# of the window and the elapsed benchmark time of the sample, rounded down
+# to `resolution` seconds, e.g.
+#   churn (2);12.0;bird;main;io_loop;bgp_rx;bgp_decode_attrs 17
+# so flame graphs can be cut per phase (grep '^churn') or per time range and
+# lined up with the metrics CSV. The perf data files are kept for perf report.
+
+import os
+import signal
+import subprocess
+from distutils.spawn import find_executable
+from threading import Thread, Event, Lock
+from clock import monotonic, TimerQueue
+
+
+class ProfilerError(Exception):
+    pass
+
+
+def parse_windows(spec):    # "10-40,60-90" -> [(10.0, 40.0), (60.0, 90.0)] in seconds of the benchmark
+    windows = []
+    for window in spec.split(','):
+        begin, end = window.split('-')
+        windows.append((float(begin), float(end)))
+        if windows[-1][1] <= windows[-1][0]:
+            raise ValueError('empty profiling window {0}'.format(window))
+    return windows
+
+
+# folds the output of "perf script -F comm,tid,time,ip,sym": a header line per sample followed by its
+# stack (leaf first) on lines starting with a tab; yields (time, comm, frames root first)
+def fold_samples(lines):
+    header = None
+    frames = []
+    for line in lines:
+        if line.startswith('\t'):
+            fields = line.split(None, 1)
+            frames.append(fields[1].strip().rsplit('+0x', 1)[0] if len(fields) > 1 else '[unknown]')
+        elif line.strip():
+            header = line
+            frames = []
+        elif header is not None:
+            fields = header.split()
+            yield float(fields[-1].rstrip(':')), ' '.join(fields[:-2]), frames[::-1]
+            header = None
+    if header is not None:
+        fields = header.split()
+        yield float(fields[-1].rstrip(':')), ' '.join(fields[:-2]), frames[::-1]
+
+
+class Profiler(object):
+    # pids: function returning the pids of the processes of the target, start: monotonic() at the start of the benchmark
+    def __init__(self, pids, directory, name, start, frequency=99, resolution=1.0):
+        self.perf = find_executable('perf')
+        if self.perf is None:
+            raise ProfilerError('perf not found')
+        self.pids = pids
+        self.directory = directory
+        self.name = name
+        self.start = start
+        self.frequency = frequency
+        self.resolution = resolution
+        self.windows = []   # (label, data file, perf process)
+        self.lock = Lock()
+        self.timers = TimerQueue()
+        self.stop = Event()
+
+    def begin(self, label):     # starts a profiling window, returns its number
+        with self.lock:
+            n = len(self.windows)
+            data = '{0}/perf_{1}_{2}.data'.format(self.directory, self.name, n)
+            pids = ','.join(str(pid) for pid in self.pids())
+            with open(os.devnull, 'w') as null:
+                p = subprocess.Popen([self.perf, 'record', '-q', '-g', '-F', str(self.frequency), '-k', 'CLOCK_MONOTONIC',
+                                      '-p', pids, '-o', data], stdout=null, stderr=subprocess.STDOUT)
+            self.windows.append((label, data, p))
+        return n
+
+    def end(self, n):
+        label, data, p = self.windows[n]
+        if p.poll() is None:
+            p.send_signal(signal.SIGINT)    # perf writes the data file and exits
+            p.wait()
+
+    # profiles the time windows [(begin, end), ..] given in seconds of the benchmark
+    def schedule(self, windows):
+        for begin, end in windows:
+            label = '{0:g}-{1:g}s'.format(begin, end)
+            n = []
+            self.timers.add(max(0, self.start + begin - monotonic()), lambda label=label, n=n: n.append(self.begin(label)))
+            self.timers.add(max(0, self.start + end - monotonic()), lambda n=n: n and self.end(n[0]))
+        t = Thread(target=self.timers.run, args=(self.stop,))
+        t.daemon = True
+        t.start()
+
+    # ends all windows and folds their samples into profile_<name>.folded, returns its name
+    def close(self):
+        self.stop.set()
+        self.timers.clear()
+        for n in range(len(self.windows)):
+            self.end(n)
+        stacks = {}
+        for label, data, p in self.windows:
+            if p.returncode != 0 and not os.path.exists(data):
+                print 'profiling window {0} failed (perf exited with {1})'.format(label, p.returncode)
+                continue
+            with open(os.devnull, 'w') as null:
+                script = subprocess.Popen([self.perf, 'script', '-F', 'comm,tid,time,ip,sym', '-i', data],
+                                          stdout=subprocess.PIPE, stderr=null)
+                for t, comm, frames in fold_samples(script.stdout):
+                    elapsed = int((t - self.start) / self.resolution) * self.resolution
+                    stack = ';'.join([label, '{0:.1f}'.format(elapsed), comm] + frames)
+                    stacks[stack] = stacks.get(stack, 0) + 1
+                script.wait()
+        filename = '{0}/profile_{1}.folded'.format(self.directory, self.name)
+        with open(filename, 'w') as f:
+            for stack in sorted(stacks):
+                f.write('{0} {1}\n'.format(stack.replace(' ', '_'), stacks[stack]))
+        return filename
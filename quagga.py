@@ -14,6 +14,7 @@
 # limitations under the License.
 
 from base import *
+from prefixes import match_values
 
 class Quagga(Container):
     def __init__(self, name, host_dir, guest_dir='/root/config', image='bgperf/quagga'):
@@ -77,7 +78,7 @@ neighbor {0} timers 30 90
                     for i, match in enumerate(v['match']):
                         n = '{0}_match_{1}'.format(k, i)
                         if match['type'] == 'prefix':
-                            f.write(''.join('ip prefix-list {0} deny {1}\n'.format(n, p) for p in match['value']))
+                            f.write(''.join('ip prefix-list {0} deny {1}\n'.format(n, p) for p in match_values(match)))
                             f.write('ip prefix-list {0} permit any\n'.format(n))
                         elif match['type'] == 'as-path':
                             f.write(''.join('ip as-path access-list {0} deny _{1}_\n'.format(n, p) for p in match['value']))
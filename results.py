@@ -0,0 +1,202 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Key figures of a benchmark run, computed from its metrics file in a single
+# pass over the chunks (see metrics.py), statistics over repeated trials and
+# the comparison of result sets.
+
+from metrics import read_chunks, read_metrics
+
+SUMMARY_FIELDS = ['routes', 'convergence-time', 'elapsed', 'cpu-max', 'cpu-mean', 'cpu-seconds', 'mem-max', 'mem-end',
+                  'rss-max', 'rss-end', 'anon-end', 'file-end', 'kernel-end', 'mem-peak', 'bytes-per-route', 'bytes-per-path', 'samples']
+MEMORY_COLUMNS = ['mem_rss', 'mem_anon', 'mem_file', 'mem_kernel', 'mem_peak']
+
+
+# routes: maximum number of routes received by the monitor
+# convergence-time: elapsed time of the first sample with that number of routes
+# cpu-seconds: cpu time of the target, integrated over the samples
+# mem-*: usage including the page cache, rss-*, anon-*, file-*, kernel-*: its breakdown (see cgroup.py),
+# mem-peak: peak usage recorded by the kernel
+# bytes-per-route, bytes-per-path: growth of the anonymous memory of the target from the last sample
+# without routes (the idle daemon with its sessions up) to the end, per route received by the monitor
+# and per path announced to the target (paths, e.g. from announced_paths()); the page cache and kernel
+# buffers are left out, they depend on the host rather than the target
+def summarize(filename, paths=None):
+    s = dict((k, 0) for k in SUMMARY_FIELDS)
+    prev = 0.0
+    cpu_sum = 0.0
+    anon_idle = None
+    for chunk in read_chunks(filename):
+        n = len(chunk['elapsed'])
+        memory = [chunk[c] if c in chunk else [0] * n for c in MEMORY_COLUMNS]    # not in metrics files of older versions
+        for elapsed, cpu, mem, recvd, rss, anon, cache, kernel, peak in zip(chunk['elapsed'], chunk['cpu'], chunk['mem'], chunk['recvd'], *memory):
+            if recvd > s['routes']:
+                s['routes'] = recvd
+                s['convergence-time'] = elapsed
+            if anon and (recvd == 0 or anon_idle is None):
+                anon_idle = anon
+            s['cpu-max'] = max(s['cpu-max'], cpu)
+            s['cpu-seconds'] += (elapsed - prev) * cpu / 100.0
+            s['mem-max'] = max(s['mem-max'], mem)
+            s['mem-end'] = mem
+            s['rss-max'] = max(s['rss-max'], rss)
+            s['rss-end'] = rss
+            s['anon-end'] = anon
+            s['file-end'] = cache
+            s['kernel-end'] = kernel
+            s['mem-peak'] = max(s['mem-peak'], peak)
+            s['elapsed'] = elapsed
+            s['samples'] += 1
+            cpu_sum += cpu
+            prev = elapsed
+    s['cpu-mean'] = cpu_sum / s['samples'] if s['samples'] else 0
+    growth = s['anon-end'] - anon_idle if anon_idle is not None else 0
+    s['bytes-per-route'] = float(growth) / s['routes'] if s['routes'] else 0
+    s['bytes-per-path'] = float(growth) / paths if paths else 0
+    return s
+
+
+def write_table(filename, rows, columns):   # rows: list of dicts, written as CSV in the layout of the bench output
+    with open(filename, 'w') as f:
+        f.write(', '.join(columns) + '\n')
+        for row in rows:
+            f.write(', '.join('{0}'.format(row[c] if c in row else '') for c in columns) + '\n')
+
+
+def print_table(rows, columns):
+    widths = [max([len(c)] + [len('{0}'.format(row[c] if c in row else '')) for row in rows]) for c in columns]
+    print '  '.join(c.rjust(w) for c, w in zip(columns, widths))
+    for row in rows:
+        print '  '.join('{0}'.format(row[c] if c in row else '').rjust(w) for c, w in zip(columns, widths))
+
+
+# two-sided 95% quantiles of Student's t distribution by degrees of freedom, 1.96 (normal) above 30
+T95 = [None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+       2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+       2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+TRIAL_FIELDS = ['convergence-time', 'mem-max', 'cpu-max', 'bytes-per-route']
+
+
+def median(values):
+    s = sorted(values)
+    n = len(s)
+    if n == 0:
+        return 0
+    return s[n / 2] if n % 2 else (s[n / 2 - 1] + s[n / 2]) / 2.0
+
+
+def statistics(values):     # mean, sample standard deviation, median and 95% confidence interval of the mean
+    n = len(values)
+    mean = float(sum(values)) / n if n else 0
+    stdev = (sum((v - mean) ** 2 for v in values) / (n - 1)) ** 0.5 if n > 1 else 0
+    h = (T95[n - 1] if n - 1 < len(T95) else 1.96) * stdev / n ** 0.5 if n > 1 else 0
+    return {'n': n, 'mean': mean, 'stdev': stdev, 'median': median(values), 'ci95': [mean - h, mean + h]}
+
+
+# indices of outliers by their modified z-score (median absolute deviation), needs at least 3 values
+def outliers(values, threshold=3.5):
+    if len(values) < 3:
+        return set()
+    m = median(values)
+    mad = median([abs(v - m) for v in values])
+    if mad == 0:
+        return set()
+    return set(i for i, v in enumerate(values) if 0.6745 * abs(v - m) / mad > threshold)
+
+
+# statistics over the summaries of repeated trials, a trial that is an outlier in
+# any of the fields is excluded from the statistics of all fields
+def trial_statistics(summaries, fields=TRIAL_FIELDS):
+    excluded = set()
+    for field in fields:
+        excluded |= outliers([s[field] for s in summaries])
+    kept = [s for i, s in enumerate(summaries) if i not in excluded]
+    return sorted(excluded), dict((field, statistics([s[field] for s in kept])) for field in fields)
+
+
+# Comparison of result sets (bench -o CSV files or metrics files)
+
+COMPARE_METRICS = ['time-to-converge', 'route-rate', 'mem-peak', 'mem-steady', 'cpu-seconds']
+HIGHER_IS_BETTER = set(['route-rate'])
+
+
+def load_results(filename):     # columns of a CSV written by bench or of a metrics file as dict of lists
+    if filename.endswith('.bin'):
+        return dict((name, list(values)) for name, values in read_metrics(filename).items())
+    columns = {}
+    with open(filename) as f:
+        names = [n.strip() for n in f.readline().split(',')]
+        for name in names:
+            columns[name] = []
+        for line in f:
+            for name, value in zip(names, line.split(',')):
+                try:
+                    columns[name].append(float(value))
+                except ValueError:  # e.g. the time of day
+                    columns[name].append(value.strip())
+    return columns
+
+
+# time-to-converge: elapsed time until the maximum number of routes was first received
+# route-rate: routes per second until then, mem-steady: median memory after convergence
+def result_metrics(columns):
+    elapsed, recvd, cpu, mem = columns['elapsed'], columns['recvd'], columns['cpu'], columns['mem']
+    routes = max(recvd) if recvd else 0
+    i = recvd.index(routes) if recvd else 0
+    ttc = elapsed[i] if elapsed else 0
+    cpu_seconds = sum((elapsed[j] - (elapsed[j - 1] if j > 0 else 0)) * cpu[j] / 100.0 for j in range(len(elapsed)))
+    return {'routes': routes, 'time-to-converge': ttc, 'route-rate': routes / ttc if ttc > 0 else 0,
+            'mem-peak': max(mem) if mem else 0, 'mem-steady': median(mem[i:]) if mem else 0, 'cpu-seconds': cpu_seconds}
+
+
+def align_routes(columns, fractions):  # elapsed time at which each fraction of the final routes was reached
+    routes = max(columns['recvd']) if columns['recvd'] else 0
+    aligned = []
+    for fraction in fractions:
+        aligned.append(next((e for e, r in zip(columns['elapsed'], columns['recvd']) if r >= fraction * routes), None))
+    return aligned
+
+
+def interpolate(xs, ys, x):  # linear interpolation of the samples ys at x, xs ascending
+    if not xs or x < xs[0] or x > xs[-1]:
+        return None
+    for j in range(1, len(xs)):
+        if xs[j] >= x:
+            if xs[j] == xs[j - 1]:
+                return ys[j]
+            return ys[j - 1] + (ys[j] - ys[j - 1]) * (x - xs[j - 1]) / (xs[j] - xs[j - 1])
+    return ys[0]
+
+
+def align_time(columns, times, name='recvd'):   # value of a column at common elapsed times
+    return [interpolate(columns['elapsed'], columns[name], t) for t in times]
+
+
+def relative_change(baseline, value):   # in percent of the baseline
+    if baseline == 0:
+        return 0.0 if value == 0 else float('inf')
+    return (value - baseline) * 100.0 / baseline
+
+
+def regressions(baseline, metrics, thresholds):   # metrics that got worse than their threshold (percent)
+    worse = []
+    for name in COMPARE_METRICS:
+        change = relative_change(baseline[name], metrics[name])
+        if name in HIGHER_IS_BETTER:
+            change = -change
+        if change > thresholds[name]:
+            worse.append(name)
+    return worse
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+#
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Native BGP speaker used by the 'native' tester implementation (see nativetester.py).
+#
+# One process holds the BGP sessions of all tester peers in a single poll()
+# loop. Every peer sends a stream of UPDATE messages that was encoded in
+# advance by bgperf (many NLRI per message) and is memory mapped from the
+# tester's UpdateCache, so the speaker does no route processing at all while
+# the benchmark runs.
+#
+# Routes can be withdrawn and announced again and sessions torn down through the
+# control FIFO of the config with ExaBGP API text commands (see control.py), e.g.
+# by the churn and flap_peers actions.
+#
+# usage: speaker.py CONFIG_FILE (JSON written by NativeTester)
+
+import os
+import sys
+import json
+import time
+import mmap
+import errno
+import select
+import socket
+import struct
+from itertools import groupby
+from bgp import *
+
+IDLE, CONNECT, OPENSENT, OPENCONFIRM, ESTABLISHED = range(5)
+
+CONNECT_RETRY = 5
+SEND_CHUNK = 1 << 16
+
+
+def log(*args):
+    print ' '.join(str(a) for a in args)
+    sys.stdout.flush()
+
+
+def parse_prefix(s):    # 'x.x.x.x/len' -> (address as integer, prefix length)
+    addr, length = s.split('/') if '/' in s else (s, 32)
+    return struct.unpack('!I', socket.inet_aton(addr))[0], int(length)
+
+
+class Session(object):
+    def __init__(self, speaker, peer, hold_time):
+        self.speaker = speaker
+        self.router_id = peer['router-id']
+        self.asn = int(peer['as'])
+        self.local_address = peer['local-address']
+        self.neighbor = peer['neighbor']
+        self.port = int(peer['port']) if 'port' in peer else 179
+        self.hold_time = hold_time
+        self.attrs = encode_attributes(self.asn, self.local_address)
+        with open(peer['updates'], 'rb') as f:   # memory map the pre-encoded UPDATE stream
+            self.updates = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else ''
+        self.sock = None
+        self.state = IDLE
+        self.reader = None
+        self.control = []   # queued control messages (OPEN, KEEPALIVE, ...)
+        self.pending = None # buffer of the chunk currently being written
+        self.pending_end = None # position in self.updates after the pending chunk, None for control messages
+        self.offset = 0     # position in self.updates
+        self.done = False
+        self.next_connect = 0
+        self.next_keepalive = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.bind((self.local_address, 0))
+        err = self.sock.connect_ex((self.neighbor, self.port))
+        if err not in (0, errno.EINPROGRESS):
+            self.close('connect failed: {0}'.format(os.strerror(err)))
+            return
+        self.state = CONNECT
+        self.reader = MessageReader()
+        self.control = []
+        self.pending = None
+        self.offset = 0
+        self.done = False
+        self.speaker.register(self)
+
+    def close(self, reason):
+        if self.sock:
+            self.speaker.unregister(self)
+            self.sock.close()
+            self.sock = None
+        if self.state != IDLE:
+            log('closed', self.router_id, reason)
+        self.state = IDLE
+        self.next_connect = time.time() + CONNECT_RETRY
+
+    def wants_write(self):
+        return self.state == CONNECT or self.pending is not None or len(self.control) > 0 or \
+            (self.state == ESTABLISHED and self.offset < len(self.updates))
+
+    def next_chunk(self):   # the next chunk to write, always ending on a message boundary
+        self.pending_end = None
+        if self.control:
+            return buffer(self.control.pop(0))
+        if self.state != ESTABLISHED or self.offset >= len(self.updates):
+            return None
+        start = end = self.offset
+        while end < len(self.updates) and end - start < SEND_CHUNK:
+            end += struct.unpack_from('!H', self.updates, end + 16)[0]
+        self.offset = end
+        self.pending_end = end
+        return buffer(self.updates, start, end - start)
+
+    def on_writable(self):
+        if self.state == CONNECT:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                self.close('connect failed: {0}'.format(os.strerror(err)))
+                return
+            self.control.append(encode_open(self.asn, self.router_id, self.hold_time))
+            self.state = OPENSENT
+        while True:
+            if self.pending is None:
+                self.pending = self.next_chunk()
+                if self.pending is None:
+                    break
+            try:
+                n = self.sock.send(self.pending)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                self.close(str(e))
+                return
+            self.pending = buffer(self.pending, n) if n < len(self.pending) else None
+            if self.pending is not None:
+                return
+            if self.pending_end is not None:    # send timestamps, used by bgperf to compute per-prefix latencies
+                log('sent', self.router_id, self.pending_end, '{0:.6f}'.format(time.time()))
+            if self.state == ESTABLISHED and self.offset >= len(self.updates) and not self.done:
+                self.done = True
+                log('done', self.router_id, '{0:.6f}'.format(time.time()))
+
+    def on_readable(self):
+        try:
+            data = self.sock.recv(SEND_CHUNK)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.close(str(e))
+            return
+        if not data:
+            self.close('connection closed by peer')
+            return
+        for typ, body in self.reader.feed(data):
+            if typ == OPEN:
+                hold_time = decode_open(body)['hold-time']
+                self.hold_time = min(self.hold_time, hold_time) if hold_time else 0
+                self.control.append(encode_keepalive())
+                self.state = OPENCONFIRM
+            elif typ == KEEPALIVE and self.state == OPENCONFIRM:
+                self.state = ESTABLISHED
+                log('established', self.router_id, '{0:.6f}'.format(time.time()))
+            elif typ == NOTIFICATION:
+                code, subcode = struct.unpack_from('!BB', body, 0)
+                self.close('notification {0}/{1}'.format(code, subcode))
+                return
+        if self.sock:
+            self.speaker.modify(self)
+
+    # commands: list of (withdraw, prefix) from the control channel, sent in order
+    # after the queued control messages, dropped unless the session is established
+    def churn(self, commands):
+        if self.state != ESTABLISHED:
+            return
+        for withdraw, group in groupby(commands, lambda c: c[0]):
+            prefixes = [p for w, p in group]
+            for msg, n in (pack_withdrawals(prefixes) if withdraw else pack_updates(prefixes, self.attrs)):
+                self.control.append(msg)
+
+    def teardown(self, subcode):   # Cease NOTIFICATION, connects again after CONNECT_RETRY
+        if self.state == ESTABLISHED:
+            try:
+                self.sock.send(encode_notification(6, subcode))
+            except socket.error:
+                pass
+        self.close('teardown')
+
+    def on_timer(self, now):
+        if self.state == IDLE and now >= self.next_connect:
+            self.connect()
+        elif self.state == ESTABLISHED and self.hold_time and now >= self.next_keepalive:
+            self.control.append(encode_keepalive())
+            self.next_keepalive = now + self.hold_time / 3.0
+            self.speaker.modify(self)
+
+
+class Speaker(object):
+    def __init__(self, conf):
+        hold_time = int(conf['hold-time']) if 'hold-time' in conf else 90
+        self.sessions = [Session(self, p, hold_time) for p in conf['peers']]
+        self.poll = select.poll()
+        self.fds = {}
+        self.by_address = dict((s.local_address, s) for s in self.sessions)
+        self.control = None
+        self.control_buf = ''
+        if 'control' in conf and conf['control']:   # read-write, so the FIFO is not hung up when a writer closes it
+            self.control = os.open(conf['control'], os.O_RDWR | os.O_NONBLOCK)
+            self.poll.register(self.control, select.POLLIN)
+
+    def register(self, s):
+        self.fds[s.fileno()] = s
+        self.poll.register(s.fileno(), select.POLLIN | select.POLLOUT)
+
+    def unregister(self, s):
+        fd = s.fileno()
+        if fd in self.fds:
+            self.poll.unregister(fd)
+            del self.fds[fd]
+
+    def modify(self, s):
+        self.poll.modify(s.fileno(), select.POLLIN | (select.POLLOUT if s.wants_write() else 0))
+
+    # neighbor <target> local-ip <address> announce|withdraw route <prefix> [next-hop <address>]
+    # neighbor <target> local-ip <address> teardown <subcode>
+    def on_control(self):
+        try:
+            data = os.read(self.control, SEND_CHUNK)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        lines = (self.control_buf + data).split('\n')
+        self.control_buf = lines.pop()
+        commands = {}
+        for line in lines:
+            words = line.split()
+            try:
+                s = self.by_address[words[words.index('local-ip') + 1]]
+                if 'teardown' in words:
+                    s.teardown(int(words[words.index('teardown') + 1]) if words[-1] != 'teardown' else 2)
+                else:
+                    commands.setdefault(s, []).append(('withdraw' in words, parse_prefix(words[words.index('route') + 1])))
+            except (ValueError, IndexError, KeyError, socket.error):
+                log('bad control command:', line)
+        for s, c in commands.items():
+            s.churn(c)
+            if s.sock:
+                self.modify(s)
+
+    def run(self):
+        log('speaker started with', len(self.sessions), 'peers')
+        next_timer = 0
+        while True:
+            for fd, event in self.poll.poll(100):
+                if fd == self.control:
+                    self.on_control()
+                    continue
+                s = self.fds.get(fd)
+                if s is None:
+                    continue
+                if event & (select.POLLIN | select.POLLHUP | select.POLLERR):
+                    s.on_readable()
+                if s.sock and event & select.POLLOUT:
+                    s.on_writable()
+                if s.sock:
+                    self.modify(s)
+            now = time.time()
+            if now >= next_timer:
+                for s in self.sessions:
+                    s.on_timer(now)
+                next_timer = now + 0.1
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1]) as f:
+        conf = json.load(f)
+    Speaker(conf).run()
@@ -14,27 +14,132 @@
 # limitations under the License.
 
 from exabgp import ExaBGP
+from prefixes import peer_paths, ip2int
+from base import parse_cpuset, ctn_exists
+from netsetup import connect_ctns_to_br
+from updatecache import UpdateCache, cache_key
 import os
+from threading import Lock
+from control import make_control
+from pipeline import Pipeline
 from  settings import dckr
 
 def rm_line():
     print '\x1b[1A\x1b[2K\x1b[1D\x1b[1A'
 
 
-class Tester(ExaBGP):
-    def __init__(self, name, host_dir):
-        super(Tester, self).__init__(name, host_dir)
+def shard_peers(peers, n):  # spread peers round-robin over n shards
+    shards = [[] for i in range(n)]
+    for i, p in enumerate(sorted(peers, key=lambda p: ip2int(p['router-id']))):
+        shards[i % n].append(p)
+    return shards
 
-    def run(self, conf, brname=''):
-        super(Tester, self).run(brname)
 
-        startup = ['''#!/bin/bash
-ulimit -n 65536''']
+def shard_cpus(cpus, n):    # split a cpuset string into n cpuset strings, cpus are shared if there are fewer than n
+    if not cpus:
+        return [''] * n
+    l = parse_cpuset(cpus)
+    if len(l) < n:
+        return [str(l[i % len(l)]) for i in range(n)]
+    return [','.join(str(c) for c in l[i * len(l) / n:(i + 1) * len(l) / n]) for i in range(n)]
 
-        peers = conf['tester']['peers'].values()
 
-        for p in peers:
-            with open('{0}/{1}.conf'.format(self.host_dir, p['router-id']), 'w') as f:
+class BootProgress(object):
+    # prints the boot progress of all tester shards on a single line
+    def __init__(self, names):
+        self.names = names
+        self.shards = {}
+        self.printed = False
+        self.lock = Lock()
+
+    def update(self, name, done, total):
+        with self.lock:
+            self.shards[name] = (done, total)
+            if self.printed:
+                rm_line()
+            self.printed = True
+            if len(self.names) == 1:
+                print 'tester booting.. ({0}/{1})'.format(done, total)
+            else:
+                print 'tester booting.. {0}'.format(', '.join('{0} ({1}/{2})'.format(n, *self.shards[n]) for n in self.names if n in self.shards))
+
+
+# The testers of a scenario with the keyword arguments of their start(). The peers
+# are spread over conf['tester']['shards'] shards, every shard is either a tester
+# container of its own ('container' mode) or a multi-neighbor process inside one
+# tester container ('process' mode). Every shard gets its own part of the tester cpuset.
+def tester_shards(cls, conf, config_dir, cpus=''):
+    shards = int(conf['tester']['shards']) if 'shards' in conf['tester'] and conf['tester']['shards'] else 1
+    mode = conf['tester']['shard-mode'] if 'shard-mode' in conf['tester'] and conf['tester']['shard-mode'] else 'container'
+
+    if shards <= 1 or mode == 'process':
+        return [(cls('tester', config_dir + '/tester'), {'cpus': cpus, 'processes': shards if shards > 1 else 0})]
+
+    names = ['tester-{0}'.format(i) for i in range(shards)]
+    progress = BootProgress(names)
+    return [(cls(name, '{0}/{1}'.format(config_dir, name)), {'cpus': c, 'peers': peers, 'progress': progress})
+            for name, peers, c in zip(names, shard_peers(conf['tester']['peers'].values(), shards), shard_cpus(cpus, shards))]
+
+
+# Adds the steps booting the testers of a scenario to a Pipeline and returns the testers.
+# Per tester: <name>-container (created and started after the steps in containers_after),
+# <name>-config (routes written to the cache, independent of the container) and
+# <name>-daemons (after both and the steps in daemons_after). The new containers are
+# connected to the bridge together in one tester-network step (see netsetup.py).
+# With restart, already running tester containers are kept and only their daemons
+# are restarted from their cache (bench --repeat).
+def tester_steps(pipeline, cls, conf, config_dir, brname='', cpus='', restart=False, containers_after=(), daemons_after=()):
+    testers = []
+    created = []
+    for t, kwargs in tester_shards(cls, conf, config_dir, cpus):
+        if not (restart and ctn_exists(t.name)):
+            def container(t=t, cpus=kwargs['cpus']):
+                t.create(cpus=cpus)
+                t.launch()
+            pipeline.add('{0}-container'.format(t.name), container, after=containers_after)
+            created.append(t.name)
+        testers.append((t, kwargs))
+
+    network = []
+    if created and brname != '':
+        pipeline.add('tester-network', lambda: connect_ctns_to_br(created, brname),
+                     after=['{0}-container'.format(name) for name in created])
+        network = ['tester-network']
+
+    for t, kwargs in testers:
+        after = list(daemons_after) + network + ['{0}-config'.format(t.name)]
+        if t.name in created:
+            after.append('{0}-container'.format(t.name))
+        peers = kwargs['peers'] if 'peers' in kwargs else None
+        processes = kwargs['processes'] if 'processes' in kwargs else 0
+        pipeline.add('{0}-config'.format(t.name), lambda t=t, peers=peers, processes=processes: t.prepare(conf, peers, processes))
+        pipeline.add('{0}-daemons'.format(t.name), lambda t=t, kwargs=kwargs: t.start(conf, **kwargs), after=after)
+    return [t for t, kwargs in testers]
+
+
+# Starts the testers of a scenario, see tester_steps()
+def run_testers(cls, conf, config_dir, brname='', cpus='', restart=False):
+    pipeline = Pipeline('tester startup')
+    testers = tester_steps(pipeline, cls, conf, config_dir, brname, cpus, restart)
+    pipeline.run()
+    return testers
+
+
+class Tester(ExaBGP):
+    def __init__(self, name, host_dir):
+        super(Tester, self).__init__(name, host_dir)
+        self.cache = None
+        self.controls = []
+
+    # one ExaBGP config with every peer in peers as neighbor, control: name of the control channel
+    def write_config(self, conf, peers, filename, control):
+        with open(filename, 'w') as f:
+            f.write('''process control {{
+    run {0}/{1}.sh;
+    encoder text;
+}}
+'''.format(self.guest_dir, control))
+            for p in peers:
                 local_address = p['local-address'].split('/')[0]
                 config = '''neighbor {0} {{
     peer-as {1};
@@ -45,17 +150,85 @@ ulimit -n 65536''']
 '''.format(conf['target']['local-address'].split('/')[0], conf['target']['as'],
                p['router-id'], local_address, p['as'])
                 f.write(config)
-                for path in p['paths']:
+                for path in peer_paths(p):
                     f.write('      route {0} next-hop {1};\n'.format(path, local_address))
                 f.write('''   }
-}''')
-            startup.append('''env exabgp.log.destination={0}/{1}.log \
+    api {
+        processes [ control ];
+    }
+}
+''')
+
+    def run(self, conf, brname='', cpus='', peers=None, processes=0, progress=None):
+        super(Tester, self).run(brname, cpus=cpus)
+        self.start(conf, cpus, peers, processes, progress)
+
+    # writes the configs of peers unless they are cached, can run before the container exists
+    def prepare(self, conf, peers=None, processes=0):
+        peers = conf['tester']['peers'].values() if peers is None else peers
+        key = cache_key(conf, peers) + ('-{0}'.format(processes) if processes else '') + '-api'   # configs with control process
+        if self.cache and self.cache.key == key and self.cache.complete():
+            return self.cache
+        cache = UpdateCache(self.host_dir, key)
+        self.cache = cache
+        if cache.complete():
+            print 'reusing cached tester configs ({0})'.format(cache.key)
+            return cache
+        cache.prepare()
+        if processes > 0:
+            for i, group in enumerate(shard_peers(peers, processes)):
+                self.write_config(conf, group, cache.path('exabgp-{0}.conf'.format(i)), 'exabgp-{0}'.format(i))
+        else:
+            for p in peers:
+                self.write_config(conf, [p], cache.path('{0}.conf'.format(p['router-id'])), p['router-id'])
+        cache.commit()
+        return cache
+
+    # (re-)starts the ExaBGP daemons in the running container, the generated
+    # configs are cached and only written again if the tester section changed
+    # peers: the peers of this tester, all peers of the scenario by default
+    # processes: number of multi-neighbor ExaBGP processes, 0 starts one process per peer
+    def start(self, conf, cpus='', peers=None, processes=0, progress=None):
+        peers = conf['tester']['peers'].values() if peers is None else peers
+        progress = progress if progress else BootProgress([self.name])
+
+        cache = self.prepare(conf, peers, processes)
+        neighbor = conf['target']['local-address'].split('/')[0]
+        if processes > 0:
+            groups = [('exabgp-{0}'.format(i), group) for i, group in enumerate(shard_peers(peers, processes))]
+        else:
+            groups = [(p['router-id'], [p]) for p in peers]
+        self.controls = []
+        for name, group in groups:  # the API process of every daemon reads its control FIFO, again after every writer
+            filename = '{0}/{1}.sh'.format(self.host_dir, name)
+            with open(filename, 'w') as f:
+                f.write('#!/bin/bash\nwhile true; do cat {0}/{1}.control; done\n'.format(self.guest_dir, name))
+            os.chmod(filename, 0777)
+            self.controls.append((make_control(self.host_dir, name), neighbor, group))
+
+        startup = ['''#!/bin/bash
+ulimit -n 65536
+pkill exabgp''']
+
+        if processes > 0:
+            for i, c in enumerate(shard_cpus(cpus, processes)):
+                name = 'exabgp-{0}'.format(i)
+                startup.append('''env exabgp.log.destination={0}/{1}.log \
+exabgp.daemon.daemonize=true \
+exabgp.daemon.user=root \
+{2}exabgp {3}'''.format(self.guest_dir, name, 'taskset -c {0} '.format(c) if c else '',
+                         cache.guest_path(self.guest_dir, '{0}.conf'.format(name))))
+            total = processes
+        else:
+            for p in peers:
+                startup.append('''env exabgp.log.destination={0}/{1}.log \
 exabgp.daemon.daemonize=true \
 exabgp.daemon.user=root \
-exabgp {0}/{1}.conf'''.format(self.guest_dir, p['router-id']))
+exabgp {2}'''.format(self.guest_dir, p['router-id'], cache.guest_path(self.guest_dir, '{0}.conf'.format(p['router-id']))))
+            total = len(peers)
 
         for p in peers:
-            startup.append('ip a add {0} dev eth1'.format(p['local-address']))
+            startup.append('ip a replace {0} dev eth1'.format(p['local-address']))
 
         filename = '{0}/start.sh'.format(self.host_dir)
         with open(filename, 'w') as f:
@@ -67,6 +240,9 @@ exabgp {0}/{1}.conf'''.format(self.guest_dir, p['router-id']))
                 for line in lines.strip().split('\n'):
                     cnt += 1
                     if cnt % 2 == 1:
-                        if cnt > 1:
-                            rm_line()
-                        print 'tester booting.. ({0}/{1})'.format(cnt/2 + 1, len(conf['tester']['peers']))
+                        progress.update(self.name, cnt/2 + 1, total)
+
+    # stops the ExaBGP daemons and removes the peer addresses, e.g. before the peers change between the points of a sweep
+    def stop(self):
+        i = dckr.exec_create(container=self.name, cmd='bash -c "pkill exabgp; ip a flush dev eth1"')
+        dckr.exec_start(i['Id'])
@@ -0,0 +1,104 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# BMPCollector fed with a BMP capture through replay().
+
+import os
+import sys
+import socket
+import struct
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bgp import encode_open, encode_update, encode_attributes, encode_prefix, encode_notification
+from bmp import BMPCollector, BMPReader, INITIATION, PEER_UP, ROUTE_MONITORING, PEER_DOWN, TERMINATION
+from prefixes import ip2int
+
+
+def bmp_message(typ, body):
+    return struct.pack('!BIB', 3, 6 + len(body), typ) + body
+
+
+def peer_header(address, asn, post_policy=False):
+    return struct.pack('!BB8s', 0, 0x40 if post_policy else 0, '') + '\x00' * 12 + socket.inet_aton(address) + \
+        struct.pack('!I4sII', asn, socket.inet_aton(address), 1500000000, 0)
+
+
+def peer_up(address, asn):
+    return bmp_message(PEER_UP, peer_header(address, asn) + '\x00' * 12 + socket.inet_aton('10.10.0.1') +
+                       struct.pack('!HH', 179, 40000) + encode_open(1000, '10.10.0.1') + encode_open(asn, address))
+
+
+def route_monitoring(address, asn, announced=(), withdrawn=()):
+    nlri = ''.join(encode_prefix((ip2int(p.split('/')[0]), int(p.split('/')[1]))) for p in announced)
+    wd = ''.join(encode_prefix((ip2int(p.split('/')[0]), int(p.split('/')[1]))) for p in withdrawn)
+    update = encode_update(withdrawn=wd, attrs=encode_attributes(asn, address) if nlri else '', nlri=nlri)
+    return bmp_message(ROUTE_MONITORING, peer_header(address, asn) + update)
+
+
+def peer_down(address, asn):
+    return bmp_message(PEER_DOWN, peer_header(address, asn) + struct.pack('!B', 1) + encode_notification(6, 2))
+
+
+CAPTURE = ''.join([
+    bmp_message(INITIATION, struct.pack('!HH', 2, 4) + 'bird'),
+    peer_up('10.10.0.3', 1003),
+    peer_up('10.10.0.4', 1004),
+    route_monitoring('10.10.0.3', 1003, ['100.0.0.0/24', '100.0.1.0/24', '100.0.2.0/24']),
+    route_monitoring('10.10.0.4', 1004, ['100.0.3.0/24', '100.0.4.0/24']),
+    route_monitoring('10.10.0.3', 1003, ['100.0.1.0/24'], withdrawn=['100.0.0.0/24']),  # announced again: no change
+    peer_down('10.10.0.4', 1004),
+    bmp_message(TERMINATION, struct.pack('!HH', 1, 2) + '\x00\x00'),
+])
+
+
+class BMPTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dump = os.path.join(self.tmp, 'bmp.dump')
+        with open(self.dump, 'wb') as f:
+            f.write(CAPTURE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_replay(self):
+        c = BMPCollector('bmp', self.tmp)
+        c.replay(self.dump)
+        state = c.sample()['state']
+        self.assertEqual(state['neighbors'], {'10.10.0.3': 2, '10.10.0.4': 0})
+        self.assertEqual(state['adj-table'], {'accepted': 2, 'received': 6, 'withdrawn': 1})
+        self.assertEqual(state['updates'], 3)
+        self.assertEqual(c.up, set(['10.10.0.3']))
+        self.assertEqual(state['neighbors-up'], 1)
+
+    def test_split_reads(self):     # messages arriving in pieces, as on the socket
+        reader = BMPReader()
+        messages = []
+        for i in range(0, len(CAPTURE), 7):
+            messages += reader.feed(CAPTURE[i:i + 7])
+        self.assertEqual([typ for typ, msg in messages],
+                         [INITIATION, PEER_UP, PEER_UP, ROUTE_MONITORING, ROUTE_MONITORING, ROUTE_MONITORING, PEER_DOWN, TERMINATION])
+        self.assertEqual(''.join(msg for typ, msg in messages), CAPTURE)
+
+    def test_bad_version(self):
+        self.assertRaises(ValueError, BMPReader().feed, '\x02' + CAPTURE[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
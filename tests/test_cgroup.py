@@ -0,0 +1,138 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# CgroupSampler against fake cgroup v1 and v2 trees in a temporary directory.
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cgroup import CgroupSampler, CgroupError, USER_HZ, memory_breakdown
+
+PID = 4242
+
+
+class CgroupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, 'cgroup')
+        self.proc = os.path.join(self.tmp, 'proc')
+        os.makedirs(os.path.join(self.proc, str(PID)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, path, data):
+        path = os.path.join(self.tmp, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def v1(self, usage=0, user=0, system=0, mem=0):
+        self.write('proc/{0}/cgroup'.format(PID), '5:memory:/docker/x\n4:cpu,cpuacct:/docker/x\n1:name=systemd:/docker/x\n')
+        self.write('cgroup/cpu,cpuacct/docker/x/cpuacct.usage', '{0}\n'.format(usage))
+        self.write('cgroup/cpu,cpuacct/docker/x/cpuacct.stat', 'user {0}\nsystem {1}\n'.format(user, system))
+        self.write('cgroup/cpu,cpuacct/docker/x/cgroup.procs', '{0}\n4243\n'.format(PID))
+        self.write('cgroup/memory/docker/x/memory.usage_in_bytes', '{0}\n'.format(mem))
+        self.write('cgroup/memory/docker/x/memory.stat', 'cache 300\nrss 100\nmapped_file 10\n'
+                   'total_cache 3000\ntotal_rss 1000\ntotal_mapped_file 100\n')
+
+    def v2(self, usage=0, user=0, system=0, mem=0):
+        self.write('proc/{0}/cgroup'.format(PID), '0::/docker/x\n')
+        self.write('cgroup/cgroup.controllers', 'cpu memory\n')
+        self.write('cgroup/docker/x/cpu.stat', 'usage_usec {0}\nuser_usec {1}\nsystem_usec {2}\nnr_periods 0\n'.format(usage, user, system))
+        self.write('cgroup/docker/x/memory.current', '{0}\n'.format(mem))
+        self.write('cgroup/docker/x/cgroup.procs', '{0}\n'.format(PID))
+        # longer than a page, like memory.stat of recent kernels
+        self.write('cgroup/docker/x/memory.stat', 'anon 1000\nfile 3000\nfile_mapped 200\nkernel_stack 10\npagetables 20\n'
+                   'slab_reclaimable 5\nslab_unreclaimable 7\nsock 8\n' + ''.join('pad_{0} 0\n'.format(i) for i in range(500)))
+
+    def test_v1(self):
+        self.v1(usage=10 ** 9, user=USER_HZ, system=USER_HZ / 2, mem=5000)
+        sampler = CgroupSampler(PID, root=self.root, proc=self.proc)
+        self.assertEqual(sampler.version, 1)
+        s = sampler.sample()
+        self.assertEqual((s['cpu'], s['user'], s['system'], s['mem']), (10 ** 9, 10 ** 9, 10 ** 9 / 2, 5000))
+        self.assertEqual(s['memory'], {'anon': 1000, 'file': 3000, 'rss': 1100, 'kernel': 0, 'peak': 5000})
+        self.assertEqual(sampler.pids(), [PID, 4243])
+        sampler.close()
+
+    def test_v1_kernel_and_peak(self):
+        self.v1(mem=5000)
+        self.write('cgroup/memory/docker/x/memory.max_usage_in_bytes', '8000\n')
+        self.write('cgroup/memory/docker/x/memory.kmem.usage_in_bytes', '700\n')
+        sampler = CgroupSampler(PID, root=self.root, proc=self.proc)
+        s = sampler.sample()
+        self.assertEqual((s['memory']['kernel'], s['memory']['peak']), (700, 8000))
+        sampler.close()
+
+    def test_v2(self):
+        self.v2(usage=2000000, user=1500000, system=500000, mem=6000)
+        sampler = CgroupSampler(PID, root=self.root, proc=self.proc)
+        self.assertEqual(sampler.version, 2)
+        s = sampler.sample()
+        self.assertEqual((s['cpu'], s['user'], s['system'], s['mem']), (2 * 10 ** 9, 15 * 10 ** 8, 5 * 10 ** 8, 6000))
+        self.assertEqual(s['memory'], {'anon': 1000, 'file': 3000, 'rss': 1200, 'kernel': 50, 'peak': 6000})
+        self.assertEqual(sampler.pids(), [PID])
+        sampler.close()
+
+    def test_v2_peak(self):
+        self.v2(mem=6000)
+        sampler = CgroupSampler(PID, root=self.root, proc=self.proc)
+        self.write('cgroup/docker/x/memory.current', '7000\n')   # the files are reread, not reopened
+        self.assertEqual(sampler.sample()['memory']['peak'], 7000)
+        self.write('cgroup/docker/x/memory.current', '1000\n')
+        self.assertEqual(sampler.sample()['memory']['peak'], 7000)    # maximum of the samples without memory.peak
+        sampler.close()
+        self.write('cgroup/docker/x/memory.peak', '9000\n')
+        sampler = CgroupSampler(PID, root=self.root, proc=self.proc)
+        self.assertEqual(sampler.sample()['memory']['peak'], 9000)
+        sampler.close()
+
+    def test_delta(self):
+        self.v2(usage=0, user=0, system=0)
+        sampler = CgroupSampler(PID, root=self.root, proc=self.proc)
+        prev = sampler.sample()
+        self.write('cgroup/docker/x/cpu.stat', 'usage_usec 500000\nuser_usec 400000\nsystem_usec 100000\n')
+        cur = sampler.sample()
+        sampler.close()
+        cur['time'] = prev['time'] + 1.0
+        d = CgroupSampler.delta(prev, cur)
+        self.assertAlmostEqual(d['cpu'], 50.0)
+        self.assertAlmostEqual(d['user'], 40.0)
+        self.assertAlmostEqual(d['system'], 10.0)
+        cur['time'] = prev['time']
+        self.assertEqual(CgroupSampler.delta(prev, cur), {'cpu': 0.0, 'user': 0.0, 'system': 0.0})
+
+    def test_memory_breakdown(self):
+        self.assertEqual(memory_breakdown({'anon': 10, 'file': 20, 'file_mapped': 5, 'kernel': 7, 'kernel_stack': 1}),
+                         {'anon': 10, 'file': 20, 'rss': 15, 'kernel': 7})
+        self.assertEqual(memory_breakdown({'anon': 10, 'slab': 3, 'sock': 2}), {'anon': 10, 'file': 0, 'rss': 10, 'kernel': 5})
+        self.assertEqual(memory_breakdown({'rss': 10, 'cache': 20, 'mapped_file': 5}, 4), {'anon': 10, 'file': 20, 'rss': 15, 'kernel': 4})
+        self.assertEqual(memory_breakdown({}), {'anon': 0, 'file': 0, 'rss': 0, 'kernel': 0})
+
+    def test_errors(self):
+        self.assertRaises(CgroupError, CgroupSampler, PID, root=self.root, proc=self.proc)    # no /proc/<pid>/cgroup
+        self.write('proc/{0}/cgroup'.format(PID), '4:cpu,cpuacct:/docker/x\n')
+        self.assertRaises(CgroupError, CgroupSampler, PID, root=self.root, proc=self.proc)    # no memory controller
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Speaker sessions with a BGP listener on the loopback interface.
+
+import os
+import sys
+import socket
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bgp import OPEN, UPDATE, KEEPALIVE, MessageReader, encode_open, encode_keepalive, encode_attributes, pack_updates, decode_update, decode_open
+from speaker import Speaker
+
+PREFIXES = 5000     # per peer, 5 UPDATE messages of up to 4096 bytes
+
+
+class Peer(Thread):   # the target side of one session: reads in small pieces, so messages are split across reads
+    def __init__(self, conn, expected):
+        Thread.__init__(self)
+        self.daemon = True
+        self.conn = conn
+        self.expected = expected
+        self.open = None
+        self.keepalive = False
+        self.updates = 0
+        self.prefixes = set()
+
+    def run(self):
+        reader = MessageReader()
+        while len(self.prefixes) < self.expected:
+            data = self.conn.recv(1000)
+            if not data:
+                break
+            for typ, body in reader.feed(data):
+                if typ == OPEN:
+                    self.open = decode_open(body)
+                    self.conn.sendall(encode_open(1000, '127.0.0.1') + encode_keepalive())
+                elif typ == KEEPALIVE:
+                    self.keepalive = True
+                elif typ == UPDATE:
+                    withdrawn, attrs, nlri = decode_update(body)
+                    self.updates += 1
+                    self.prefixes.update(nlri)
+        self.conn.close()
+
+
+class SpeakerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(4)
+        self.listener.settimeout(10)
+
+    def tearDown(self):
+        self.listener.close()
+        shutil.rmtree(self.tmp)
+
+    def peer(self, n, asn):
+        address = '127.0.0.{0}'.format(n + 2)
+        updates = os.path.join(self.tmp, '{0}.updates'.format(address))
+        prefixes = [((100 << 24) + ((n * PREFIXES + i) << 8), 24) for i in range(PREFIXES)]
+        with open(updates, 'wb') as f:
+            for msg, count in pack_updates(prefixes, encode_attributes(asn, address)):
+                f.write(msg)
+        return {'router-id': address, 'as': asn, 'local-address': address, 'neighbor': '127.0.0.1',
+                'port': self.listener.getsockname()[1], 'updates': updates}
+
+    def test_sessions(self):
+        conf = {'hold-time': 90, 'peers': [self.peer(0, 1003), self.peer(1, 1004)]}
+        speaker = Thread(target=Speaker(conf).run)
+        speaker.daemon = True
+        speaker.start()
+
+        peers = {}
+        for i in range(2):
+            conn, addr = self.listener.accept()
+            conn.settimeout(10)
+            peers[addr[0]] = Peer(conn, PREFIXES)
+            peers[addr[0]].start()
+        for p in peers.values():
+            p.join(15)
+
+        self.assertEqual(sorted(peers), ['127.0.0.2', '127.0.0.3'])
+        for n, address in enumerate(sorted(peers)):
+            p = peers[address]
+            self.assertEqual(p.open['as'], 1003 + n)
+            self.assertEqual(p.open['router-id'], address)
+            self.assertTrue(p.keepalive)
+            self.assertEqual(len(p.prefixes), PREFIXES)
+            self.assertTrue(p.updates > 1)
+            self.assertEqual(min(p.prefixes), ((100 << 24) + ((n * PREFIXES) << 8), 24))
+
+
+if __name__ == '__main__':
+    unittest.main()
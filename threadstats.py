@@ -0,0 +1,106 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per-thread cpu usage of the processes of a container, from /proc.
+#
+# The threads are looked up from /proc/<pid>/task of the processes pids()
+# returns (e.g. CgroupSampler.pids) only every `rescan` seconds, their stat
+# and schedstat files are kept open and every sample is a seek and read of
+# each. The thread name, user and system time (clock ticks) are taken from
+# stat; the total cpu time from the run time in schedstat (ns) if the kernel
+# provides it, as at 10 Hz the clock ticks only resolve 10% of a cpu.
+# Threads that have exited are dropped on the next read.
+
+import os
+import errno
+from clock import monotonic
+from cgroup import USER_HZ, read_fd
+
+GONE = (errno.ENOENT, errno.ESRCH)
+
+
+def parse_stat(data):   # name, utime and stime (ticks) of /proc/<pid>/task/<tid>/stat, the name may contain ' ' and ')'
+    end = data.rindex(')')
+    fields = data[end + 2:].split(None, 13)
+    return data[data.index('(') + 1:end], int(fields[11]), int(fields[12])
+
+
+class ThreadSampler(object):
+    def __init__(self, pids, proc='/proc', rescan=1.0):
+        self.pids = pids
+        self.proc = proc
+        self.rescan = rescan
+        self.threads = {}   # tid -> (pid, stat fd, schedstat fd or None)
+        self.scanned = None
+        self.prev = {}      # tid -> (time, cpu, user, system) in ns of the previous sample
+
+    def scan(self):
+        for pid in self.pids():
+            try:
+                tids = os.listdir('{0}/{1}/task'.format(self.proc, pid))
+            except OSError:     # exited meanwhile
+                continue
+            for tid in tids:
+                tid = int(tid)
+                if tid in self.threads:
+                    continue
+                task = '{0}/{1}/task/{2}'.format(self.proc, pid, tid)
+                try:
+                    stat = os.open(task + '/stat', os.O_RDONLY)
+                except OSError:
+                    continue
+                try:
+                    schedstat = os.open(task + '/schedstat', os.O_RDONLY)
+                except OSError:
+                    schedstat = None
+                self.threads[tid] = (pid, stat, schedstat)
+        self.scanned = monotonic()
+
+    def drop(self, tid):
+        pid, stat, schedstat = self.threads.pop(tid)
+        os.close(stat)
+        if schedstat is not None:
+            os.close(schedstat)
+        self.prev.pop(tid, None)
+
+    def close(self):
+        for tid in self.threads.keys():
+            self.drop(tid)
+
+    # cpu usage of every thread since the previous sample in percent of one cpu:
+    # list of (pid, tid, name, cpu, user, system), threads seen for the first time are left out
+    def sample(self):
+        if self.scanned is None or monotonic() - self.scanned >= self.rescan:
+            self.scan()
+        threads = []
+        for tid, (pid, stat, schedstat) in self.threads.items():
+            try:
+                t = monotonic()
+                name, utime, stime = parse_stat(read_fd(stat))
+                user = utime * 1000000000 / USER_HZ
+                system = stime * 1000000000 / USER_HZ
+                cpu = int(read_fd(schedstat).split(None, 1)[0]) if schedstat is not None else user + system
+            except (OSError, IOError) as e:
+                if e.errno not in GONE:
+                    raise
+                self.drop(tid)
+                continue
+            if tid in self.prev:
+                pt, pcpu, puser, psystem = self.prev[tid]
+                dt = (t - pt) * 1e7     # ns per percent
+                if dt > 0:
+                    threads.append((pid, tid, name, (cpu - pcpu) / dt, (user - puser) / dt, (system - psystem) / dt))
+            self.prev[tid] = (t, cpu, user, system)
+        return threads
@@ -0,0 +1,63 @@
+# Copyright (C) 2017 DE-CIX Management GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# On-disk cache of the per-peer files a tester generates from the scenario
+# (pre-encoded UPDATE streams of the native tester, ExaBGP configs).
+#
+# The cache lives in <tester host_dir>/cache/<key>, where key is a hash of
+# everything the files are generated from. A cache directory is only used
+# once it has been marked complete, so an interrupted run never leaves a
+# partial cache behind. Older keys are removed when a new cache is committed.
+
+import os
+import json
+import shutil
+import hashlib
+
+
+def cache_key(conf, peers):
+    source = {
+        'target': {'as': conf['target']['as'], 'local-address': conf['target']['local-address']},
+        'peers': sorted(peers, key=lambda p: p['router-id']),
+    }
+    return hashlib.sha1(json.dumps(source, sort_keys=True)).hexdigest()
+
+
+class UpdateCache(object):
+    def __init__(self, host_dir, key):
+        self.root = '{0}/cache'.format(host_dir)
+        self.key = key
+        self.dir = '{0}/{1}'.format(self.root, key)
+
+    def path(self, name):
+        return '{0}/{1}'.format(self.dir, name)
+
+    def guest_path(self, guest_dir, name):  # path of a cached file as seen inside the container
+        return '{0}/cache/{1}/{2}'.format(guest_dir, self.key, name)
+
+    def complete(self):
+        return os.path.exists(self.path('complete'))
+
+    def prepare(self):  # start (re-)generating the cache from scratch
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir)
+        os.makedirs(self.dir)
+
+    def commit(self):
+        with open(self.path('complete'), 'w') as f:
+            f.write(self.key)
+        for key in os.listdir(self.root):
+            if key != self.key:
+                shutil.rmtree('{0}/{1}'.format(self.root, key), ignore_errors=True)